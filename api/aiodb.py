@@ -0,0 +1,84 @@
+"""
+aiodb.py
+
+Contains the database access of the read endpoints of the API.
+
+The handlers are `async def`, and flask runs each of them in its own event loop on its
+request thread (flask[async]). Their queries are awaited through `Database.fetch`, which
+runs them on the psycopg2 connection pool of the API: a request keeps its thread while it
+waits on the database, gunicorn threads are what lets requests overlap (see
+gunicorn.conf.py). Queries run often can be sent as server-side prepared statements, see
+repositories.py.
+"""
+
+import re
+import weakref
+import threading
+import itertools
+from psycopg2.errors import DuplicatePreparedStatement, FeatureNotSupported
+
+# psycopg2 connection -> names of the statements prepared on it
+_prepared = weakref.WeakKeyDictionary()
+_prepared_lock = threading.Lock()
+
+
+def numbered_placeholders(query):
+    """
+    Turns the %s placeholders of a query into the $1, $2, ... placeholders of PREPARE.
+    """
+    numbers = itertools.count(1)
+    return re.sub(r"%s", lambda _: f"${next(numbers)}", query)
+
+
+class Database:  # pylint: disable=too-few-public-methods
+    """
+    Runs the read queries on the psycopg2 connection pool of the API.
+    """
+
+    def __init__(self, pool):
+        """
+        :param pool: db.ConnectionPool
+        """
+        self.pool = pool
+
+    @staticmethod
+    def _execute_prepared(conn, cur, name, query, params):
+        """
+        Executes a prepared statement, preparing it first if the connection has not yet.
+        """
+        with _prepared_lock:
+            prepared = _prepared.setdefault(conn, set())
+        if name not in prepared:
+            try:
+                cur.execute(f"PREPARE {name} AS {numbered_placeholders(query)}")
+            except DuplicatePreparedStatement:
+                conn.rollback()
+            prepared.add(name)
+        try:
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        except FeatureNotSupported:
+            # A migration changed the type of a column, the statement has to be prepared
+            # again ("cached plan must not change result type")
+            conn.rollback()
+            cur.execute(f"DEALLOCATE {name}")
+            cur.execute(f"PREPARE {name} AS {numbered_placeholders(query)}")
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+
+    async def fetch(self, query, params=None, prepare=None):
+        """
+        Runs a query and returns its rows.
+
+        :param query: SQL query with %s placeholders
+        :param params: Parameters of the query
+        :param prepare: Name to run the query as a server-side prepared statement with
+        :return: (list of row tuples, description of the cursor)
+        :raises psycopg2.Error: If the query fails
+        """
+        # Borrow a connection from the pool
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                if prepare is None:
+                    cur.execute(query, params)
+                else:
+                    self._execute_prepared(conn, cur, prepare, query, params)
+                return cur.fetchall(), cur.description
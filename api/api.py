@@ -9,30 +9,113 @@ These functions take in JSON data and return JSON data.
 
 API Endpoints:
 / - Root endpoint of the API
-/projects - GET all project data stored in the database
+/projects - GET all project data stored in the database (with issue statistics)
 /projects - POST (create) project
 /projects/{id} - GET project data by ID
 /projects/{id} - PUT (update) project data by ID
 /projects/{id} - DELETE project data by ID
-/projects/{id}/issues - GET all issues by project ID
+/projects/{id}/export - GET a project and its issues as a CSV or NDJSON file
+/projects/export - GET every project and its issues as a CSV or NDJSON file
+/projects/{id}/issues - GET all issues by project ID (paginated or streamed)
 /projects/{id}/issues - POST (create) issues by project ID
-/issues - GET all issues' data stored in the database
+/projects/{id}/issues/bulk - POST (create) many issues by project ID in one transaction
+/issues - GET all issues' data stored in the database (paginated or streamed)
+/issues - PATCH (update) many issues selected by ID or filter at once
 /issues/{id} - GET issue by issue ID
 /issues/{id} - PUT (update) issue by issue ID
 /issues/{id} - DELETE issue by issue ID
+/search - GET issues matching a full-text search, ranked and paginated
+/events - GET the changes of the projects and issues as they happen (Server-Sent Events)
+/sync - GET the changes of the projects and issues since a revision, for client side copies
 /reset - DELETE all data in the database
+/pool - GET usage statistics of the database connection pool
+/cache - GET usage statistics of the read cache
+/metrics - GET the metrics of the API in the Prometheus text format
+
+Read endpoints return an ETag and answer 304 Not Modified to a matching If-None-Match header.
 """
 
 # TODO: add status, priority, and type field validation
 # TODO: check if project_id and issue_id are valid
 import os
 import psycopg2
-from flask import Flask, jsonify, request
-from datetime import datetime as dt
-
+from flask import Flask, Response, jsonify, request
+from datetime import datetime as dt, timezone
+from db import ConnectionPool
+from dbtypes import parse_columns
+from migrations import migrate_on_startup
+from pagination import parse_page_args
+from filters import ISSUE_SORTS, parse_issue_filters
+from search import parse_search_args, parse_search_scope
+from sync import PROJECT, ISSUE, fetch_changes, parse_sync_args
+from events import (
+    EVENTS_STREAM_SECONDS,
+    ChangeFeed,
+    format_event,
+    parse_event_args,
+)
+from streaming import get_stream_format, stream_response
+from export import export_response, parse_export_args
+from stats import fetch_project_stats, wants_stats
+from etags import add_etag, conditional_get
+from cache import create_cache, cached_response, cache_response
+from serialize import FastJSONProvider
+from profiling import profile_requests
+from timing import configure_instrumented_connection, record_pool_wait, time_requests
+from metrics import (
+    measure_requests,
+    metrics_enabled,
+    record_horizon_lag,
+    render_metrics,
+)
+from aiodb import Database
+from repositories import ProjectRepository, IssueRepository
+from bulk import (
+    BulkError,
+    read_rows,
+    validate_issues,
+    insert_issues,
+    parse_issue_selection,
+    parse_issue_patch,
+)
 
 POSTGRES_URL = os.environ["POSTGRES_URL"]
 app = Flask(__name__)
+# Encode the responses with orjson when it is installed, see serialize.py
+app.json = FastJSONProvider(app)
+# Profile the requests that ask for it, before the other hooks run, see profiling.py
+profile_requests(app)
+# Tag the read responses for conditional GETs, see etags.py
+app.after_request(add_etag)
+# Time the requests and log their slow statements, see timing.py
+time_requests(app)
+# Measure the requests for /metrics, see metrics.py
+measure_requests(app)
+
+# Connections are shared by every handler of this process, see db.py
+pool = ConnectionPool(
+    POSTGRES_URL,
+    minconn=int(os.environ.get("POSTGRES_POOL_MIN", "1")),
+    maxconn=int(os.environ.get("POSTGRES_POOL_MAX", "10")),
+    timeout=float(os.environ.get("POSTGRES_POOL_TIMEOUT", "10")),
+    check_after=float(os.environ.get("POSTGRES_POOL_CHECK_AFTER", "30")),
+    # Time the statements and checkouts of the requests, see timing.py
+    configure=configure_instrumented_connection,
+    on_checkout=record_pool_wait,
+)
+
+# Database access of the read endpoints, see aiodb.py
+db = Database(pool)
+
+# Queries of the projects and issues tables, see repositories.py
+projects = ProjectRepository()
+issues = IssueRepository()
+
+# Optional cache of the read responses, see cache.py
+read_cache = create_cache(POSTGRES_URL)
+
+# Shared listener of the change events, see events.py
+change_feed = ChangeFeed(POSTGRES_URL, pool)
 
 
 @app.route("/")
@@ -47,6 +130,64 @@ def root():
     return jsonify({"message": "Trackify API says hello!"}), 200
 
 
+@app.route("/pool", methods=["GET"])
+def get_pool_stats():
+    """
+    GET usage statistics of the database connection pool of this API process.
+
+    Returns a JSON response with the number of connections in use and idle, the pool limits,
+    and checkout counters including the time spent waiting for a connection (in seconds).
+
+    :return: JSON response with the pool statistics
+    """
+    return jsonify({"message": pool.stats()}), 200
+
+
+@app.route("/cache", methods=["GET"])
+def get_cache_stats():
+    """
+    GET usage statistics of the read cache of this API process.
+
+    Returns a JSON response with the cache configuration, its number of entries, and the
+    hit, miss, eviction, expiration and invalidation counters.
+
+    :return: JSON response with the cache statistics
+    """
+    return jsonify({"message": read_cache.stats()}), 200
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """
+    GET the metrics of the API, added up over every API process, for Prometheus.
+
+    Returns the request counts, latencies, response sizes, database time and pool waits by
+    route, and the revision horizon lag of the database, in the Prometheus text format, see
+    metrics.py.
+
+    :return: Response with the metrics, or JSON response with an error message
+    """
+    if not metrics_enabled():
+        return (
+            jsonify(
+                {"message": "Metrics are disabled, prometheus_client is not installed"}
+            ),
+            501,
+        )
+    try:
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT row_revisions_horizon_lag()")
+                record_horizon_lag(cur.fetchone()[0])
+    except psycopg2.Error as e:
+        return (
+            jsonify({"message": f"A connection or other issue occured: {str(e)}"}),
+            500,
+        )
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+
 @app.route("/reset", methods=["DELETE"])
 async def delete_everything():
     """
@@ -58,27 +199,27 @@ async def delete_everything():
     :return: JSON response with a message
     """
     try:
-        # Attempt to connect to the database
-        conn = psycopg2.connect(POSTGRES_URL)
-        cur = conn.cursor()
-        # Attempt operation
-        try:
-            cur.execute("DELETE FROM issues")
-            conn.commit()
-            cur.execute("DELETE FROM projects")
-            conn.commit()
-            cur.close()
-            conn.close()
-            return jsonify({"message": "Data deleted successfully"}), 204
-        except psycopg2.Error as e:
-            return (
-                jsonify(
-                    {
-                        "message": f"An error occurred while trying to delete the data: {str(e)}"
-                    }
-                ),
-                500,
-            )
+        # Borrow a connection from the pool
+        with pool.connection() as conn:
+            cur = conn.cursor()
+            # Attempt operation
+            try:
+                # Empties the tables at once instead of row by row, and restarts the ids
+                cur.execute(
+                    "TRUNCATE issues, projects, project_issue_stats RESTART IDENTITY"
+                )
+                read_cache.commit(conn)
+                cur.close()
+                return jsonify({"message": "Data deleted successfully"}), 204
+            except psycopg2.Error as e:
+                return (
+                    jsonify(
+                        {
+                            "message": f"An error occurred while trying to delete the data: {str(e)}"
+                        }
+                    ),
+                    500,
+                )
 
     # If database has connection or other error
     except psycopg2.Error as e:
@@ -93,37 +234,63 @@ async def get_all_projects():
     """
     GET all projects from the database.
 
+    Results are paginated by id, see pagination.py. The response holds one page of
+    projects and the cursor of the next page (null on the last page).
+
     Returns a JSON response with a status code of 200 if the operation is successful,
+    or a status code of 400 with an error message if the pagination arguments are invalid,
     or a status code of 500 with an error message if the operation fails.
 
-    :return: JSON response with a list of projects
+    :param limit: Page size, or 'all' for every project
+    :param after: Cursor of the page to get
+    :param stats: 1 to add the issue statistics of every project, see stats.py
+    :param fields: Comma separated columns to return, see repositories.py
+    :return: JSON response with a list of projects and the next cursor
     """
+    # Get the pagination and field arguments
+    try:
+        page = parse_page_args(request.args)
+        fields = projects.parse_fields(request.args)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
     try:
-        # Attempt to connect to the database
-        conn = psycopg2.connect(POSTGRES_URL)
-        cur = conn.cursor()
-        # Attempt operation
+        # Answer from the read cache when possible, see cache.py
+        token = read_cache.token()
+        cached = cached_response(read_cache)
+        if cached is not None:
+            return cached
+        # Answer 304 Not Modified if the client has the current data, see etags.py
+        # The statistics depend on the issues, and on the time for the overdue counts
+        with_stats = wants_stats(request.args)
+        not_modified = await conditional_get(
+            db,
+            tables=("projects", "issues") if with_stats else ("projects",),
+            volatile=with_stats,
+        )
+        if not_modified is not None:
+            return not_modified
+        # Attempt operation, on the read database access, see aiodb.py
         try:
-            cur.execute("SELECT * FROM projects")
-            rows = cur.fetchall()
-            cur.close()
-            conn.close()
-            # format the rows so that they in the form of a dict
-            formatted_rows = [
-                {
-                    "id": row[0],
-                    "name": row[1],
-                    "description": row[2],
-                    "status": row[3],
-                    "priority": row[4],
-                    "date_created": row[5],
-                    "date_started": row[6],
-                    "date_closed": row[7],
-                    "labels": row[8],
-                }
-                for row in rows
-            ]
-            return jsonify({"message": formatted_rows}), 200
+            formatted_rows, next_cursor = await projects.page(db, [], [], page, fields)
+            # Add the issue statistics of the whole page at once, see stats.py
+            if with_stats:
+                stats = await fetch_project_stats(
+                    db, [formatted_row["id"] for formatted_row in formatted_rows]
+                )
+                for formatted_row in formatted_rows:
+                    formatted_row["stats"] = stats[formatted_row["id"]]
+            payload = {
+                "message": projects.trim(formatted_rows, fields),
+                "next_cursor": next_cursor,
+            }
+            cache_response(
+                read_cache,
+                payload,
+                ["projects", "issues"] if with_stats else ["projects"],
+                token,
+            )
+            return jsonify(payload), 200
         except psycopg2.Error as e:
             return (
                 jsonify(
@@ -155,78 +322,78 @@ async def create_project():
     :param description: The description of the project to be added
     :return: JSON response with a message
     """
-    try:
-        # Attempt to connect to the database
-        conn = psycopg2.connect(POSTGRES_URL)
-        cur = conn.cursor()
+    # Get the project data
+    request_json = request.get_json(silent=True)
+    if request_json is None:
+        return (
+            jsonify({"message": f"Could not parse json data: {request.data}"}),
+            415,
+        )
 
-        # Get the project data
-        request_json = request.get_json(silent=True)
-        if request_json is None:
-            return (
-                jsonify({"message": f"Could not parse json data: {request.data}"}),
-                415,
-            )
+    # Validate the data provided
+    if "name" not in request_json or "status" not in request_json:
+        return (
+            jsonify(
+                {
+                    "message": "Invalid request. Please fill out required fields of name and status"
+                }
+            ),
+            400,
+        )
 
-        # Validate the data provided
-        if "name" not in request_json or "status" not in request_json:
-            return (
-                jsonify(
-                    {
-                        "message": "Invalid request. Please fill out required fields of name and status"
-                    }
-                ),
-                400,
-            )
+    # Initialize variables
+    data = {
+        "name": request_json["name"],
+        "status": request_json["status"],
+        "description": request_json.get("description"),
+        "priority": request_json.get("priority"),
+        "date_created": dt.now(timezone.utc),
+        "date_started": request_json.get("date_started"),
+        "date_closed": request_json.get("date_closed"),
+        "labels": request_json.get("labels"),
+    }
+
+    # Validate the dates and labels
+    try:
+        parse_columns(data)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
 
-        # Initialize variables
-        data = {
-            "name": request_json["name"],
-            "status": request_json["status"],
-            "description": request_json.get("description"),
-            "priority": request_json.get("priority"),
-            "date_created": str(dt.now()),
-            "date_started": request_json.get("date_started"),
-            "date_closed": request_json.get("date_closed"),
-            "labels": request_json.get("labels"),
-        }
-
-        # Attempt operation
-        try:
-            # add method to see if project already exists
-            cur.execute(
-                "INSERT INTO projects (name, status, description, priority, date_created, date_started, date_closed, labels) \
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING *",
-                list(data.values()),
-            )
-            conn.commit()
-            row_delta = cur.rowcount
-            cur.close()
-            conn.close()
-
-            # Validate if the operation was successful
-            if row_delta == 1:
-                return jsonify({"message": "Data added successfully"}), 201
-            elif row_delta > 1:
-                return jsonify({"message": "Multiple rows added unexpectedly"}), 500
-            else:
-                return jsonify({"message": "Data was not added successfully"}), 500
-        except psycopg2.Error as e:
-            return (
-                jsonify(
-                    {
-                        "message": f"An issue occurred when trying to add the project: {str(e)}"
-                    }
-                ),
-                500,
-            )
+    try:
+        # Borrow a connection from the pool
+        with pool.connection() as conn:
+            cur = conn.cursor()
+
+            # Attempt operation
+            try:
+                # add method to see if project already exists
+                row_delta = projects.insert(cur, data)
+                read_cache.commit(conn, "projects")
+                cur.close()
+
+                # Validate if the operation was successful
+                if row_delta == 1:
+                    return jsonify({"message": "Data added successfully"}), 201
+                elif row_delta > 1:
+                    return jsonify({"message": "Multiple rows added unexpectedly"}), 500
+                else:
+                    return jsonify({"message": "Data was not added successfully"}), 500
+            except psycopg2.Error as e:
+                return (
+                    jsonify(
+                        {
+                            "message": f"An issue occurred when trying to add the project: {str(e)}"
+                        }
+                    ),
+                    500,
+                )
 
     # If database has connection or other error
     except psycopg2.Error as e:
         return jsonify({"message": str(e)}), 500
 
 
-@app.route("/projects/<project_id>", methods=["GET"])
+@app.route("/projects/<int:project_id>", methods=["GET"])
 async def get_project_by_id(project_id):
     """
     GET a project from the database by ID.
@@ -236,32 +403,44 @@ async def get_project_by_id(project_id):
     or a status code of 500 with an error message if the operation fails.
 
     :param id: ID of the project to be retrieved
+    :param stats: 1 to add the issue statistics of the project, see stats.py
+    :param fields: Comma separated columns to return, see repositories.py
     :return: JSON response with a project
     """
+    # Get the field arguments
     try:
-        # Attempt to connect to the database
-        conn = psycopg2.connect(POSTGRES_URL)
-        cur = conn.cursor()
+        fields = projects.parse_fields(request.args)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
 
-        # Attempt operation
+    try:
+        # Answer from the read cache when possible, see cache.py
+        token = read_cache.token()
+        cached = cached_response(read_cache)
+        if cached is not None:
+            return cached
+        # Answer 304 Not Modified if the client has the current data, see etags.py
+        not_modified = await conditional_get(
+            db, project_id=project_id, volatile=wants_stats(request.args)
+        )
+        if not_modified is not None:
+            return not_modified
+        # Attempt operation, on the read database access, see aiodb.py
         try:
-            cur.execute("SELECT * FROM projects WHERE id = %s", (project_id,))
-            row = cur.fetchone()
-            cur.close()
-            conn.close()
-            if row:
-                formatted_row = {
-                    "id": row[0],
-                    "name": row[1],
-                    "description": row[2],
-                    "status": row[3],
-                    "priority": row[4],
-                    "date_created": row[5],
-                    "date_started": row[6],
-                    "date_closed": row[7],
-                    "labels": row[8],
-                }
-                return jsonify({"message": formatted_row}), 200
+            formatted_row = await projects.get(db, project_id, fields)
+            if formatted_row:
+                if wants_stats(request.args):
+                    stats = await fetch_project_stats(db, [formatted_row["id"]])
+                    formatted_row["stats"] = stats[formatted_row["id"]]
+                payload = {"message": projects.trim([formatted_row], fields)[0]}
+                cache_response(
+                    read_cache,
+                    payload,
+                    [f"project:{project_id}"]
+                    + (["issues"] if wants_stats(request.args) else []),
+                    token,
+                )
+                return jsonify(payload), 200
             else:
                 return jsonify({"message": "Project not found"}), 404
         except psycopg2.Error as e:
@@ -280,7 +459,77 @@ async def get_project_by_id(project_id):
         )
 
 
-@app.route("/projects/<project_id>", methods=["PUT"])
+@app.route("/projects/export", methods=["GET"])
+async def export_all_projects():
+    """
+    GET every project and its issues as a CSV or NDJSON file, see export.py.
+
+    Returns the file with a status code of 200 if the operation is successful,
+    or a status code of 400 with an error message if the export arguments are invalid,
+    or a status code of 500 with an error message if the operation fails.
+
+    :param format: csv or ndjson
+    :param gzip: 1 to compress the file with gzip
+    :return: Streamed file, one line per issue
+    """
+    # Get the export arguments
+    try:
+        export_format, compress = parse_export_args(request.args)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    # Attempt operation
+    try:
+        return export_response(pool, export_format, compress)
+    except psycopg2.Error as e:
+        return (
+            jsonify(
+                {
+                    "message": f"An error occurred while trying to export the projects: {str(e)}"
+                }
+            ),
+            500,
+        )
+
+
+@app.route("/projects/<int:project_id>/export", methods=["GET"])
+async def export_project_by_id(project_id):
+    """
+    GET a project and its issues as a CSV or NDJSON file, see export.py.
+
+    Returns the file with a status code of 200 if the operation is successful,
+    or a status code of 400 with an error message if the export arguments are invalid,
+    or a status code of 404 with an error message if the project does not exist,
+    or a status code of 500 with an error message if the operation fails.
+
+    :param project_id: ID of the project to be exported
+    :param format: csv or ndjson
+    :param gzip: 1 to compress the file with gzip
+    :return: Streamed file, one line per issue
+    """
+    # Get the export arguments
+    try:
+        export_format, compress = parse_export_args(request.args)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    # Attempt operation
+    try:
+        if await projects.get(db, project_id, fields=("id",)) is None:
+            return jsonify({"message": "Project not found"}), 404
+        return export_response(pool, export_format, compress, project_id)
+    except psycopg2.Error as e:
+        return (
+            jsonify(
+                {
+                    "message": f"An error occurred while trying to export the project: {str(e)}"
+                }
+            ),
+            500,
+        )
+
+
+@app.route("/projects/<int:project_id>", methods=["PUT"])
 async def update_project_by_id(project_id):
     """
     Update a project in the database.
@@ -292,73 +541,74 @@ async def update_project_by_id(project_id):
     :param value: new value of the project
     :return: JSON response with a message
     """
-    try:
-        # Attempt to connect to the database
-        conn = psycopg2.connect(POSTGRES_URL)
-        cur = conn.cursor()
+    # Get the updated project
+    request_json = request.get_json(silent=True)
+    if request_json is None:
+        return (
+            jsonify({"message": f"Could not parse json data: {request.data}"}),
+            415,
+        )
 
-        # Get the updated project
-        request_json = request.get_json(silent=True)
-        if request_json is None:
-            return (
-                jsonify({"message": f"Could not parse json data: {request.data}"}),
-                415,
-            )
+    # Initialize variables
+    data = {
+        "name": request_json.get("name"),
+        "description": request_json.get("description"),
+        "status": request_json.get("status"),
+        "priority": request_json.get("priority"),
+        "date_started": request_json.get("date_started"),
+        "date_closed": request_json.get("date_closed"),
+        "labels": request_json.get("labels"),
+    }
+
+    # Validate the dates and labels
+    try:
+        parse_columns(data)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
 
-        # Initialize variables
-        data = {
-            "name": request_json.get("name"),
-            "description": request_json.get("description"),
-            "status": request_json.get("status"),
-            "priority": request_json.get("priority"),
-            "date_started": request_json.get("date_started"),
-            "date_closed": request_json.get("date_closed"),
-            "labels": request_json.get("labels"),
-        }
-
-        # Attempt operation
-        try:
-            # Update specified parts
-            updates = []
-            args = []
-            for field, value in data.items():
-                if value is not None:
-                    updates.append(f"{field} = %s")
-                    args.append(value)
-            args.append(project_id)
-            if updates:
-                query = f"UPDATE projects SET {', '.join(updates)} WHERE id = %s"
-                cur.execute(query, args)
-            conn.commit()
-            row_delta = cur.rowcount
-            cur.close()
-            conn.close()
-
-            # Validate if the operation was successful
-            if row_delta == 1:
-                return jsonify({"message": "Data updated successfully"}), 200
-            elif row_delta > 1:
-                return jsonify({"message": "Multiple rows updated unexpectedly"}), 500
-            elif row_delta == 0:
-                return jsonify({"message": "Nothing was updated/ Not Found"}), 404
-            else:
-                return jsonify({"message": "Data was not updated successfully"}), 500
-        except psycopg2.Error as e:
-            return (
-                jsonify(
-                    {
-                        "message": f"An issue occurred when trying to update the project: {str(e)}"
-                    }
-                ),
-                500,
-            )
+    try:
+        # Borrow a connection from the pool
+        with pool.connection() as conn:
+            cur = conn.cursor()
+
+            # Attempt operation
+            try:
+                # Update specified parts
+                row_delta = projects.update(cur, project_id, data)
+                read_cache.commit(conn, "projects", f"project:{project_id}")
+                cur.close()
+
+                # Validate if the operation was successful
+                if row_delta == 1:
+                    return jsonify({"message": "Data updated successfully"}), 200
+                elif row_delta > 1:
+                    return (
+                        jsonify({"message": "Multiple rows updated unexpectedly"}),
+                        500,
+                    )
+                elif row_delta == 0:
+                    return jsonify({"message": "Nothing was updated/ Not Found"}), 404
+                else:
+                    return (
+                        jsonify({"message": "Data was not updated successfully"}),
+                        500,
+                    )
+            except psycopg2.Error as e:
+                return (
+                    jsonify(
+                        {
+                            "message": f"An issue occurred when trying to update the project: {str(e)}"
+                        }
+                    ),
+                    500,
+                )
 
     # If database has connection or other error
     except psycopg2.Error as e:
         return jsonify({"message": str(e)}), 500
 
 
-@app.route("/projects/<project_id>", methods=["DELETE"])
+@app.route("/projects/<int:project_id>", methods=["DELETE"])
 async def delete_project_by_id(project_id):
     """
     Delete a project from the database.
@@ -370,27 +620,27 @@ async def delete_project_by_id(project_id):
     :return: JSON response with a message
     """
     try:
-        # Attempt to connect to the database
-        conn = psycopg2.connect(POSTGRES_URL)
-        cur = conn.cursor()
-        # Attempt operation
-        try:
-            cur.execute("DELETE FROM issues WHERE project_id = %s", (project_id,))
-            conn.commit()
-            cur.execute("DELETE FROM projects WHERE id = %s", (project_id,))
-            conn.commit()
-            cur.close()
-            conn.close()
-            return jsonify({"message": "Data deleted successfully"}), 204
-        except psycopg2.Error as e:
-            return (
-                jsonify(
-                    {
-                        "message": f"An error occurred while trying to delete the data: {str(e)}"
-                    }
-                ),
-                500,
-            )
+        # Borrow a connection from the pool
+        with pool.connection() as conn:
+            cur = conn.cursor()
+            # Attempt operation
+            try:
+                # The issues of the project are deleted with it (ON DELETE CASCADE)
+                projects.delete(cur, project_id)
+                read_cache.commit(
+                    conn, "projects", f"project:{project_id}", "issues", "issue_rows"
+                )
+                cur.close()
+                return jsonify({"message": "Data deleted successfully"}), 204
+            except psycopg2.Error as e:
+                return (
+                    jsonify(
+                        {
+                            "message": f"An error occurred while trying to delete the data: {str(e)}"
+                        }
+                    ),
+                    500,
+                )
 
     # If database has connection or other error
     except psycopg2.Error as e:
@@ -400,46 +650,71 @@ async def delete_project_by_id(project_id):
         )
 
 
-@app.route("/projects/<project_id>/issues", methods=["GET"])
+@app.route("/projects/<int:project_id>/issues", methods=["GET"])
 async def get_issues_by_project_id(project_id):
     """
     GET all issues by project ID.
 
+    Issues can be filtered by status, priority, type, label, due date and creation date,
+    see filters.py, and sorted with `sort` and `order`. Results are paginated, see
+    pagination.py. The response holds one page of issues and the cursor of the next page
+    (null on the last page). With `stream=1` or an `Accept: application/x-ndjson` header,
+    every issue after the cursor is streamed instead, see streaming.py.
+
     Returns a JSON response with a status code of 200 if the operation is successful,
+    or a status code of 400 with an error message if the filter, sort or pagination
+    arguments are invalid,
     or a status code of 500 with an error message if the operation fails.
 
     :param id: ID of the project to be queried
-    :return: JSON response with a list of issues
+    :param limit: Page size, or 'all' for every issue of the project
+    :param after: Cursor of the page to get
+    :param sort: Column to sort by, see filters.ISSUE_SORTS
+    :param order: asc or desc
+    :param stream: 1 to stream every issue as a single JSON document
+    :param fields: Comma separated columns to return, see repositories.py
+    :return: JSON response with a list of issues and the next cursor
     """
+    # Get the filter, sort, pagination and field arguments
+    try:
+        conditions, params = parse_issue_filters(request.args)
+        page = parse_page_args(request.args, ISSUE_SORTS)
+        fields = issues.parse_fields(request.args)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
     try:
-        # Attempt to connect to the database
-        conn = psycopg2.connect(POSTGRES_URL)
-        cur = conn.cursor()
+        # Answer from the read cache when possible, see cache.py
+        token = read_cache.token()
+        cached = cached_response(read_cache)
+        if cached is not None:
+            return cached
+        # Answer 304 Not Modified if the client has the current data, see etags.py
+        not_modified = await conditional_get(db, project_id=project_id)
+        if not_modified is not None:
+            return not_modified
+        # Stream every issue after the cursor when asked for, see streaming.py
+        stream_format = get_stream_format()
+        if stream_format is not None:
+            return stream_response(
+                pool,
+                *issues.project_page_query(
+                    project_id, conditions, params, page._replace(limit=None), fields
+                ),
+                stream_format,
+            )
 
-        # Attempt operation
+        # Attempt operation, on the read database access, see aiodb.py
         try:
-            cur.execute("SELECT * FROM issues WHERE project_id = %s", (project_id,))
-            rows = cur.fetchall()
-            cur.close()
-            conn.close()
-            formatted_rows = [
-                {
-                    "id": row[0],
-                    "project_id": row[1],
-                    "title": row[2],
-                    "type": row[3],
-                    "description": row[4],
-                    "status": row[5],
-                    "priority": row[6],
-                    "date_created": row[7],
-                    "date_started": row[8],
-                    "date_due": row[9],
-                    "date_closed": row[10],
-                    "labels": row[11],
-                }
-                for row in rows
-            ]
-            return jsonify({"message": formatted_rows}), 200
+            formatted_rows, next_cursor = await issues.project_page(
+                db, project_id, conditions, params, page, fields
+            )
+            payload = {
+                "message": issues.trim(formatted_rows, fields),
+                "next_cursor": next_cursor,
+            }
+            cache_response(read_cache, payload, ["issues"], token)
+            return jsonify(payload), 200
         except psycopg2.Error as e:
             return (
                 jsonify(
@@ -458,7 +733,7 @@ async def get_issues_by_project_id(project_id):
         )
 
 
-@app.route("/projects/<project_id>/issues", methods=["POST"])
+@app.route("/projects/<int:project_id>/issues", methods=["POST"])
 async def create_issue_by_project_id(project_id):
     """
     POST a new issue to the database by project ID.
@@ -471,85 +746,152 @@ async def create_issue_by_project_id(project_id):
     :param value: value of the issue to be created
     :return: JSON response with a message
     """
+    # Get the issue data
+    request_json = request.get_json(silent=True)
+    if request_json is None:
+        return (
+            jsonify({"message": f"Could not parse json data: {request.data}"}),
+            415,
+        )
+
+    # Validate the data provided
+    if (
+        "title" not in request_json
+        or "type" not in request_json
+        or "status" not in request_json
+    ):
+        return (
+            jsonify(
+                {
+                    "message": "Invalid request. Please fill out required fields of title, type, and status"
+                }
+            ),
+            400,
+        )
+
+    # Initialize variables
+    data = {
+        "title": request_json["title"],
+        "description": request_json.get("description"),
+        "type": request_json["type"],
+        "status": request_json["status"],
+        "priority": request_json.get("priority"),
+        "date_created": dt.now(timezone.utc),
+        "date_started": request_json.get("date_started"),
+        "date_due": request_json.get("date_due"),
+        "date_closed": request_json.get("date_closed"),
+        "labels": request_json.get("labels"),
+        "project_id": project_id,
+    }
+
+    # Validate the dates and labels
     try:
-        # Attempt to connect to the database
-        conn = psycopg2.connect(POSTGRES_URL)
-        cur = conn.cursor()
+        parse_columns(data)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
 
-        # Get the issue data
-        request_json = request.get_json(silent=True)
-        if request_json is None:
-            return (
-                jsonify({"message": f"Could not parse json data: {request.data}"}),
-                415,
-            )
+    try:
+        # Borrow a connection from the pool
+        with pool.connection() as conn:
+            cur = conn.cursor()
+
+            # Attempt operation
+            try:
+                # add method to see if issue already exists
+                row_delta = issues.insert(cur, data)
+                read_cache.commit(conn, "issues")
+                cur.close()
+
+                # Validate if the operation was successful
+                if row_delta == 1:
+                    return jsonify({"message": "Data added successfully"}), 201
+                elif row_delta > 1:
+                    return jsonify({"message": "Multiple rows added unexpectedly"}), 500
+                else:
+                    return jsonify({"message": "Data was not added successfully"}), 500
+            except psycopg2.Error as e:
+                return (
+                    jsonify(
+                        {
+                            "message": f"An issue occurred when trying to add the issue: {str(e)}"
+                        }
+                    ),
+                    500,
+                )
 
-        # Validate the data provided
-        if (
-            "title" not in request_json
-            or "type" not in request_json
-            or "status" not in request_json
-        ):
-            return (
-                jsonify(
-                    {
-                        "message": "Invalid request. Please fill out required fields of title, type, and status"
-                    }
-                ),
-                400,
-            )
+    # If database has connection or other error
+    except psycopg2.Error as e:
+        return jsonify({"message": str(e)}), 500
 
-        # Initialize variables
-        data = {
-            "title": request_json["title"],
-            "description": request_json.get("description"),
-            "type": request_json["type"],
-            "status": request_json["status"],
-            "priority": request_json.get("priority"),
-            "date_created": str(dt.now()),
-            "date_started": request_json.get("date_started"),
-            "date_due": request_json.get("date_due"),
-            "date_closed": request_json.get("date_closed"),
-            "labels": request_json.get("labels"),
-            "project_id": project_id,
-        }
-
-        # Attempt operation
-        try:
-            # add method to see if issue already exists
-            cur.execute(
-                "INSERT INTO issues (title, description, type, status, priority, date_created, date_started, date_due, date_closed, labels, project_id) \
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING *",
-                list(data.values()),
-            )
-            conn.commit()
-            row_delta = cur.rowcount
-            cur.close()
-            conn.close()
-
-            # Validate if the operation was successful
-            if row_delta == 1:
-                return jsonify({"message": "Data added successfully"}), 201
-            elif row_delta > 1:
-                return jsonify({"message": "Multiple rows added unexpectedly"}), 500
-            else:
-                return jsonify({"message": "Data was not added successfully"}), 500
-        except psycopg2.Error as e:
-            return (
-                jsonify(
-                    {
-                        "message": f"An issue occurred when trying to add the issue: {str(e)}"
-                    }
-                ),
-                500,
-            )
+
+@app.route("/projects/<int:project_id>/issues/bulk", methods=["POST"])
+async def create_issues_by_project_id(project_id):
+    """
+    POST many new issues to the database by project ID, in a single transaction.
+
+    Returns a JSON response with a status code of 201 and the ids of the created issues
+    if the operation is successful,
+    or a status code of 400 with the errors of every invalid issue if any issue is invalid,
+    in which case no issue is added,
+    or a status code of 404 with an error message if the project is not found,
+    or a status code of 500 with an error message if the operation fails.
+
+    :param project_id: ID of the project of the issues
+    :param value: JSON array or NDJSON of the issues to be created, see bulk.py
+    :return: JSON response with a message and the ids of the created issues
+    """
+    # Get and validate every issue before writing anything
+    try:
+        rows = read_rows(request)
+    except BulkError as e:
+        return jsonify({"message": str(e)}), e.status
+    values, errors = validate_issues(rows)
+    if errors:
+        return (
+            jsonify(
+                {
+                    "message": f"{len(errors)} of {len(rows)} issues are invalid, no issue was added",
+                    "errors": errors,
+                }
+            ),
+            400,
+        )
+
+    try:
+        # Borrow a connection from the pool
+        with pool.connection() as conn:
+            cur = conn.cursor()
+
+            # Attempt operation
+            try:
+                # Lock the project so that it cannot be deleted while adding its issues
+                if not projects.lock(cur, project_id):
+                    return jsonify({"message": "Project not found"}), 404
+                ids = insert_issues(cur, project_id, values)
+                read_cache.commit(conn, "issues")
+                cur.close()
+                return (
+                    jsonify(
+                        {"message": f"{len(ids)} issues added successfully", "ids": ids}
+                    ),
+                    201,
+                )
+            except psycopg2.Error as e:
+                return (
+                    jsonify(
+                        {
+                            "message": f"An issue occurred when trying to add the issues, no issue was added: {str(e)}"
+                        }
+                    ),
+                    500,
+                )
 
     # If database has connection or other error
     except psycopg2.Error as e:
         return jsonify({"message": str(e)}), 500
 
 
-@app.route("/issues/<issue_id>", methods=["GET"])
+@app.route("/issues/<int:issue_id>", methods=["GET"])
 async def get_issue_by_id(issue_id):
     """
     GET an issue from the database by ID.
@@ -560,37 +902,34 @@ async def get_issue_by_id(issue_id):
 
     :param id: ID of the project to be queried
     :param issue_id: ID of the issue to be retrieved
+    :param fields: Comma separated columns to return, see repositories.py
     :return: JSON response with a issue
     """
+    # Get the field arguments
     try:
-        # Attempt to connect to the database
-        conn = psycopg2.connect(POSTGRES_URL)
-        cur = conn.cursor()
+        fields = issues.parse_fields(request.args)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
 
-        # Attempt operation
+    try:
+        # Answer from the read cache when possible, see cache.py
+        token = read_cache.token()
+        cached = cached_response(read_cache)
+        if cached is not None:
+            return cached
+        # Answer 304 Not Modified if the client has the current data, see etags.py
+        not_modified = await conditional_get(db, tables=("issues",))
+        if not_modified is not None:
+            return not_modified
+        # Attempt operation, on the read database access, see aiodb.py
         try:
-            cur.execute(
-                "SELECT * FROM issues WHERE id = %s", (issue_id,)
-            )  # AND project_id = %s
-            row = cur.fetchone()
-            cur.close()
-            conn.close()
-            if row:
-                formatted_row = {
-                    "id": row[0],
-                    "project_id": row[1],
-                    "title": row[2],
-                    "type": row[3],
-                    "description": row[4],
-                    "status": row[5],
-                    "priority": row[6],
-                    "date_created": row[7],
-                    "date_started": row[8],
-                    "date_due": row[9],
-                    "date_closed": row[10],
-                    "labels": row[11],
-                }
-                return jsonify({"message": formatted_row}), 200
+            formatted_row = await issues.get(db, issue_id, fields)
+            if formatted_row:
+                payload = {"message": issues.trim([formatted_row], fields)[0]}
+                cache_response(
+                    read_cache, payload, [f"issue:{issue_id}", "issue_rows"], token
+                )
+                return jsonify(payload), 200
             else:
                 return jsonify({"message": "Issue not found"}), 404
         except psycopg2.Error as e:
@@ -611,7 +950,7 @@ async def get_issue_by_id(issue_id):
         )
 
 
-@app.route("/issues/<issue_id>", methods=["PUT"])
+@app.route("/issues/<int:issue_id>", methods=["PUT"])
 async def update_issue_by_id(issue_id):
     """
     PUT an issue to the database by ID.
@@ -624,67 +963,186 @@ async def update_issue_by_id(issue_id):
     :param value: value of the issue to be updated
     :return: JSON response with a message
     """
+    # Get the issue data
+    request_json = request.get_json(silent=True)
+    if request_json is None:
+        return (
+            jsonify({"message": f"Could not parse json data: {request.data}"}),
+            415,
+        )
+
+    # Initialize variables
+    data = {
+        "title": request_json.get("title"),
+        "description": request_json.get("description"),
+        "type": request_json.get("type"),
+        "status": request_json.get("status"),
+        "priority": request_json.get("priority"),
+        "date_started": request_json.get("date_started"),
+        "date_due": request_json.get("date_due"),
+        "date_closed": request_json.get("date_closed"),
+        "labels": request_json.get("labels"),
+        "project_id": request_json.get("project_id"),
+    }
+
+    # Validate the dates and labels
     try:
-        # Attempt to connect to the database
-        conn = psycopg2.connect(POSTGRES_URL)
-        cur = conn.cursor()
+        parse_columns(data)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
 
-        # Get the issue data
-        request_json = request.get_json(silent=True)
-        if request_json is None:
-            return (
-                jsonify({"message": f"Could not parse json data: {request.data}"}),
-                415,
+    try:
+        # Borrow a connection from the pool
+        with pool.connection() as conn:
+            cur = conn.cursor()
+
+            # Attempt operation
+            try:
+                # Update specified parts
+                row_delta = issues.update(cur, issue_id, data)
+                read_cache.commit(conn, "issues", f"issue:{issue_id}")
+                cur.close()
+
+                # Validate if the operation was successful
+                if row_delta == 1:
+                    return jsonify({"message": "Data updated successfully"}), 200
+                elif row_delta > 1:
+                    return (
+                        jsonify({"message": "Multiple rows updated unexpectedly"}),
+                        500,
+                    )
+                elif row_delta == 0:
+                    return jsonify({"message": "Nothing was updated/ Not Found"}), 404
+                else:
+                    return (
+                        jsonify({"message": "Data was not updated successfully"}),
+                        500,
+                    )
+            except psycopg2.Error as e:
+                return (
+                    jsonify(
+                        {
+                            "message": f"An issue occurred when trying to update the issue: {str(e)}"
+                        }
+                    ),
+                    500,
+                )
+
+    # If database has connection or other error
+    except psycopg2.Error as e:
+        return jsonify({"message": str(e)}), 500
+
+
+@app.route("/issues/<int:issue_id>", methods=["DELETE"])
+async def delete_issue_by_id(issue_id):
+    """
+    DELETE an issue from the database by ID.
+
+    Returns a JSON response with a status code of 200 if the issue is deleted successfully,
+    or a status code of 500 with an error message if the operation fails.
+
+    :param id: ID of the project to be queried
+    :param issue_id: ID of the issue to be deleted
+    :return: JSON response with a message
+    """
+    try:
+        # Borrow a connection from the pool
+        with pool.connection() as conn:
+            cur = conn.cursor()
+
+            # Attempt operation
+            try:
+                issues.delete(cur, issue_id)
+                read_cache.commit(conn, "issues", f"issue:{issue_id}")
+                cur.close()
+                return jsonify({"message": "Data deleted successfully"}), 204
+            except psycopg2.Error as e:
+                return (
+                    jsonify(
+                        {
+                            "message": f"An error occurred while trying to delete the data: {str(e)}"
+                        }
+                    ),
+                    500,
+                )
+
+    # If database has connection or other error
+    except psycopg2.Error as e:
+        return (
+            jsonify({"message": f"A connection or other issue occured: {str(e)}"}),
+            500,
+        )
+
+
+@app.route("/issues", methods=["GET"])
+async def get_all_issues():
+    """
+    GET all issues from the database.
+
+    Issues can be filtered by status, priority, type, label, due date and creation date,
+    see filters.py, and sorted with `sort` and `order`. Results are paginated, see
+    pagination.py. The response holds one page of issues and the cursor of the next page
+    (null on the last page). With `stream=1` or an `Accept: application/x-ndjson` header,
+    every issue after the cursor is streamed instead, see streaming.py.
+
+    Returns a JSON response with a status code of 200 if the operation is successful,
+    or a status code of 400 with an error message if the filter, sort or pagination
+    arguments are invalid,
+    or a status code of 500 with an error message if the operation fails.
+
+    :param limit: Page size, or 'all' for every issue
+    :param after: Cursor of the page to get
+    :param sort: Column to sort by, see filters.ISSUE_SORTS
+    :param order: asc or desc
+    :param stream: 1 to stream every issue as a single JSON document
+    :param fields: Comma separated columns to return, see repositories.py
+    :return: JSON response with a list of issues and the next cursor
+    """
+    # Get the filter, sort, pagination and field arguments
+    try:
+        conditions, params = parse_issue_filters(request.args)
+        page = parse_page_args(request.args, ISSUE_SORTS)
+        fields = issues.parse_fields(request.args)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    try:
+        # Answer from the read cache when possible, see cache.py
+        token = read_cache.token()
+        cached = cached_response(read_cache)
+        if cached is not None:
+            return cached
+        # Answer 304 Not Modified if the client has the current data, see etags.py
+        not_modified = await conditional_get(db, tables=("issues",))
+        if not_modified is not None:
+            return not_modified
+        # Stream every issue after the cursor when asked for, see streaming.py
+        stream_format = get_stream_format()
+        if stream_format is not None:
+            return stream_response(
+                pool,
+                *issues.page_query(
+                    conditions, params, page._replace(limit=None), fields
+                ),
+                stream_format,
             )
 
-        # Initialize variables
-        data = {
-            "title": request_json.get("title"),
-            "description": request_json.get("description"),
-            "type": request_json.get("type"),
-            "status": request_json.get("status"),
-            "priority": request_json.get("priority"),
-            "date_started": request_json.get("date_started"),
-            "date_due": request_json.get("date_due"),
-            "date_closed": request_json.get("date_closed"),
-            "labels": request_json.get("labels"),
-            "project_id": request_json.get("project_id"),
-        }
-
-        # Attempt operation
+        # Attempt operation, on the read database access, see aiodb.py
         try:
-            # Update specified parts
-            updates = []
-            args = []
-            for field, value in data.items():
-                if value is not None:
-                    updates.append(f"{field} = %s")
-                    args.append(value)
-            args.append(issue_id)
-            if updates:
-                cur.execute(
-                    f"UPDATE issues SET {', '.join(updates)} WHERE id = %s",
-                    args,
-                )
-            conn.commit()
-            row_delta = cur.rowcount
-            cur.close()
-            conn.close()
-
-            # Validate if the operation was successful
-            if row_delta == 1:
-                return jsonify({"message": "Data updated successfully"}), 200
-            elif row_delta > 1:
-                return jsonify({"message": "Multiple rows updated unexpectedly"}), 500
-            elif row_delta == 0:
-                return jsonify({"message": "Nothing was updated/ Not Found"}), 404
-            else:
-                return jsonify({"message": "Data was not updated successfully"}), 500
+            formatted_rows, next_cursor = await issues.page(
+                db, conditions, params, page, fields
+            )
+            payload = {
+                "message": issues.trim(formatted_rows, fields),
+                "next_cursor": next_cursor,
+            }
+            cache_response(read_cache, payload, ["issues"], token)
+            return jsonify(payload), 200
         except psycopg2.Error as e:
             return (
                 jsonify(
                     {
-                        "message": f"An issue occurred when trying to update the issue: {str(e)}"
+                        "message": f"An issue occured when trying to get all projects: {str(e)}"
                     }
                 ),
                 500,
@@ -692,38 +1150,74 @@ async def update_issue_by_id(issue_id):
 
     # If database has connection or other error
     except psycopg2.Error as e:
-        return jsonify({"message": str(e)}), 500
+        return (
+            jsonify({"message": f"A connection or other issue occured: {str(e)}"}),
+            500,
+        )
 
 
-@app.route("/issues/<issue_id>", methods=["DELETE"])
-async def delete_issue_by_id(issue_id):
+@app.route("/search", methods=["GET"])
+async def search_issues():
     """
-    DELETE an issue from the database by ID.
+    GET the issues matching a full-text search of their titles and descriptions.
 
-    Returns a JSON response with a status code of 200 if the issue is deleted successfully,
+    Matches are ranked, best first, and paginated, see search.py. They can be scoped to a
+    project and filtered like the issue list endpoints, see filters.py. The response holds
+    one page of issues, each with its `rank`, and the cursor of the next page (null on the
+    last page).
+
+    Returns a JSON response with a status code of 200 if the operation is successful,
+    or a status code of 400 with an error message if the search terms, filter or
+    pagination arguments are invalid,
     or a status code of 500 with an error message if the operation fails.
 
-    :param id: ID of the project to be queried
-    :param issue_id: ID of the issue to be deleted
-    :return: JSON response with a message
+    :param q: Search terms
+    :param project_id: ID of the project to search in
+    :param limit: Page size, or 'all' for every match
+    :param after: Cursor of the page to get
+    :param fields: Comma separated columns to return, see repositories.py
+    :return: JSON response with a list of issues and the next cursor
     """
+    # Get the search, scope, filter, pagination and field arguments
     try:
-        # Attempt to connect to the database
-        conn = psycopg2.connect(POSTGRES_URL)
-        cur = conn.cursor()
+        search = parse_search_args(request.args)
+        conditions, params = parse_search_scope(request.args)
+        filter_conditions, filter_params = parse_issue_filters(request.args)
+        fields = issues.parse_fields(request.args)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
 
-        # Attempt operation
+    try:
+        # Answer from the read cache when possible, see cache.py
+        token = read_cache.token()
+        cached = cached_response(read_cache)
+        if cached is not None:
+            return cached
+        # Answer 304 Not Modified if the client has the current data, see etags.py
+        not_modified = await conditional_get(db, tables=("issues",))
+        if not_modified is not None:
+            return not_modified
+
+        # Attempt operation, on the read database access, see aiodb.py
         try:
-            cur.execute("DELETE FROM issues WHERE id = %s", (issue_id,))
-            conn.commit()
-            cur.close()
-            conn.close()
-            return jsonify({"message": "Data deleted successfully"}), 204
+            formatted_rows, next_cursor = await issues.search(
+                db,
+                search,
+                conditions + filter_conditions,
+                params + filter_params,
+                fields,
+            )
+            payload = {
+                "message": issues.trim(formatted_rows, fields),
+                "next_cursor": next_cursor,
+            }
+            cache_response(read_cache, payload, ["issues"], token)
+            return jsonify(payload), 200
         except psycopg2.Error as e:
             return (
                 jsonify(
                     {
-                        "message": f"An error occurred while trying to delete the data: {str(e)}"
+                        "message": f"An error occurred while trying to search the issues: {str(e)}"
                     }
                 ),
                 500,
@@ -737,50 +1231,60 @@ async def delete_issue_by_id(issue_id):
         )
 
 
-@app.route("/issues", methods=["GET"])
-async def get_all_issues():
+@app.route("/sync", methods=["GET"])
+async def get_changes():
     """
-    GET all issues from the database.
+    GET the projects and issues created, updated or deleted since a revision.
+
+    Clients keeping a copy of the data download only what changed since their last sync,
+    see sync.py. The response holds one page of changes in revision order, the revision to
+    sync from next and the cursor of the next page (null on the last page).
 
     Returns a JSON response with a status code of 200 if the operation is successful,
+    or a status code of 400 with an error message if the arguments are invalid,
     or a status code of 500 with an error message if the operation fails.
 
-    :return: JSON response with a list of issues
+    :param since: Revision returned by the last complete sync, absent for everything
+    :param limit: Number of changes per page, or 'all' for every change
+    :param after: Cursor of the page to get
+    :return: JSON response with a list of changes, the revision, the next cursor and
+             whether the client must drop its copy
     """
+    # Get the revision and pagination arguments
     try:
-        # Attempt to connect to the database
-        conn = psycopg2.connect(POSTGRES_URL)
-        cur = conn.cursor()
+        since, limit, after = parse_sync_args(request.args)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
 
-        # Attempt operation
+    try:
+        # Answer from the read cache when possible, see cache.py
+        token = read_cache.token()
+        cached = cached_response(read_cache)
+        if cached is not None:
+            return cached
+        # Answer 304 Not Modified if the client has the current data, see etags.py
+        not_modified = await conditional_get(db, tables=("projects", "issues"))
+        if not_modified is not None:
+            return not_modified
+
+        # Attempt operation, on the read database access, see aiodb.py
         try:
-            cur.execute("SELECT * FROM issues")
-            rows = cur.fetchall()
-            cur.close()
-            conn.close()
-            formatted_rows = [
-                {
-                    "id": row[0],
-                    "project_id": row[1],
-                    "title": row[2],
-                    "type": row[3],
-                    "description": row[4],
-                    "status": row[5],
-                    "priority": row[6],
-                    "date_created": row[7],
-                    "date_started": row[8],
-                    "date_due": row[9],
-                    "date_closed": row[10],
-                    "labels": row[11],
-                }
-                for row in rows
-            ]
-            return jsonify({"message": formatted_rows}), 200
+            changes, revision, next_cursor, reset = await fetch_changes(
+                db, {PROJECT: projects, ISSUE: issues}, since, limit, after
+            )
+            payload = {
+                "message": changes,
+                "revision": revision,
+                "next_cursor": next_cursor,
+                "reset": reset,
+            }
+            cache_response(read_cache, payload, ["projects", "issues"], token)
+            return jsonify(payload), 200
         except psycopg2.Error as e:
             return (
                 jsonify(
                     {
-                        "message": f"An issue occured when trying to get all projects: {str(e)}"
+                        "message": f"An error occurred while trying to get the changes: {str(e)}"
                     }
                 ),
                 500,
@@ -794,6 +1298,149 @@ async def get_all_issues():
         )
 
 
+@app.route("/events", methods=["GET"])
+def get_events():
+    """
+    GET the changes of the projects and issues as a stream of Server-Sent Events.
+
+    Every created, updated or deleted project or issue is sent as a `change` event as
+    soon as it is committed, so that clients do not have to poll. Streams can be filtered
+    by project, and resume after the last event received, see events.py.
+
+    Returns a stream with a status code of 200 if the operation is successful,
+    or a status code of 400 with an error message if the arguments are invalid,
+    or a status code of 503 with an error message if too many streams are open,
+    or a status code of 500 with an error message if the operation fails.
+
+    :param project_id: ID of the project to get the changes of
+    :param last_event_id: Id of the last event received, also read from the
+                          Last-Event-ID header
+    :return: Stream of events
+    """
+    # Get the filter and resume arguments
+    try:
+        after, project_id = parse_event_args(request.args, request.headers)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    if not change_feed.acquire():
+        return (
+            jsonify({"message": "Too many event streams are open, try again later"}),
+            503,
+            {"Retry-After": "10"},
+        )
+    try:
+        if after is None:
+            after = change_feed.latest_position()
+        else:
+            after = change_feed.position(after)
+    # If database has connection or other error
+    except psycopg2.Error as e:
+        change_feed.release()
+        return (
+            jsonify({"message": f"A connection or other issue occured: {str(e)}"}),
+            500,
+        )
+
+    def generate():
+        # Browsers wait this many milliseconds before reconnecting
+        yield "retry: 3000\n\n"
+        try:
+            for name, event in change_feed.events(
+                after, project_id, EVENTS_STREAM_SECONDS
+            ):
+                yield format_event(name, event)
+        except psycopg2.Error:
+            # The client reconnects and resumes after the last event it received
+            pass
+
+    # Ask nginx to pass the events on instead of buffering them
+    response = Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    response.call_on_close(change_feed.release)
+    return response
+
+
+@app.route("/issues", methods=["PATCH"])
+async def update_issues():
+    """
+    PATCH many issues of the database at once, with a single UPDATE in one transaction.
+
+    Returns a JSON response with a status code of 200 and the number of updated issues
+    if the operation is successful,
+    or a status code of 400 with an error message if the request is invalid,
+    or a status code of 404 with an error message if the patch moves the issues to a
+    project that does not exist,
+    or a status code of 500 with an error message if the operation fails.
+
+    :param ids: IDs of the issues to be updated
+    :param filter: Filters selecting the issues to be updated, like the get issues
+                   endpoint, plus project_id
+    :param patch: New values of the fields to be updated
+    :return: JSON response with a message and the number of updated issues
+    """
+    # Get the selection and the patch
+    request_json = request.get_json(silent=True)
+    if not isinstance(request_json, dict):
+        return (
+            jsonify({"message": f"Could not parse json data: {request.data}"}),
+            415,
+        )
+
+    # Validate the data provided
+    try:
+        conditions, condition_params = parse_issue_selection(request_json)
+        assignments, params = parse_issue_patch(request_json)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    try:
+        # Borrow a connection from the pool
+        with pool.connection() as conn:
+            cur = conn.cursor()
+
+            # Attempt operation
+            try:
+                # Lock the new project so that it cannot be deleted while moving the issues
+                project_id = request_json["patch"].get("project_id")
+                if project_id is not None and not projects.lock(cur, project_id):
+                    return jsonify({"message": "Project not found"}), 404
+                cur.execute(
+                    f"UPDATE issues SET {', '.join(assignments)} WHERE {' AND '.join(conditions)}",
+                    params + condition_params,
+                )
+                read_cache.commit(conn, "issues", "issue_rows")
+                row_delta = cur.rowcount
+                cur.close()
+                return (
+                    jsonify(
+                        {
+                            "message": f"{row_delta} issues updated successfully",
+                            "count": row_delta,
+                        }
+                    ),
+                    200,
+                )
+            except psycopg2.Error as e:
+                return (
+                    jsonify(
+                        {
+                            "message": f"An issue occurred when trying to update the issues: {str(e)}"
+                        }
+                    ),
+                    500,
+                )
+
+    # If database has connection or other error
+    except psycopg2.Error as e:
+        return jsonify({"message": str(e)}), 500
+
+
 # Run the FastAPI application
 if __name__ == "__main__":
+    # Bring the database schema up to date before accepting requests, see migrations.py
+    migrate_on_startup(POSTGRES_URL)
     app.run(host="0.0.0.0", port=5001)
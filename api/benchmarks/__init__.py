@@ -0,0 +1,6 @@
+"""
+benchmarks
+
+Contains the benchmarks of the API, run from the api directory with
+    python -m benchmarks.<benchmark> --help
+"""
@@ -0,0 +1,230 @@
+"""
+bench_indexes.py
+
+Measures the issue queries of the API before and after the indexes of a migration.
+
+The benchmark copies the current layout of the projects and issues tables (without their
+indexes) into a scratch schema, fills it with synthetic data, and times the queries the
+API runs for the issue endpoints. It then creates the indexes of the migration in the
+scratch schema and times the same queries again. The real tables are not touched.
+
+Usage (from the api directory, with POSTGRES_URL set):
+    python -m benchmarks.bench_indexes --issues 1000000 --projects 1000
+"""
+
+import os
+import json
+import time
+import argparse
+import statistics
+import psycopg2
+from migrations import MIGRATIONS_DIR, split_statements
+from pagination import Page, page_query
+
+SCHEMA = "bench_indexes"
+DEFAULT_MIGRATION = os.path.join(MIGRATIONS_DIR, "0001_issue_indexes.sql")
+
+
+def create_tables(conn, projects, issues):
+    """
+    Creates and fills the scratch copies of the projects and issues tables.
+
+    :param conn: Connection with the scratch schema first in its search path
+    :param projects: Number of projects to create
+    :param issues: Number of issues to create, spread evenly over the projects
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {SCHEMA}")
+        for table in ("projects", "issues"):
+            cur.execute(
+                f"CREATE TABLE {SCHEMA}.{table} "
+                f"(LIKE public.{table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            )
+            cur.execute(f"ALTER TABLE {SCHEMA}.{table} ADD PRIMARY KEY (id)")
+        cur.execute(
+            f"ALTER TABLE {SCHEMA}.issues ADD FOREIGN KEY (project_id) "
+            f"REFERENCES {SCHEMA}.projects (id)"
+        )
+        cur.execute(
+            """
+            INSERT INTO projects (id, name, status, date_created)
+            SELECT g, 'Project ' || g, 'New', timestamp '2023-01-01' + g * interval '1 hour'
+            FROM generate_series(1, %s) g
+            """,
+            (projects,),
+        )
+        cur.execute(
+            """
+            INSERT INTO issues (id, project_id, title, type, description, status, priority,
+                                date_created, date_due, labels)
+            SELECT g,
+                   1 + g %% %s,
+                   'Issue ' || g,
+                   (ARRAY['Bug', 'Task', 'Improvement', 'Feature', 'Other'])[1 + g %% 5],
+                   repeat('Description of the issue. ', 8),
+                   (ARRAY['New', 'Approved', 'In progress', 'Done', 'Closed'])[1 + g %% 5],
+                   (ARRAY['Low', 'Medium', 'High', 'Critical'])[1 + g %% 4],
+                   timestamp '2023-01-01' + g * interval '10 seconds',
+                   CASE WHEN g %% 3 = 0 THEN NULL
+                        ELSE timestamp '2023-01-01' + (g %% 1000) * interval '1 day' END,
+                   ARRAY['label-' || g %% 20]
+            FROM generate_series(1, %s) g
+            """,
+            (projects, issues),
+        )
+        cur.execute("ANALYZE projects")
+        cur.execute("ANALYZE issues")
+    conn.commit()
+
+
+def benchmark_queries(projects):
+    """
+    Returns the queries to time, as the API builds them.
+
+    :param projects: Number of projects in the scratch tables
+    :return: List of (name, query, params, rollback) where rollback tells that the query
+             changes data and must be rolled back
+    """
+    project_id = projects // 2
+    first_page = Page(100, None, "id", "asc", False)
+    by_due = Page(100, None, "date_due", "asc", True)
+    return [
+        (
+            "issues of a project",
+            *page_query("issues", ["project_id = %s"], [project_id], first_page),
+            False,
+        ),
+        (
+            "issues of a project by status",
+            *page_query(
+                "issues",
+                ["project_id = %s", "status = ANY(%s)"],
+                [project_id, ["Done"]],
+                first_page,
+            ),
+            False,
+        ),
+        (
+            "issues sorted by due date",
+            *page_query("issues", [], [], by_due),
+            False,
+        ),
+        (
+            "issues due in a month",
+            *page_query(
+                "issues",
+                ["date_due >= %s", "date_due < %s"],
+                ["2023-06-01", "2023-07-01"],
+                first_page,
+            ),
+            False,
+        ),
+        (
+            "delete a project and its issues",
+            "DELETE FROM issues WHERE project_id = %s; DELETE FROM projects WHERE id = %s",
+            [project_id, project_id],
+            True,
+        ),
+    ]
+
+
+def time_queries(conn, queries, repeat):
+    """
+    Runs every query `repeat` times after a warm up run.
+
+    :return: dict of query name -> median duration in milliseconds
+    """
+    results = {}
+    with conn.cursor() as cur:
+        for name, query, params, rollback in queries:
+            durations = []
+            for _ in range(repeat + 1):
+                started = time.perf_counter()
+                cur.execute(query, params)
+                if cur.description:
+                    cur.fetchall()
+                durations.append((time.perf_counter() - started) * 1000)
+                if rollback:
+                    conn.rollback()
+            conn.rollback()
+            results[name] = statistics.median(durations[1:])
+    return results
+
+
+def create_indexes(conn, migration):
+    """
+    Creates the indexes of a migration in the scratch schema.
+
+    :param conn: Connection with the scratch schema first in its search path
+    :param migration: Path of the migration file
+    """
+    with open(migration, encoding="utf-8") as file:
+        statements = split_statements(file.read())
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for statement in statements:
+                cur.execute(statement)
+            cur.execute("ANALYZE issues")
+    finally:
+        conn.autocommit = False
+
+
+def main():
+    """
+    Command line entry point, see the module docstring.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--issues", type=int, default=1_000_000)
+    parser.add_argument("--projects", type=int, default=1_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--migration", default=DEFAULT_MIGRATION)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep the scratch schema afterwards"
+    )
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(
+        os.environ["POSTGRES_URL"], options=f"-c search_path={SCHEMA},public"
+    )
+    try:
+        started = time.perf_counter()
+        create_tables(conn, args.projects, args.issues)
+        print(
+            f"Created {args.projects} projects and {args.issues} issues "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+        queries = benchmark_queries(args.projects)
+        before = time_queries(conn, queries, args.repeat)
+        create_indexes(conn, args.migration)
+        after = time_queries(conn, queries, args.repeat)
+    finally:
+        if not args.keep:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            conn.commit()
+        conn.close()
+
+    print(f"{'query':<35}{'before (ms)':>14}{'after (ms)':>14}{'speedup':>10}")
+    for name, duration in before.items():
+        speedup = duration / after[name] if after[name] else float("inf")
+        print(f"{name:<35}{duration:>14.2f}{after[name]:>14.2f}{speedup:>9.1f}x")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "issues": args.issues,
+                    "projects": args.projects,
+                    "migration": os.path.basename(args.migration),
+                    "before_ms": before,
+                    "after_ms": after,
+                },
+                file,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+"""
+bench_load.py
+
+Measures the throughput and latency of a running API under concurrent load.
+
+The load generator runs `--concurrency` client threads for `--duration` seconds per
+scenario. Each thread keeps one keep-alive connection and sends requests as fast as the API
+answers. Every scenario of SCENARIOS is run in turn, with random projects, issues, labels
+and search terms of the database, e.g. seeded with seed.py. `--scenario` selects some of
+them, and `--read-only` leaves out the ones writing data. `--path` instead requests the
+given paths in turn, as a single scenario.
+
+Several `--concurrency` values run every scenario at each of them. The requests per
+second and the p50, p95 and p99 latencies of every run are printed, and written with the
+commit of the API to `--output`. Two result files are compared with `--compare`, which
+fails if a p95 latency got worse by more than `--tolerance`:
+
+    python -m benchmarks.bench_load --compare before.json after.json
+
+Start the API first, e.g. with gunicorn. The change feed (/events) is not measured, its
+streams stay open.
+
+Usage (from the api directory):
+    python -m benchmarks.seed --projects 1000 --issues 1000000 --reset
+    python -m benchmarks.bench_load --url http://localhost:5001 --concurrency 1 16 64 \
+        --duration 10 --output results.json
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+import statistics
+import threading
+import subprocess
+import http.client
+from collections import namedtuple
+from urllib.parse import quote, urlsplit
+from benchmarks.seed import LABELS, PRIORITIES, STATUSES, WORDS
+
+# Requests of a scenario: the path is formatted with a random project_id, issue_id, label,
+# status and search term for every request, and so is the body of writes
+Scenario = namedtuple("Scenario", ["name", "method", "path", "body"])
+
+SCENARIOS = [
+    Scenario("list projects", "GET", "/projects?limit=100", None),
+    Scenario("list projects with stats", "GET", "/projects?limit=100&stats=1", None),
+    Scenario("get project", "GET", "/projects/{project_id}", None),
+    Scenario(
+        "list issues of a project",
+        "GET",
+        "/projects/{project_id}/issues?limit=100",
+        None,
+    ),
+    Scenario(
+        "stream issues of a project",
+        "GET",
+        "/projects/{project_id}/issues?stream=1",
+        None,
+    ),
+    Scenario("list issues", "GET", "/issues?limit=100", None),
+    Scenario(
+        "filter issues",
+        "GET",
+        "/issues?limit=100&status={status}&label={label}&sort=date_due",
+        None,
+    ),
+    Scenario("get issue", "GET", "/issues/{issue_id}", None),
+    Scenario("search issues", "GET", "/search?q={term}&limit=20", None),
+    Scenario("sync", "GET", "/sync?limit=500", None),
+    Scenario("export project", "GET", "/projects/{project_id}/export", None),
+    Scenario(
+        "create issue",
+        "POST",
+        "/projects/{project_id}/issues",
+        {
+            "title": "Load test issue",
+            "type": "Task",
+            "status": "{status}",
+            "priority": "{priority}",
+            "labels": ["{label}"],
+        },
+    ),
+    Scenario("update issue", "PUT", "/issues/{issue_id}", {"status": "{status}"}),
+]
+
+# Projects whose issues are sampled for the issue ids of the scenarios
+SAMPLED_PROJECTS = 20
+
+
+def percentile(durations, fraction):
+    """
+    Returns a percentile of sorted durations.
+
+    :param durations: Sorted list of durations
+    :param fraction: Percentile between 0 and 1
+    """
+    if not durations:
+        return 0.0
+    return durations[min(len(durations) - 1, int(len(durations) * fraction))]
+
+
+def get_json(url, path):
+    """
+    GETs a path of the API.
+
+    :return: Decoded JSON response
+    :raises OSError: If the request fails
+    """
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+    try:
+        conn.request("GET", parts.path.rstrip("/") + path)
+        response = conn.getresponse()
+        body = response.read()
+        if response.status != 200:
+            raise OSError(f"GET {path} answered {response.status}: {body[:200]!r}")
+        return json.loads(body)
+    finally:
+        conn.close()
+
+
+def load_context(url, seed):
+    """
+    Reads the projects and a sample of the issues of the API, for the scenarios.
+
+    :param url: Base URL of the API
+    :param seed: Seed of the sampling
+    :return: dict of value name -> list of values to pick from
+    :raises OSError: If the API has no projects or issues, or a request fails
+    """
+    project_ids = [
+        project["id"]
+        for project in get_json(url, "/projects?limit=all&fields=id")["message"]
+    ]
+    if not project_ids:
+        raise OSError("The API has no projects, see seed.py")
+    issue_ids = []
+    sampler = random.Random(seed)
+    for project_id in sampler.sample(
+        project_ids, min(SAMPLED_PROJECTS, len(project_ids))
+    ):
+        issues = get_json(url, f"/projects/{project_id}/issues?limit=100&fields=id")
+        issue_ids += [issue["id"] for issue in issues["message"]]
+    if not issue_ids:
+        raise OSError("The API has no issues, see seed.py")
+    return {
+        "project_id": project_ids,
+        "issue_id": issue_ids,
+        "label": LABELS,
+        "status": list(STATUSES),
+        "priority": list(PRIORITIES),
+        "term": WORDS["problem"] + WORDS["subject"],
+    }
+
+
+def fill(template, values):
+    """
+    Formats the strings of a JSON template.
+    """
+    if isinstance(template, str):
+        return template.format(**values)
+    if isinstance(template, list):
+        return [fill(item, values) for item in template]
+    if isinstance(template, dict):
+        return {key: fill(value, values) for key, value in template.items()}
+    return template
+
+
+def scenario_requests(scenario, context, rng):
+    """
+    Returns the function building the requests of a scenario.
+
+    :param scenario: Scenario
+    :param context: Values to pick from, see `load_context`
+    :param rng: random.Random of the client thread
+    :return: Function returning (method, path, JSON body or None)
+    """
+
+    def next_request():
+        values = {name: rng.choice(choices) for name, choices in context.items()}
+        path = scenario.path.format(
+            **{name: quote(str(value)) for name, value in values.items()}
+        )
+        body = fill(scenario.body, values) if scenario.body is not None else None
+        return scenario.method, path, body
+
+    return next_request
+
+
+def path_requests(paths):
+    """
+    Returns the function building requests to paths in turn, for `--path`.
+    """
+    count = iter(range(sys.maxsize))
+
+    def next_request():
+        return "GET", paths[next(count) % len(paths)], None
+
+    return next_request
+
+
+def run_client(url, next_request, deadline, results):
+    """
+    Sends requests until the deadline, recording their durations in milliseconds. Failed
+    requests and error responses are counted as errors.
+
+    :param url: Base URL of the API
+    :param next_request: Function returning the (method, path, body) of the next request
+    :param deadline: time.monotonic() value to stop at
+    :param results: dict the durations and error count are added to
+    """
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    durations = []
+    errors = 0
+    while time.monotonic() < deadline:
+        method, path, body = next_request()
+        headers = {}
+        if body is not None:
+            body = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        started = time.perf_counter()
+        try:
+            conn.request(method, parts.path.rstrip("/") + path, body, headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(
+                parts.hostname, parts.port or 80, timeout=30
+            )
+            continue
+        durations.append((time.perf_counter() - started) * 1000)
+    conn.close()
+    with results["lock"]:
+        results["durations"] += durations
+        results["errors"] += errors
+
+
+def run_load(url, request_factory, concurrency, duration):
+    """
+    Runs the load and returns its statistics.
+
+    :param url: Base URL of the API
+    :param request_factory: Function called with the index of a client thread, returning
+                            the function building its requests
+    :param concurrency: Number of client threads
+    :param duration: Seconds to run for
+    :return: dict with the number of requests, errors, requests per second and latencies
+    """
+    results = {"lock": threading.Lock(), "durations": [], "errors": 0}
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(
+            target=run_client, args=(url, request_factory(i), deadline, results)
+        )
+        for i in range(concurrency)
+    ]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    durations = sorted(results["durations"])
+    return {
+        "requests": len(durations),
+        "errors": results["errors"],
+        "requests_per_second": len(durations) / elapsed,
+        "mean_ms": statistics.fmean(durations) if durations else 0.0,
+        "p50_ms": percentile(durations, 0.50),
+        "p95_ms": percentile(durations, 0.95),
+        "p99_ms": percentile(durations, 0.99),
+    }
+
+
+def git_commit():
+    """
+    Returns the commit of the working tree of the API, or None outside of git.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline_path, results_path, tolerance):
+    """
+    Prints the change of every run of a results file from a baseline.
+
+    :param baseline_path: Results file of the reference commit
+    :param results_path: Results file to compare
+    :param tolerance: Fraction by which a p95 latency may grow
+    :return: Whether no p95 latency grew by more than the tolerance
+    """
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = json.load(file)
+    with open(results_path, encoding="utf-8") as file:
+        results = json.load(file)
+    before = {(run["scenario"], run["concurrency"]): run for run in baseline["runs"]}
+    print(f"{baseline.get('commit')} -> {results.get('commit')}")
+    print(f"{'scenario':<30}{'conc.':>6}{'req/s':>16}{'p95 (ms)':>22}")
+    passed = True
+    for run in results["runs"]:
+        old = before.get((run["scenario"], run["concurrency"]))
+        if old is None:
+            print(f"{run['scenario']:<30}{run['concurrency']:>6}  not in the baseline")
+            continue
+        rps_change = run["requests_per_second"] / max(old["requests_per_second"], 1e-9)
+        p95_change = run["p95_ms"] / max(old["p95_ms"], 1e-9)
+        regressed = p95_change > 1 + tolerance
+        passed = passed and not regressed
+        print(
+            f"{run['scenario']:<30}{run['concurrency']:>6}"
+            f"{run['requests_per_second']:>9.0f} {rps_change - 1:>+6.0%}"
+            f"{run['p95_ms']:>14.1f} {p95_change - 1:>+6.0%}"
+            f"{'  REGRESSION' if regressed else ''}"
+        )
+    return passed
+
+
+def main():
+    """
+    Command line entry point, see the module docstring.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--url", default="http://localhost:5001")
+    parser.add_argument("--path", action="append", dest="paths")
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        dest="scenarios",
+        choices=[scenario.name for scenario in SCENARIOS],
+    )
+    parser.add_argument("--read-only", action="store_true")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "RESULTS"))
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(0 if compare(*args.compare, args.tolerance) else 1)
+
+    if args.paths:
+        runs = [("paths", lambda i: path_requests(args.paths))]
+    else:
+        context = load_context(args.url, args.seed)
+        runs = [
+            (
+                scenario.name,
+                lambda i, scenario=scenario: scenario_requests(
+                    scenario, context, random.Random(args.seed * 1000 + i)
+                ),
+            )
+            for scenario in SCENARIOS
+            if (not args.scenarios or scenario.name in args.scenarios)
+            and not (args.read_only and scenario.method != "GET")
+        ]
+
+    # Warm up the connections of the API
+    run_load(args.url, runs[0][1], max(args.concurrency), min(2.0, args.duration))
+    results = []
+    for concurrency in args.concurrency:
+        for name, request_factory in runs:
+            result = run_load(args.url, request_factory, concurrency, args.duration)
+            results.append({"scenario": name, "concurrency": concurrency, **result})
+            print(
+                f"{name} x{concurrency}: {result['requests']} requests, "
+                f"{result['errors']} errors, {result['requests_per_second']:.0f} req/s, "
+                f"p50 {result['p50_ms']:.1f}ms, p95 {result['p95_ms']:.1f}ms, "
+                f"p99 {result['p99_ms']:.1f}ms"
+            )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "commit": git_commit(),
+                    "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                    "url": args.url,
+                    "paths": args.paths,
+                    "duration": args.duration,
+                    "runs": results,
+                },
+                file,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+bench_serialize.py
+
+Measures the JSON encoding of the issue lists returned by the API.
+
+The benchmark builds synthetic issue rows like the ones psycopg2 returns, and times how
+long turning them into a JSON response takes with:
+- manual: dicts written out by hand and flask's default JSON provider, as the API used to
+- json: dicts built from the cursor description (see serialize.py) and the json module
+- orjson: dicts built from the cursor description and orjson, if it is installed
+The database is not used.
+
+Usage (from the api directory):
+    python -m benchmarks.bench_serialize --rows 10000 100000
+"""
+
+import json
+import time
+import argparse
+import statistics
+from collections import namedtuple
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from serialize import FastJSONProvider, orjson, row_dicts
+from repositories import IssueRepository
+
+Column = namedtuple("Column", "name")
+
+
+def make_rows(count):
+    """
+    Returns synthetic issue rows and the description of their cursor.
+
+    :param count: Number of rows
+    :return: (rows, description)
+    """
+    statuses = ["New", "In Progress", "Done", "Closed"]
+    rows = [
+        (
+            i,
+            i % 1000 + 1,
+            f"Issue {i}",
+            "Bug" if i % 3 else "Feature",
+            f"Description of issue {i}, with a few more words to make it realistic",
+            statuses[i % 4],
+            "High" if i % 5 == 0 else None,
+            f"2023-01-{i % 28 + 1:02d} 10:00:00",
+            f"2023-02-{i % 28 + 1:02d} 11:30:00.250000" if i % 2 else None,
+            f"2023-03-{i % 28 + 1:02d} 00:00:00",
+            None,
+            ["backend", "urgent"] if i % 7 == 0 else [],
+        )
+        for i in range(1, count + 1)
+    ]
+    return rows, [Column(name) for name in IssueRepository.columns]
+
+
+def manual_dicts(rows, _description):
+    """
+    Builds the dicts of the rows by hand, as the API did before serialize.py.
+    """
+    return [
+        {
+            "id": row[0],
+            "project_id": row[1],
+            "title": row[2],
+            "type": row[3],
+            "description": row[4],
+            "status": row[5],
+            "priority": row[6],
+            "date_created": row[7],
+            "date_started": row[8],
+            "date_due": row[9],
+            "date_closed": row[10],
+            "labels": row[11],
+        }
+        for row in rows
+    ]
+
+
+def time_encoder(provider, to_dicts, rows, description, repeat):
+    """
+    Times building the response of the rows `repeat` times after a warm up run.
+
+    :return: (median duration in milliseconds, size of the response in bytes)
+    """
+    durations = []
+    size = 0
+    for _ in range(repeat + 1):
+        started = time.perf_counter()
+        response = provider.response(
+            {"message": to_dicts(rows, description), "next_cursor": None}
+        )
+        durations.append((time.perf_counter() - started) * 1000)
+        size = len(response.get_data())
+    return statistics.median(durations[1:]), size
+
+
+def main():
+    """
+    Command line entry point, see the module docstring.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    encoders = {
+        "manual": (DefaultJSONProvider(app), manual_dicts),
+        "json": (FastJSONProvider(app, serializer="json"), row_dicts),
+    }
+    if orjson is not None:
+        encoders["orjson"] = (FastJSONProvider(app, serializer="orjson"), row_dicts)
+    else:
+        print("orjson is not installed, skipping it")
+
+    results = {}
+    print(
+        f"{'rows':>8}{'encoder':>10}{'time (ms)':>12}{'size (KB)':>12}{'speedup':>10}"
+    )
+    for count in args.rows:
+        rows, description = make_rows(count)
+        results[count] = {}
+        for name, (provider, to_dicts) in encoders.items():
+            duration, size = time_encoder(
+                provider, to_dicts, rows, description, args.repeat
+            )
+            results[count][name] = {"ms": duration, "bytes": size}
+            speedup = results[count]["manual"]["ms"] / duration
+            print(
+                f"{count:>8}{name:>10}{duration:>12.1f}{size / 1024:>12.0f}"
+                f"{speedup:>9.1f}x"
+            )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"repeat": args.repeat, "results": results}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
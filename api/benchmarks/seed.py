@@ -0,0 +1,317 @@
+"""
+seed.py
+
+Fills the database of the API with synthetic projects and issues, for load tests (see
+bench_load.py).
+
+The data is generated by postgres itself, in batches of `--batch-size` issues per
+transaction, and looks like the data of a real tracker:
+- Statuses, priorities and types follow the weights of STATUSES, PRIORITIES and TYPES,
+  e.g. most issues are done and few are critical
+- Issues are spread unevenly: the first projects get many more issues than the last ones
+- Labels come from LABELS, the first ones much more often than the last ones, 0 to 3 per
+  issue, so that some label filters match many issues and others very few
+- Titles and descriptions are made of WORDS, so that searches (see search.py) match a
+  varied number of issues
+- Dates are spread over the last two years, and the start and close dates follow the
+  status: new issues have none, closed issues have both
+Rows go through the triggers of the tables, like writes of the API, so the search column,
+revisions and change events are filled as well.
+
+The database must be at the latest schema version (see migrations.py). With `--reset`
+every existing project and issue is deleted first. `--seed` makes the data reproducible.
+
+Usage (from the api directory, with POSTGRES_URL set):
+    python -m benchmarks.seed --projects 1000 --issues 1000000 --reset
+"""
+
+import os
+import time
+import argparse
+import psycopg2
+from migrations import check_migrations
+
+# Values and their weights
+STATUSES = {"New": 15, "Approved": 10, "In progress": 20, "Done": 40, "Closed": 15}
+PRIORITIES = {"Low": 30, "Medium": 45, "High": 20, "Critical": 5}
+TYPES = {"Bug": 35, "Task": 30, "Improvement": 15, "Feature": 15, "Other": 5}
+# Number of labels of an issue
+LABEL_COUNTS = {0: 20, 1: 45, 2: 25, 3: 10}
+# From the most to the least used
+LABELS = [
+    "backend",
+    "frontend",
+    "bug",
+    "api",
+    "ui",
+    "database",
+    "performance",
+    "needs-triage",
+    "docs",
+    "testing",
+    "security",
+    "auth",
+    "search",
+    "mobile",
+    "ci",
+    "accessibility",
+    "regression",
+    "notifications",
+    "billing",
+    "i18n",
+    "infra",
+    "good-first-issue",
+    "blocked",
+    "customer",
+    "design",
+    "analytics",
+    "export",
+    "email",
+    "onboarding",
+    "legacy",
+]
+WORDS = {
+    "verb": [
+        "Fix",
+        "Add",
+        "Improve",
+        "Update",
+        "Remove",
+        "Refactor",
+        "Investigate",
+        "Document",
+    ],
+    "subject": [
+        "login page",
+        "search results",
+        "issue list",
+        "dashboard",
+        "CSV export",
+        "rate limiting",
+        "password reset",
+        "notifications",
+        "project settings",
+        "file upload",
+        "date picker",
+        "mobile layout",
+        "sync",
+        "billing page",
+    ],
+    "problem": [
+        "crash on submit",
+        "slow loading",
+        "wrong sort order",
+        "missing validation",
+        "timeout",
+        "memory leak",
+        "broken link",
+        "layout glitch",
+        "typo",
+        "flaky test",
+        "stale cache",
+        "encoding error",
+    ],
+    "sentence": [
+        "Steps to reproduce are in the attached log.",
+        "This happens on every browser we tried.",
+        "Customers reported it after the last release.",
+        "The error only shows up with large projects.",
+        "We should add a regression test once it is fixed.",
+        "See the related discussion in the design review.",
+        "Workaround: reload the page and try again.",
+        "The query behind it scans the whole table.",
+    ],
+}
+
+
+def weighted(weights, column):
+    """
+    Returns an SQL expression picking a value by weight.
+
+    :param weights: dict of value -> weight
+    :param column: Column holding a random number between 0 and 1 for every row
+    :return: SQL CASE expression
+    """
+    total = sum(weights.values())
+    cases = []
+    cumulative = 0
+    for choice, weight in list(weights.items())[:-1]:
+        cumulative += weight
+        cases.append(f"WHEN {column} < {cumulative / total} THEN {sql_literal(choice)}")
+    return f"CASE {' '.join(cases)} ELSE {sql_literal(list(weights)[-1])} END"
+
+
+def sql_literal(value):
+    """
+    Returns an SQL literal of a constant of this module.
+    """
+    if isinstance(value, int):
+        return str(value)
+    return "'" + value.replace("'", "''") + "'"
+
+
+def pick(words, skew=1):
+    """
+    Returns an SQL expression picking one of a list, the first ones more often with a skew
+    above 1.
+    """
+    return (
+        f"(ARRAY[{', '.join(sql_literal(word) for word in words)}])"
+        f"[1 + floor({len(words)} * power(random(), {skew}))::int]"
+    )
+
+
+def insert_projects(cur, count):
+    """
+    Inserts projects.
+
+    :param cur: Cursor
+    :param count: Number of projects
+    :return: List of the ids of the new projects
+    """
+    cur.execute(
+        f"""
+        INSERT INTO projects (name, description, status, priority, date_created,
+                              date_started, date_closed, labels)
+        SELECT 'Project ' || g || ' ' || {pick(WORDS["subject"])},
+               {pick(WORDS["sentence"])},
+               status, {weighted(PRIORITIES, "r_priority")}, created,
+               started,
+               CASE WHEN status IN ('Done', 'Closed')
+                    THEN started + random() * least(interval '300 days', now() - started) END,
+               ARRAY[{pick(LABELS, 2)}]
+        FROM (
+          SELECT g, status, r_priority, created,
+                 CASE WHEN status <> 'New'
+                      THEN created + random() * least(interval '30 days', now() - created)
+                 END started
+          FROM (
+            SELECT g, {weighted(STATUSES, "r_status")} status, r_priority,
+                   now() - random() * interval '730 days' created
+            FROM (
+              SELECT g, random() r_status, random() r_priority
+              FROM generate_series(1, %s) g
+            ) r
+          ) s
+        ) p
+        RETURNING id
+        """,
+        (count,),
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def insert_issues(cur, count, project_ids):
+    """
+    Inserts issues into projects.
+
+    :param cur: Cursor
+    :param count: Number of issues
+    :param project_ids: Ids of the projects, the first ones get the most issues
+    """
+    cur.execute(
+        f"""
+        INSERT INTO issues (project_id, title, type, description, status, priority,
+                            date_created, date_started, date_due, date_closed, labels)
+        SELECT (%s::int[])[1 + floor(%s * power(random(), 2))::int],
+               {pick(WORDS["verb"])} || ' ' || {pick(WORDS["subject"])} || ': '
+                 || {pick(WORDS["problem"])},
+               {weighted(TYPES, "r_type")},
+               (SELECT string_agg({pick(WORDS["sentence"])}, ' ')
+                FROM generate_series(0, g %% 6)),
+               status, {weighted(PRIORITIES, "r_priority")}, created, started,
+               CASE WHEN random() < 0.6
+                    THEN created + interval '7 days' + random() * interval '90 days' END,
+               CASE WHEN status IN ('Done', 'Closed')
+                    THEN started + random() * least(interval '60 days', now() - started) END,
+               ARRAY(SELECT DISTINCT {pick(LABELS, 3)} FROM generate_series(1, label_count))
+        FROM (
+          SELECT g, status, created, r_type, r_priority,
+                 {weighted(LABEL_COUNTS, "r_labels")} label_count,
+                 CASE WHEN status IN ('In progress', 'Done', 'Closed')
+                      THEN created + random() * least(interval '30 days', now() - created)
+                 END started
+          FROM (
+            SELECT g, {weighted(STATUSES, "r_status")} status, r_type, r_priority, r_labels,
+                   now() - random() * interval '730 days' created
+            FROM (
+              SELECT g, random() r_status, random() r_type, random() r_priority,
+                     random() r_labels
+              FROM generate_series(1, %s) g
+            ) r
+          ) s
+        ) i
+        """,
+        (project_ids, len(project_ids), count),
+    )
+
+
+def seed(conn, projects, issues, batch_size, log=print):
+    """
+    Inserts projects and issues, see the module docstring.
+
+    :param conn: Connection to the database of the API
+    :param projects: Number of projects
+    :param issues: Number of issues, spread over the new projects
+    :param batch_size: Issues inserted per transaction
+    :param log: Function called with progress messages
+    """
+    with conn.cursor() as cur:
+        project_ids = insert_projects(cur, projects)
+        conn.commit()
+        log(f"Inserted {projects} projects")
+        inserted = 0
+        while inserted < issues:
+            batch = min(batch_size, issues - inserted)
+            started = time.perf_counter()
+            insert_issues(cur, batch, project_ids)
+            conn.commit()
+            inserted += batch
+            log(
+                f"Inserted {inserted}/{issues} issues "
+                f"({batch / (time.perf_counter() - started):.0f} rows/s)"
+            )
+
+
+def main():
+    """
+    Command line entry point, see the module docstring.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--projects", type=int, default=1_000)
+    parser.add_argument("--issues", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=100_000)
+    parser.add_argument("--seed", type=float, help="Seed between -1 and 1")
+    parser.add_argument(
+        "--reset", action="store_true", help="Delete every project and issue first"
+    )
+    args = parser.parse_args()
+    if args.projects < 1 or args.issues < 0 or args.batch_size < 1:
+        parser.error(
+            "--projects and --batch-size must be positive, --issues not negative"
+        )
+
+    dsn = os.environ["POSTGRES_URL"]
+    check_migrations(dsn)
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            if args.reset:
+                cur.execute("TRUNCATE issues, projects RESTART IDENTITY")
+            if args.seed is not None:
+                cur.execute("SELECT setseed(%s)", (args.seed,))
+        conn.commit()
+        started = time.perf_counter()
+        seed(conn, args.projects, args.issues, args.batch_size)
+        # Fresh statistics, so that the planner knows the new distributions
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("VACUUM ANALYZE projects")
+            cur.execute("VACUUM ANALYZE issues")
+        print(f"Seeded the database in {time.perf_counter() - started:.1f}s")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
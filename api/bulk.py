@@ -0,0 +1,242 @@
+"""
+bulk.py
+
+Contains the bulk creation and bulk update of issues.
+
+A bulk request holds many issues, either as a JSON array or as NDJSON (one JSON object per
+line, with a `Content-Type: application/x-ndjson` header). Every row is validated before
+anything is written, and the errors are reported per row. Valid requests are inserted in
+a single transaction with multi-row INSERTs of BULK_PAGE_SIZE rows each, which return the
+ids of the created issues in the order of the request.
+
+At most BULK_MAX_ROWS issues can be created by a single request.
+
+A bulk update applies the same `patch` of fields to every issue selected by a list of
+`ids` and/or a `filter`, with a single UPDATE statement.
+"""
+
+import os
+import json
+from psycopg2.extras import execute_values
+from werkzeug.datastructures import MultiDict
+from dbtypes import parse_columns
+from filters import ISSUE_RANGE_FILTERS, ISSUE_VALUE_FILTERS, parse_issue_filters
+from streaming import NDJSON_MIMETYPE
+
+BULK_MAX_ROWS = int(os.environ.get("BULK_MAX_ROWS", "50000"))
+BULK_PAGE_SIZE = int(os.environ.get("BULK_PAGE_SIZE", "1000"))
+
+# Columns of an issue that can be set on creation, in insert order
+ISSUE_COLUMNS = (
+    "title",
+    "description",
+    "type",
+    "status",
+    "priority",
+    "date_started",
+    "date_due",
+    "date_closed",
+    "labels",
+)
+ISSUE_REQUIRED = ("title", "type", "status")
+# Columns of an issue that can be changed by a bulk update
+PATCH_COLUMNS = ISSUE_COLUMNS + ("project_id",)
+# Filters that can select the issues of a bulk update, besides project_id
+FILTER_NAMES = set(ISSUE_VALUE_FILTERS) | set(ISSUE_RANGE_FILTERS) | {"label"}
+
+
+class BulkError(Exception):
+    """
+    Raised when the body of a bulk request cannot be read as a list of rows.
+
+    :param message: Error message
+    :param status: HTTP status code of the error response
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def read_rows(request):
+    """
+    Reads the rows of a bulk request.
+
+    Lines of an NDJSON body that are not valid JSON are returned as the error message
+    of the row, so that they are reported with the other invalid rows.
+
+    :param request: Flask request
+    :return: List of rows, each a dict or an error string
+    :raises BulkError: If the body is not a JSON array or NDJSON, or has too many rows
+    """
+    if request.mimetype == NDJSON_MIMETYPE:
+        rows = []
+        for number, line in enumerate(request.get_data(as_text=True).splitlines()):
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError as e:
+                rows.append(f"Line {number + 1} is not valid JSON: {e}")
+    else:
+        rows = request.get_json(silent=True)
+        if not isinstance(rows, list):
+            raise BulkError(
+                "Could not parse the issues. Send a JSON array or NDJSON "
+                f"({NDJSON_MIMETYPE})",
+                415,
+            )
+    if not rows:
+        raise BulkError("No issues to add")
+    if len(rows) > BULK_MAX_ROWS:
+        raise BulkError(
+            f"Too many issues: {len(rows)}. At most {BULK_MAX_ROWS} can be added at once",
+            413,
+        )
+    return rows
+
+
+def validate_issue(row):
+    """
+    Validates a row of a bulk request and returns the values to insert.
+
+    :param row: dict of the issue, or the error string returned by read_rows
+    :return: Tuple of values in ISSUE_COLUMNS order
+    :raises ValueError: If the row is invalid
+    """
+    if isinstance(row, str):
+        raise ValueError(row)
+    if not isinstance(row, dict):
+        raise ValueError("Each issue must be a JSON object")
+    missing = [field for field in ISSUE_REQUIRED if not row.get(field)]
+    if missing:
+        raise ValueError(f"Missing required fields: {', '.join(missing)}")
+    data = parse_columns({column: row.get(column) for column in ISSUE_COLUMNS})
+    return tuple(data.values())
+
+
+def validate_issues(rows):
+    """
+    Validates every row of a bulk request.
+
+    :param rows: Rows returned by read_rows
+    :return: (values of the valid rows, list of {"index", "message"} for the invalid rows)
+    """
+    values = []
+    errors = []
+    for index, row in enumerate(rows):
+        try:
+            values.append(validate_issue(row))
+        except ValueError as e:
+            errors.append({"index": index, "message": str(e)})
+    return values, errors
+
+
+def insert_issues(cur, project_id, values):
+    """
+    Inserts the validated issues of a project. The caller commits.
+
+    :param cur: Cursor of the transaction
+    :param project_id: ID of the project of the issues
+    :param values: Values returned by validate_issues
+    :return: List of the created ids, in the order of the values
+    """
+    columns = ", ".join(ISSUE_COLUMNS)
+    rows = execute_values(
+        cur,
+        f"INSERT INTO issues (project_id, {columns}) VALUES %s RETURNING id",
+        [(project_id,) + row for row in values],
+        page_size=BULK_PAGE_SIZE,
+        fetch=True,
+    )
+    return [row[0] for row in rows]
+
+
+def is_id(value):
+    """
+    Returns whether a JSON value is a row id. JSON booleans are not ids, although bool is
+    a subclass of int.
+
+    :param value: Parsed JSON value
+    :return: Whether the value is an integer id
+    """
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_issue_selection(data):
+    """
+    Builds the conditions selecting the issues of a bulk update.
+
+    Issues are selected by a list of `ids`, or by a `filter` object taking the filters of
+    the issue list endpoints (see filters.py) and `project_id`, or both.
+
+    :param data: Body of the bulk update
+    :return: (conditions, params) to be used in a WHERE clause
+    :raises ValueError: If the selection is missing or invalid
+    """
+    conditions = []
+    params = []
+    ids = data.get("ids")
+    if ids is not None:
+        if not isinstance(ids, list) or not all(is_id(issue_id) for issue_id in ids):
+            raise ValueError("ids must be a list of issue ids")
+        conditions.append("id = ANY(%s)")
+        params.append(ids)
+
+    selection = data.get("filter")
+    if selection is not None:
+        if not isinstance(selection, dict):
+            raise ValueError("filter must be an object")
+        selection = dict(selection)
+        project_ids = selection.pop("project_id", None)
+        if project_ids is not None:
+            if not isinstance(project_ids, list):
+                project_ids = [project_ids]
+            if not all(is_id(project_id) for project_id in project_ids):
+                raise ValueError(
+                    "filter.project_id must be a project id or a list of them"
+                )
+            conditions.append("project_id = ANY(%s)")
+            params.append(project_ids)
+        args = MultiDict(
+            [
+                (name, str(value))
+                for name, values in selection.items()
+                for value in (values if isinstance(values, list) else [values])
+            ]
+        )
+        unknown = set(args) - FILTER_NAMES
+        if unknown:
+            raise ValueError(f"Unknown filters: {', '.join(sorted(unknown))}")
+        filter_conditions, filter_params = parse_issue_filters(args)
+        conditions += filter_conditions
+        params += filter_params
+
+    if not conditions:
+        raise ValueError("Select the issues to update with ids or a non-empty filter")
+    return conditions, params
+
+
+def parse_issue_patch(data):
+    """
+    Builds the assignments of a bulk update.
+
+    :param data: Body of the bulk update, with the new values in `patch`
+    :return: (assignments, params) to be used in a SET clause
+    :raises ValueError: If the patch is missing or invalid
+    """
+    patch = data.get("patch")
+    if not isinstance(patch, dict) or not patch:
+        raise ValueError("patch must be an object with the fields to update")
+    unknown = set(patch) - set(PATCH_COLUMNS)
+    if unknown:
+        raise ValueError(f"Fields cannot be updated: {', '.join(sorted(unknown))}")
+    for field in ISSUE_REQUIRED + ("project_id",):
+        if field in patch and not patch[field]:
+            raise ValueError(f"{field} cannot be empty")
+    if "project_id" in patch and not is_id(patch["project_id"]):
+        raise ValueError("project_id must be a project id")
+    patch = parse_columns(dict(patch))
+    # Columns come from PATCH_COLUMNS, never from the request
+    columns = [column for column in PATCH_COLUMNS if column in patch]
+    return [f"{column} = %s" for column in columns], [patch[c] for c in columns]
@@ -0,0 +1,387 @@
+"""
+cache.py
+
+Contains the optional in-process cache of the read endpoints of the API.
+
+Responses of the project and issue reads are kept in memory, keyed by URL and by the
+request headers they vary on (Accept, see etags.py), so that reading the same project or
+issue again does not query the database. Streamed responses are not
+cached. The cache is bounded:
+- At most READ_CACHE_SIZE entries are kept, the least recently used one is evicted first.
+  READ_CACHE_SIZE=0 (the default) disables the cache.
+- Entries expire READ_CACHE_TTL seconds after they were stored
+
+Entries are stored with tags naming the data they were built from (e.g. "project:3", ids
+are the integers parsed from the URL). Write handlers commit through the cache, which
+invalidates the tags of the data they changed once their transaction is committed:
+- projects: lists of projects
+- project:<id>: a project
+- issues: lists of issues and project statistics
+- issue:<id>: an issue
+- issue_rows: every single issue, for writes that change unknown issues
+
+A read that started before an invalidation of its process does not store its (possibly
+stale) result. Invalidations sent by other processes only arrive after the write was
+committed: a read that started before the commit and ended before the invalidation arrived
+does store its stale result, which is then dropped by the invalidation. Other processes
+may thus answer with the data from before a write for as long as its NOTIFY takes to
+arrive, usually milliseconds, but never until the entries expire. Invalidations missed
+while the listening connection was down are covered by dropping every entry once it is
+back.
+
+Other API processes are told about invalidations through the backend chosen with
+READ_CACHE_BACKEND:
+- local (default): no other process is told, for a single API process
+- postgres: invalidations are sent with NOTIFY on the READ_CACHE_CHANNEL channel and every
+  process LISTENs to it on a background thread. The NOTIFY is sent on the connection of the
+  write, in its transaction: postgres delivers it once the write is committed, and writes
+  never wait for another connection of the pool
+
+Writes that do not go through the API are only seen once the entries expire.
+"""
+
+import os
+import json
+import time
+import uuid
+import select
+import threading
+from collections import OrderedDict
+import psycopg2
+import psycopg2.extensions
+from flask import Response, g, jsonify, request
+from streaming import get_stream_format
+
+READ_CACHE_SIZE = int(os.environ.get("READ_CACHE_SIZE", "0"))
+READ_CACHE_TTL = float(os.environ.get("READ_CACHE_TTL", "30"))
+READ_CACHE_BACKEND = os.environ.get("READ_CACHE_BACKEND", "local")
+READ_CACHE_CHANNEL = os.environ.get("READ_CACHE_CHANNEL", "trackify_cache")
+
+
+class LocalInvalidation:
+    """
+    Invalidation backend for a single API process, invalidations are not sent anywhere.
+    """
+
+    def start(self, callback):
+        """
+        Starts receiving the invalidations of other processes.
+
+        :param callback: Function called with the tags invalidated by another process,
+                         or None when every entry must be dropped
+        """
+
+    def publish(self, cur, tags):
+        """
+        Sends invalidated tags to the other processes once a transaction is committed.
+
+        :param cur: Cursor of the transaction
+        :param tags: List of tags
+        """
+
+
+class PostgresInvalidation:
+    """
+    Invalidation backend sending the invalidations to every API process with postgres
+    NOTIFY, each process listening on its own connection.
+    """
+
+    def __init__(self, dsn, channel=READ_CACHE_CHANNEL):
+        """
+        :param dsn: Connection string of the database, for the listening connection
+        :param channel: Name of the notification channel
+        """
+        self.dsn = dsn
+        self.channel = channel
+        # Lets a process skip its own invalidations, which it already applied
+        self.sender = uuid.uuid4().hex
+
+    def start(self, callback):
+        """
+        Starts the background thread listening to the invalidations of other processes.
+
+        :param callback: Function called with the tags invalidated by another process,
+                         or None when every entry must be dropped
+        """
+        self.sender = uuid.uuid4().hex
+        thread = threading.Thread(
+            target=self._listen,
+            args=(callback,),
+            name="read-cache-listener",
+            daemon=True,
+        )
+        thread.start()
+
+    def _listen(self, callback):
+        """
+        Listens forever, reconnecting after errors. Invalidations sent while the
+        connection was down are lost, so every entry is dropped after reconnecting.
+        """
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f'LISTEN "{self.channel}"')
+                callback(None)
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        message = json.loads(conn.notifies.pop(0).payload)
+                        if message["sender"] != self.sender:
+                            callback(message["tags"])
+            except (psycopg2.Error, OSError, ValueError):
+                if conn is not None:
+                    conn.close()
+                time.sleep(1)
+
+    def publish(self, cur, tags):
+        """
+        Sends invalidated tags to the other processes once a transaction is committed.
+
+        :param cur: Cursor of the transaction
+        :param tags: List of tags
+        :raises psycopg2.Error: If the notification could not be queued
+        """
+        payload = json.dumps({"sender": self.sender, "tags": tags})
+        cur.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+
+
+class ReadCache:  # pylint: disable=too-many-instance-attributes
+    """
+    Thread-safe LRU cache with a time to live and invalidation by tag.
+    """
+
+    def __init__(self, size=READ_CACHE_SIZE, ttl=READ_CACHE_TTL, backend=None):
+        """
+        :param size: Maximum number of entries, 0 disables the cache
+        :param ttl: Seconds an entry is kept
+        :param backend: Invalidation backend, LocalInvalidation by default
+        """
+        self.size = size
+        self.ttl = ttl
+        self.backend = backend or LocalInvalidation()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._reset()
+
+    @property
+    def enabled(self):
+        """
+        Whether the cache keeps entries.
+        """
+        return self.size > 0
+
+    def _reset(self):
+        # key -> (expiry time, value, tags), least recently used first
+        self._entries = OrderedDict()
+        # tag -> keys of the entries with that tag
+        self._tags = {}
+        # Incremented by every invalidation, see token()
+        self._generation = 0
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+            "stale_fills": 0,
+        }
+
+    def _check_process(self):
+        """
+        Starts the backend in every process, entries are not shared with forked children.
+        Must be called while holding the lock.
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._reset()
+            self.backend.start(self._receive)
+
+    def _remove(self, key):
+        """
+        Removes an entry and its tags. Must be called while holding the lock.
+        """
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def token(self):
+        """
+        Returns the token to pass to `set` for a value read from now on.
+        """
+        with self._lock:
+            self._check_process()
+            return self._generation
+
+    def get(self, key):
+        """
+        Returns the value stored for a key, or None if there is none or it expired.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._check_process()
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            if entry[0] <= time.monotonic():
+                self._remove(key)
+                self._counters["expirations"] += 1
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return entry[1]
+
+    def set(self, key, value, tags, token):
+        """
+        Stores a value, unless an invalidation happened since `token` was taken.
+
+        :param key: Key of the entry
+        :param value: Value to store
+        :param tags: Tags of the data the value was built from
+        :param token: Token returned by `token()` before the value was read
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._check_process()
+            if token != self._generation:
+                self._counters["stale_fills"] += 1
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.size:
+                self._remove(next(iter(self._entries)))
+                self._counters["evictions"] += 1
+
+    def _invalidate_local(self, tags):
+        """
+        Drops the entries with any of the tags, or every entry if tags is None.
+        """
+        with self._lock:
+            self._generation += 1
+            self._counters["invalidations"] += 1
+            if tags is None:
+                keys = list(self._entries)
+            else:
+                keys = {key for tag in tags for key in self._tags.get(tag, ())}
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+
+    def _receive(self, tags):
+        """
+        Applies an invalidation received from another process.
+        """
+        self._invalidate_local(tags)
+
+    def commit(self, conn, *tags):
+        """
+        Commits a write, then drops the entries with any of the tags, in this and in the
+        other processes.
+
+        :param conn: Connection of the write transaction
+        :param tags: Tags of the changed data, none to drop every entry
+        :raises psycopg2.Error: If the transaction could not be committed
+        """
+        tags = list(tags) or None
+        if self.enabled:
+            with conn.cursor() as cur:
+                self.backend.publish(cur, tags)
+        conn.commit()
+        if self.enabled:
+            self._invalidate_local(tags)
+
+    def stats(self):
+        """
+        Returns the usage statistics of the cache.
+
+        :return: dict with the configuration, size and counters of the cache
+        """
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                "enabled": self.enabled,
+                "max_size": self.size,
+                "ttl": self.ttl,
+                "backend": type(self.backend).__name__,
+                "size": len(self._entries),
+                **self._counters,
+                "hit_ratio": self._counters["hits"] / lookups if lookups else 0.0,
+            }
+
+
+def create_cache(dsn):
+    """
+    Creates the read cache configured by the READ_CACHE_* environment variables.
+
+    :param dsn: Connection string of the database
+    :return: ReadCache
+    :raises ValueError: If READ_CACHE_BACKEND is unknown
+    """
+    if READ_CACHE_BACKEND == "local":
+        backend = LocalInvalidation()
+    elif READ_CACHE_BACKEND == "postgres":
+        backend = PostgresInvalidation(dsn)
+    else:
+        raise ValueError(
+            f"Invalid READ_CACHE_BACKEND: {READ_CACHE_BACKEND}. Use local or postgres"
+        )
+    return ReadCache(backend=backend)
+
+
+def cache_key():
+    """
+    Returns the key of the response of the current request: its URL and the request
+    headers the response varies on.
+    """
+    return request.full_path, request.headers.get("Accept", "")
+
+
+def cached_response(cache):
+    """
+    Returns the cached response of the current request, if there is one.
+
+    The ETag stored with the response is used for conditional GETs, see etags.py.
+
+    :param cache: ReadCache
+    :return: Flask response, 304 response, or None if the response is not cached
+    """
+    # Streamed responses share their URL with the JSON ones and are never cached
+    if get_stream_format() is not None:
+        return None
+    entry = cache.get(cache_key())
+    if entry is None:
+        return None
+    payload, etag = entry
+    g.etag = etag
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return jsonify(payload)
+
+
+def cache_response(cache, payload, tags, token):
+    """
+    Stores the response of the current request with the ETag computed for it.
+
+    :param cache: ReadCache
+    :param payload: JSON payload of the response
+    :param tags: Tags of the data the response was built from
+    :param token: Token returned by `cache.token()` before the data was read
+    """
+    cache.set(cache_key(), (payload, g.get("etag")), tags, token)
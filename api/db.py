@@ -0,0 +1,314 @@
+"""
+db.py
+
+Contains the database connection pool shared by every route handler in the API.
+
+Opening a new connection to postgres for every request means paying for the TCP and
+authentication handshake each time, and bursts of requests can run into the server's
+max_connections limit. Instead, each API process keeps a bounded set of open connections
+that the handlers borrow and give back.
+
+Pool behavior:
+- At most `maxconn` connections are open at once, `minconn` are opened up front
+- A checkout waits up to `timeout` seconds for a free connection before giving up
+- A connection that sat idle for longer than `check_after` seconds is pinged before
+  being handed out, and replaced if the ping fails
+- Connections that come back closed, or that cannot be rolled back, are discarded
+- Usage statistics (in use, idle, wait time, ...) are available through `stats()`
+- An optional `configure` function sets up every new connection (types, session settings)
+- An optional `on_checkout` function is called with the wait of every checkout (metrics)
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+
+class PoolTimeout(psycopg2.pool.PoolError):  # pylint: disable=too-few-public-methods
+    """
+    Raised when no connection could be checked out before the checkout timeout.
+    """
+
+
+class ConnectionPool:  # pylint: disable=too-many-instance-attributes
+    """
+    Thread-safe pool of psycopg2 connections.
+
+    Connections are opened lazily, so creating the pool does not require the database
+    to be reachable yet.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        dsn,
+        minconn=1,
+        maxconn=10,
+        timeout=10.0,
+        check_after=30.0,
+        configure=None,
+        on_checkout=None,
+    ):
+        """
+        :param dsn: Connection string of the database
+        :param minconn: Number of connections opened when the pool is first used
+        :param maxconn: Maximum number of connections open at the same time
+        :param timeout: Seconds a checkout waits for a free connection
+        :param check_after: Seconds a connection may sit idle before it is pinged on checkout
+        :param configure: Function called with every new connection before it is handed out
+        :param on_checkout: Function called with the seconds every checkout waited
+        """
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(
+                "Pool sizes must satisfy 0 <= minconn <= maxconn and maxconn >= 1"
+            )
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_after = check_after
+        self.configure = configure
+        self.on_checkout = on_checkout
+        self._lock = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        """
+        Forget every connection. Used on creation and after the process was forked,
+        since connections must not be shared between processes.
+        """
+        self._pid = os.getpid()
+        # Idle connections as (connection, time it was returned) pairs, most recent last
+        self._idle = []
+        self._in_use = set()
+        self._opening = 0
+        self._started = False
+        self._counters = {
+            "connections_opened": 0,
+            "connections_discarded": 0,
+            "checkouts": 0,
+            "checkout_timeouts": 0,
+            "checkout_waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+
+    def _connect(self, idle=False):
+        """
+        Open a new connection, counted in `_opening` until it is added to the idle or
+        checked out connections. Must be called without holding the lock.
+
+        :param idle: Whether to add the connection to the idle ones instead of checking
+                     it out
+        """
+        try:
+            conn = psycopg2.connect(self.dsn)
+            if self.configure is not None:
+                try:
+                    self.configure(conn)
+                except Exception:
+                    conn.close()
+                    raise
+        except Exception:
+            with self._lock:
+                self._opening -= 1
+                self._lock.notify()
+            raise
+        # In the same block, so that the pool size never misses the connection
+        with self._lock:
+            self._opening -= 1
+            self._counters["connections_opened"] += 1
+            if idle:
+                self._idle.append((conn, time.monotonic()))
+                self._lock.notify()
+            else:
+                self._in_use.add(conn)
+        return conn
+
+    def _size(self):
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _healthy(self, conn, idle_since):
+        """
+        Returns whether an idle connection can be handed out.
+        """
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        with self._lock:
+            self._counters["connections_discarded"] += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _start(self):
+        """
+        Open the first `minconn` connections. Failures are left for checkouts to report.
+        """
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        while True:
+            with self._lock:
+                if self._size() >= self.minconn:
+                    return
+                self._opening += 1
+            try:
+                self._connect(idle=True)
+            except psycopg2.Error:
+                return
+
+    def getconn(self):
+        """
+        Check out a connection, waiting up to the pool timeout for one to become free.
+
+        :return: An open psycopg2 connection
+        :raises PoolTimeout: If no connection became available in time
+        :raises psycopg2.Error: If a new connection could not be opened
+        """
+        self._check_fork()
+        if not self._started:
+            self._start()
+        requested = time.monotonic()
+        deadline = requested + self.timeout
+        waited = False
+        while True:
+            with self._lock:
+                while not self._idle and self._size() >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters["checkout_timeouts"] += 1
+                        raise PoolTimeout(
+                            f"No database connection available after {self.timeout} seconds"
+                        )
+                    waited = True
+                    self._lock.wait(remaining)
+                conn, idle_since = None, 0.0
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    self._in_use.add(conn)
+                else:
+                    self._opening += 1
+            if conn is None:
+                conn = self._connect()
+                break
+            if self._healthy(conn, idle_since):
+                break
+            # Broken idle connection, drop it and try again
+            with self._lock:
+                self._in_use.discard(conn)
+                self._lock.notify()
+            self._discard(conn)
+
+        wait_time = time.monotonic() - requested
+        with self._lock:
+            self._counters["checkouts"] += 1
+            self._counters["wait_time_total"] += wait_time
+            self._counters["wait_time_max"] = max(
+                self._counters["wait_time_max"], wait_time
+            )
+            if waited:
+                self._counters["checkout_waits"] += 1
+        if self.on_checkout is not None:
+            self.on_checkout(wait_time)
+        return conn
+
+    def putconn(self, conn, broken=False):
+        """
+        Give a connection back to the pool.
+
+        Any open transaction is rolled back. Closed or broken connections are discarded
+        instead of being reused.
+
+        :param conn: Connection obtained from `getconn`
+        :param broken: Whether the caller knows the connection is unusable
+        """
+        with self._lock:
+            if conn not in self._in_use:
+                # Checked out before a fork, or not ours
+                return
+        if not broken and not conn.closed:
+            try:
+                if (
+                    conn.get_transaction_status()
+                    != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+                ):
+                    conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        broken = broken or bool(conn.closed)
+        with self._lock:
+            self._in_use.discard(conn)
+            if not broken:
+                self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+        if broken:
+            self._discard(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for the duration of a `with` block.
+
+        :return: Context manager yielding an open psycopg2 connection
+        """
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = bool(conn.closed)
+            raise
+        finally:
+            self.putconn(conn, broken=broken)
+
+    def closeall(self):
+        """
+        Close every idle connection. Connections in use are closed when they come back.
+        """
+        with self._lock:
+            idle = self._idle
+            self._idle = []
+            self._started = False
+        for conn, _ in idle:
+            conn.close()
+
+    def stats(self):
+        """
+        Returns a snapshot of the pool usage.
+
+        :return: dict of pool sizes and counters, times are in seconds
+        """
+        with self._lock:
+            stats = {
+                "min": self.minconn,
+                "max": self.maxconn,
+                "size": self._size(),
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                **self._counters,
+            }
+        checkouts = stats["checkouts"]
+        stats["wait_time_avg"] = (
+            stats["wait_time_total"] / checkouts if checkouts else 0.0
+        )
+        return stats
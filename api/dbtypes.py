@@ -0,0 +1,117 @@
+"""
+dbtypes.py
+
+Contains the conversions between the column types of the database and the JSON format of
+the API.
+
+Dates are stored as timestamptz and labels as text[] (see migration 0002). The API keeps
+the date format it always returned, "YYYY-MM-DD HH:MM:SS[.ffffff]" in UTC, and returns
+labels as JSON arrays. Dates sent to the API must be ISO 8601, dates without a time zone
+are taken as UTC. Labels are sent as an array, or as a comma separated string.
+"""
+
+from datetime import datetime as dt, timezone
+import psycopg2.extensions
+
+TIMESTAMPTZ_OID = 1184
+
+# Request fields holding dates and labels, for projects and issues
+DATE_FIELDS = ("date_created", "date_started", "date_due", "date_closed")
+LABELS_FIELD = "labels"
+
+
+def cast_timestamptz(value, cur):
+    """
+    Returns a timestamptz fetched from the database in the date format of the API.
+
+    Connections are set to UTC by `configure_connection`, so postgres sends
+    "2024-01-31 10:00:00.123456+00" and only the offset has to be dropped.
+
+    :param value: Text of the timestamptz sent by postgres, or None
+    :param cur: Cursor the value was fetched with
+    :return: Date string or None
+    """
+    if value is None:
+        return None
+    if value.endswith("+00"):
+        return value[:-3]
+    parsed = psycopg2.extensions.PYDATETIMETZ(value, cur)
+    return str(parsed.astimezone(timezone.utc).replace(tzinfo=None))
+
+
+TIMESTAMPTZ_AS_TEXT = psycopg2.extensions.new_type(
+    (TIMESTAMPTZ_OID,), "TIMESTAMPTZ_AS_TEXT", cast_timestamptz
+)
+
+
+def configure_connection(conn):
+    """
+    Sets up a new connection to return dates in the format of the API.
+
+    :param conn: Open psycopg2 connection
+    """
+    psycopg2.extensions.register_type(TIMESTAMPTZ_AS_TEXT, conn)
+    with conn.cursor() as cur:
+        cur.execute("SET TIME ZONE 'UTC'")
+    conn.commit()
+
+
+def parse_timestamp(value):
+    """
+    Validates a date sent to the API.
+
+    :param value: ISO 8601 date string, datetime or None
+    :return: Value to store, dates without a time zone are taken as UTC
+    :raises ValueError: If the value is not a date
+    """
+    if value is None:
+        return None
+    if isinstance(value, dt):
+        parsed = value
+    elif isinstance(value, str):
+        try:
+            parsed = dt.fromisoformat(value.strip())
+        except ValueError as e:
+            raise ValueError(
+                f"Invalid date: {value}. Use an ISO 8601 date, e.g. 2024-01-31"
+            ) from e
+    else:
+        raise ValueError(
+            f"Invalid date: {value}. Use an ISO 8601 date, e.g. 2024-01-31"
+        )
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def parse_labels(value):
+    """
+    Validates the labels sent to the API.
+
+    :param value: List of labels, comma separated string or None
+    :return: List of labels or None
+    :raises ValueError: If the value is not a list of strings
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [label.strip() for label in value.split(",") if label.strip()]
+    if isinstance(value, list) and all(isinstance(label, str) for label in value):
+        return value
+    raise ValueError(f"Invalid labels: {value}. Use a list of strings")
+
+
+def parse_columns(data):
+    """
+    Validates the date and label fields of a project or issue sent to the API.
+
+    :param data: dict of field -> value, changed in place
+    :return: The same dict
+    :raises ValueError: If a date or the labels are invalid
+    """
+    for field in DATE_FIELDS:
+        if field in data:
+            data[field] = parse_timestamp(data[field])
+    if LABELS_FIELD in data:
+        data[LABELS_FIELD] = parse_labels(data[LABELS_FIELD])
+    return data
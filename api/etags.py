@@ -0,0 +1,109 @@
+"""
+etags.py
+
+Contains the conditional GET support of the read endpoints of the API.
+
+Every read response carries a strong ETag derived from the versions of the data it depends
+on (see migration 0005), the URL and the Accept header of the request. A client
+sending that ETag back in If-None-Match gets a 304 Not Modified response as long as the
+data did not change, without the API running the query or encoding the JSON.
+
+The versions are read before the data, so a response is never tagged with a version newer
+than its data: a write committed in between only costs the client one more full response.
+
+Responses that depend on the current time (the overdue counts of the project statistics)
+also change their ETag every ETAG_VOLATILE_SECONDS.
+"""
+
+import os
+import time
+import hashlib
+from flask import Response, g, request
+
+ETAG_VOLATILE_SECONDS = int(os.environ.get("ETAG_VOLATILE_SECONDS", "60"))
+
+
+def versions_query(tables=(), project_id=None):
+    """
+    Returns the query of the current versions of the given tables and project.
+
+    The query returns one "name:version" row per table, sorted by name, then a
+    "project:version" row for the project, with version 0 if it was never written.
+
+    :param tables: Names of the tables the response depends on
+    :param project_id: ID of the project the response depends on, if any
+    :return: (query, params), or None if there is nothing to read
+    """
+    parts = []
+    params = []
+    if tables:
+        # The latest writer below the xmin of the snapshot, then the visible writers
+        # from the xmin on, see migration 0005
+        parts.append(
+            "(SELECT name || ':' || coalesce((SELECT max(xid) FROM table_writes"
+            " WHERE table_writes.name = tables.name AND xid < snapshot_xmin)::text, '0')"
+            " || coalesce((SELECT string_agg(' ' || xid, '' ORDER BY xid)"
+            " FROM table_writes"
+            " WHERE table_writes.name = tables.name AND xid >= snapshot_xmin), '')"
+            " FROM unnest(%s::text[]) tables (name),"
+            " pg_snapshot_xmin(pg_current_snapshot()) snapshot_xmin ORDER BY name)"
+        )
+        params.append(list(tables))
+    if project_id is not None:
+        parts.append(
+            "(SELECT 'project:' || coalesce((SELECT version FROM project_versions"
+            " WHERE project_id = %s), 0))"
+        )
+        params.append(project_id)
+    if not parts:
+        return None
+    return " UNION ALL ".join(parts), params
+
+
+async def conditional_get(db, tables=(), project_id=None, volatile=False):
+    """
+    Computes the ETag of the current request and checks it against If-None-Match.
+
+    The ETag is added to the response by `add_etag` once the handler returns.
+
+    :param db: Database access of the read endpoints, see aiodb.py
+    :param tables: Names of the tables the response depends on
+    :param project_id: ID of the project the response depends on, if any
+    :param volatile: Whether the response also depends on the current time
+    :return: 304 response if the client has the current version, otherwise None
+    :raises psycopg2.Error: If the versions could not be read
+    """
+    parts = []
+    query = versions_query(tables, project_id)
+    if query is not None:
+        rows, _ = await db.fetch(*query)
+        parts = [row[0] for row in rows]
+    parts += [request.full_path, request.headers.get("Accept", "")]
+    if volatile:
+        parts.append(str(int(time.time() // ETAG_VOLATILE_SECONDS)))
+    etag = hashlib.sha1("\n".join(parts).encode()).hexdigest()
+    g.etag = etag
+    # Weak comparison, nginx turns the ETag into a weak one when it compresses the response
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+def add_etag(response):
+    """
+    Adds the ETag computed by `conditional_get` to a successful response.
+
+    Registered with `app.after_request`.
+
+    :param response: Response of the handler
+    :return: The same response
+    """
+    etag = g.pop("etag", None)
+    if etag is not None and response.status_code == 200:
+        response.set_etag(etag)
+        # Let browsers keep the response, but always check with the API before using it
+        response.headers["Cache-Control"] = "no-cache"
+        response.vary.add("Accept")
+    return response
@@ -0,0 +1,453 @@
+"""
+events.py
+
+Contains the change feed of the API, streamed to clients as Server-Sent Events by /events.
+
+Every write to the projects and issues adds events to the change_events table and sends a
+NOTIFY, see migrations/0007_change_events.sql. Each API process has a single listener: a
+background thread LISTENing on its own connection, which reads the new events from the
+table and keeps the latest EVENTS_BUFFER_SIZE (default 1000) of them in memory. Every
+client of /events is then served from that buffer, without a connection of its own.
+
+Events are sent in the order of their position, the (revision, id) of the event: the
+revision of the transaction that wrote it, as in the delta sync (see sync.py), then its
+id. Events are only read once every transaction with a smaller revision is over, see
+migrations/0007_change_events.sql, so that no event committed later comes before the
+events already sent. A transaction left open holds back the events of the transactions
+that started after it until it ends, see trackify_db_revision_horizon_lag in metrics.py.
+The listener reads them again on the next NOTIFY, sent by the commit of any write to the
+projects or issues. Transactions that only wrote to other tables end without one, so held
+back events are also read again after EVENTS_HELD_BACK_SECONDS, a delay doubled up to
+EVENTS_HELD_BACK_MAX_SECONDS while they stay held back.
+
+Query parameters and headers of /events:
+project_id - Only the events of the given project (and the truncations of the tables)
+Last-Event-ID - Id of the last event the client received, sent again by browsers when they
+                reconnect. Missed events are sent first, from the buffer or the table.
+                Also accepted as the `last_event_id` query parameter.
+
+Each event holds the table, the operation (insert, update, delete or truncate), the id of
+the row, its project and its revision. Clients read the changed data from the other
+endpoints. Events are kept EVENTS_RETENTION_HOURS (default 24) in the table: a client
+resuming from an older event gets a `reset` event instead, and must read its data again.
+
+A stream holds a request thread of the API while it is open (see gunicorn.conf.py), so at
+most EVENTS_MAX_CLIENTS (default half of GUNICORN_THREADS) streams are served per process,
+the other threads are left to the other requests. A stream ends after EVENTS_STREAM_SECONDS
+(default 300) seconds, browsers reconnect on their own.
+"""
+
+import os
+import json
+import time
+import select
+import threading
+from collections import deque
+import psycopg2
+import psycopg2.extensions
+from dbtypes import configure_connection
+from sync import SYNC_RETENTION_DAYS
+
+# Channel the triggers notify, see the migration
+EVENTS_CHANNEL = "trackify_events"
+EVENTS_BUFFER_SIZE = int(os.environ.get("EVENTS_BUFFER_SIZE", "1000"))
+EVENTS_MAX_CLIENTS = int(
+    os.environ.get(
+        "EVENTS_MAX_CLIENTS",
+        str(max(1, int(os.environ.get("GUNICORN_THREADS", "4")) // 2)),
+    )
+)
+EVENTS_STREAM_SECONDS = float(os.environ.get("EVENTS_STREAM_SECONDS", "300"))
+EVENTS_RETENTION_HOURS = float(os.environ.get("EVENTS_RETENTION_HOURS", "24"))
+# Seconds between the comments sent to keep idle streams open through proxies
+EVENTS_KEEPALIVE = float(os.environ.get("EVENTS_KEEPALIVE", "15"))
+# Seconds before the first and the latest read of events held back by an open transaction,
+# when no NOTIFY wakes the listener before, see the module docstring
+EVENTS_HELD_BACK_SECONDS = float(os.environ.get("EVENTS_HELD_BACK_SECONDS", "0.1"))
+EVENTS_HELD_BACK_MAX_SECONDS = float(
+    os.environ.get("EVENTS_HELD_BACK_MAX_SECONDS", "5")
+)
+
+EVENT_COLUMNS = (
+    "id",
+    "revision",
+    "table_name",
+    "operation",
+    "row_id",
+    "project_id",
+    "date_created",
+)
+# Events read from the table at once
+EVENTS_BATCH_SIZE = 1000
+
+
+def event_position(event):
+    """
+    Returns the position of an event in the feed, its (revision, id).
+    """
+    return (event["revision"], event["id"])
+
+
+class ChangeFeed:  # pylint: disable=too-many-instance-attributes
+    """
+    Shared listener of the change events of an API process, see the module docstring.
+    """
+
+    def __init__(
+        self,
+        dsn,
+        pool,
+        buffer_size=EVENTS_BUFFER_SIZE,
+        max_clients=EVENTS_MAX_CLIENTS,
+    ):
+        """
+        :param dsn: Connection string of the database, for the listening connection
+        :param pool: Connection pool used to read the events missed by resuming clients
+        :param buffer_size: Number of recent events kept in memory
+        :param max_clients: Maximum number of open streams
+        """
+        self.dsn = dsn
+        self.pool = pool
+        self.max_clients = max_clients
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=buffer_size)
+        # Position of the latest event read, None until the listener is connected
+        self._last = None
+        # Position of the latest event no longer buffered
+        self._floor = None
+        self._clients = 0
+        self._pid = None
+
+    def _check_process(self):
+        """
+        Starts the listener in every process, a thread does not survive a fork. Must be
+        called while holding the condition.
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._events.clear()
+            self._last = None
+            self._clients = 0
+            thread = threading.Thread(
+                target=self._listen, name="change-feed-listener", daemon=True
+            )
+            thread.start()
+
+    def _connect(self):
+        """
+        Opens the listening connection, and reads the position of the latest event on the
+        first connection.
+
+        :return: Open psycopg2 connection, in autocommit mode
+        :raises psycopg2.Error: If the connection fails
+        """
+        conn = psycopg2.connect(self.dsn)
+        try:
+            configure_connection(conn)
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f'LISTEN "{EVENTS_CHANNEL}"')
+                if self._last is None:
+                    cur.execute(
+                        "SELECT revision, id FROM change_events "
+                        "WHERE revision < row_revisions_horizon() "
+                        "ORDER BY revision DESC, id DESC LIMIT 1"
+                    )
+                    row = cur.fetchone()
+                    with self._condition:
+                        self._last = self._floor = tuple(row) if row else (0, 0)
+                        self._condition.notify_all()
+        except psycopg2.Error:
+            conn.close()
+            raise
+        return conn
+
+    def _listen(self):
+        """
+        Listens forever, reconnecting after errors. Events are read from the table after
+        reconnecting, so none is lost while the connection was down.
+        """
+        pruned = time.monotonic()
+        while True:
+            try:
+                conn = self._connect()
+            except psycopg2.Error:
+                time.sleep(1)
+                continue
+            try:
+                with conn.cursor() as cur:
+                    # Seconds before reading held back events without a NOTIFY, None
+                    # when no event is held back
+                    delay = self._held_back_delay(self._read(cur), None)
+                    while True:
+                        if time.monotonic() - pruned > 3600:
+                            self._prune(cur)
+                            pruned = time.monotonic()
+                        # Notifications received during the last read are already
+                        # off the socket
+                        if not conn.notifies:
+                            timeout = 60 if delay is None else delay
+                            if select.select([conn], [], [], timeout) == ([], [], []):
+                                if delay is not None:
+                                    delay = self._held_back_delay(
+                                        self._read(cur), delay * 2
+                                    )
+                                continue
+                            conn.poll()
+                        if conn.notifies:
+                            conn.notifies.clear()
+                            delay = self._held_back_delay(self._read(cur), delay)
+            except (psycopg2.Error, OSError):
+                conn.close()
+                time.sleep(1)
+
+    @staticmethod
+    def _held_back_delay(held_back, delay):
+        """
+        Returns the seconds to wait before reading held back events again without a
+        NOTIFY, see the module docstring.
+
+        :param held_back: Whether events are held back after the latest read
+        :param delay: Delay asked for, None for the first one
+        :return: Seconds, or None if no event is held back
+        """
+        if not held_back:
+            return None
+        if delay is None:
+            return EVENTS_HELD_BACK_SECONDS
+        return min(delay, EVENTS_HELD_BACK_MAX_SECONDS)
+
+    def _read(self, cur):
+        """
+        Reads the events after the latest one into the buffer and wakes up the streams.
+
+        :param cur: Cursor of the listening connection
+        :return: Whether committed events are held back by an open transaction
+        """
+        while True:
+            cur.execute(
+                f"SELECT {', '.join(EVENT_COLUMNS)} FROM change_events "
+                "WHERE (revision, id) > %s AND revision < row_revisions_horizon() "
+                "ORDER BY revision, id LIMIT %s",
+                (self._last, EVENTS_BATCH_SIZE),
+            )
+            rows = cur.fetchall()
+            with self._condition:
+                for row in rows:
+                    if len(self._events) == self._events.maxlen:
+                        self._floor = event_position(self._events[0])
+                    self._events.append(dict(zip(EVENT_COLUMNS, row)))
+                if rows:
+                    self._last = event_position(self._events[-1])
+                    self._condition.notify_all()
+            if len(rows) < EVENTS_BATCH_SIZE:
+                break
+        cur.execute(
+            "SELECT FROM change_events WHERE (revision, id) > %s "
+            "ORDER BY revision, id LIMIT 1",
+            (self._last,),
+        )
+        return cur.fetchone() is not None
+
+    @staticmethod
+    def _prune(cur):
+        """
+        Deletes the events older than EVENTS_RETENTION_HOURS, the tombstones of the
+        delta sync older than SYNC_RETENTION_DAYS (see sync.py), and the table writes of
+        the backends gone (see migration 0005).
+
+        :param cur: Cursor of the listening connection
+        """
+        cur.execute(
+            "DELETE FROM change_events WHERE date_created < now() - %s * interval '1 hour'",
+            (EVENTS_RETENTION_HOURS,),
+        )
+        cur.execute(
+            "SELECT row_revisions_prune(%s * interval '1 day')", (SYNC_RETENTION_DAYS,)
+        )
+        cur.execute("SELECT data_versions_prune()")
+
+    def _backlog(self, after, project_id):
+        """
+        Reads events from the table, for streams behind the buffer.
+
+        :param after: Position of the last event sent
+        :param project_id: ID of the project to filter on, or None
+        :return: (position of the last event covered, list of (event name, event) tuples)
+        :raises psycopg2.Error: If the query fails
+        """
+        # Stop at the latest buffered event, the stream continues from the buffer
+        with self._condition:
+            latest = self._last
+        # Borrow a connection from the pool
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT revision, id FROM change_events ORDER BY revision, id LIMIT 1"
+                )
+                oldest = cur.fetchone()
+                if oldest is None or after < tuple(oldest):
+                    # The events after `after` were pruned
+                    return latest, [("reset", {"id": latest[1]})]
+                conditions = ["(revision, id) > %s", "(revision, id) <= %s"]
+                params = [after, latest]
+                if project_id is not None:
+                    conditions.append("(project_id = %s OR project_id IS NULL)")
+                    params.append(project_id)
+                cur.execute(
+                    f"SELECT {', '.join(EVENT_COLUMNS)} FROM change_events "
+                    f"WHERE {' AND '.join(conditions)} ORDER BY revision, id LIMIT %s",
+                    params + [EVENTS_BATCH_SIZE],
+                )
+                events = [dict(zip(EVENT_COLUMNS, row)) for row in cur.fetchall()]
+        if len(events) == EVENTS_BATCH_SIZE:
+            latest = event_position(events[-1])
+        return latest, [("change", event) for event in events]
+
+    def _next(self, after, project_id, timeout):
+        """
+        Returns the buffered events after an event, waiting for one if there is none yet.
+
+        :param after: Position of the last event sent
+        :param project_id: ID of the project to filter on, or None
+        :param timeout: Seconds to wait for an event
+        :return: (position of the last event covered, list of (event name, event)
+                 tuples), the list is None if the events after `after` are no longer
+                 buffered
+        """
+        with self._condition:
+            if after == self._last:
+                self._condition.wait(timeout)
+            latest = self._last
+            if after > latest:
+                # The events were deleted, e.g. the database was recreated
+                return latest, [("reset", {"id": latest[1]})]
+            if after < self._floor:
+                return after, None
+            return latest, [
+                ("change", event)
+                for event in self._events
+                if event_position(event) > after
+                and (project_id is None or event["project_id"] in (project_id, None))
+            ]
+
+    def latest_position(self, timeout=10.0):
+        """
+        Returns the position of the latest event, waiting for the listener to connect.
+
+        :param timeout: Seconds to wait for the listener
+        :raises psycopg2.OperationalError: If the listener is not connected in time
+        """
+        with self._condition:
+            self._check_process()
+            if not self._condition.wait_for(lambda: self._last is not None, timeout):
+                raise psycopg2.OperationalError("The change feed is not connected")
+            return self._last
+
+    def position(self, event_id):
+        """
+        Returns the position of an event sent to a client, to resume after it.
+
+        :param event_id: Id of the event
+        :return: (revision, id) of the event, or None if it is unknown, e.g. pruned
+        :raises psycopg2.Error: If the event could not be read
+        """
+        latest = self.latest_position()
+        if event_id == latest[1]:
+            return latest
+        with self._condition:
+            for event in self._events:
+                if event["id"] == event_id:
+                    return event_position(event)
+        # Borrow a connection from the pool
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT revision, id FROM change_events "
+                    "WHERE id = %s AND revision < row_revisions_horizon()",
+                    (event_id,),
+                )
+                row = cur.fetchone()
+        return tuple(row) if row else None
+
+    def acquire(self):
+        """
+        Takes a stream slot.
+
+        :return: Whether a slot was free, see EVENTS_MAX_CLIENTS
+        """
+        with self._condition:
+            self._check_process()
+            if self._clients >= self.max_clients:
+                return False
+            self._clients += 1
+            return True
+
+    def release(self):
+        """
+        Gives back a stream slot taken with `acquire`.
+        """
+        with self._condition:
+            self._clients -= 1
+
+    def events(self, after, project_id, duration):
+        """
+        Yields the events after an event, as they happen.
+
+        :param after: Position of the last event the client received, see `position`, or
+                      None if it is unknown
+        :param project_id: ID of the project to filter on, or None
+        :param duration: Seconds after which to stop
+        :return: Generator of (event name, event) tuples: ("change", event dict),
+                 ("reset", {"id": latest id}) when events were missed, or (None, None)
+                 after EVENTS_KEEPALIVE seconds without an event
+        :raises psycopg2.Error: If the missed events could not be read
+        """
+        if after is None:
+            after = self.latest_position()
+            yield "reset", {"id": after[1]}
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            previous = after
+            after, batch = self._next(
+                after, project_id, min(EVENTS_KEEPALIVE, deadline - time.monotonic())
+            )
+            if batch is None:
+                after, batch = self._backlog(after, project_id)
+            if not batch and after == previous:
+                yield None, None
+            yield from batch
+
+
+def format_event(name, event):
+    """
+    Formats an event of `ChangeFeed.events` as a Server-Sent Event.
+
+    :param name: Event name, or None for a keep alive comment
+    :param event: Event dict
+    :return: Text of the event
+    """
+    if name is None:
+        return ": keepalive\n\n"
+    return f"id: {event['id']}\nevent: {name}\ndata: {json.dumps(event)}\n\n"
+
+
+def parse_event_args(args, headers):
+    """
+    Reads the filter and resume arguments of a request to /events.
+
+    :param args: Query parameters of the request
+    :param headers: Headers of the request
+    :return: (id of the last event received or None, project ID or None)
+    :raises ValueError: If an argument is not an integer
+    """
+    values = {}
+    for name, value in (
+        ("Last-Event-ID", headers.get("Last-Event-ID") or args.get("last_event_id")),
+        ("project_id", args.get("project_id")),
+    ):
+        try:
+            values[name] = int(value) if value else None
+        except ValueError as e:
+            raise ValueError(f"Invalid {name}: {value}. Use an integer") from e
+    return values["Last-Event-ID"], values["project_id"]
@@ -0,0 +1,246 @@
+"""
+export.py
+
+Contains the export of the projects and their issues as files, for reports.
+
+/projects/{id}/export exports a project and /projects/export every project. Each line of
+the file is an issue with the columns of its project (project_*) and its own (issue_*), a
+project without issues has one line with empty issue columns. Lines are sorted by project
+and issue id. Dates have the format of the other endpoints, labels are comma separated in
+CSV files and arrays in NDJSON files.
+
+Query parameters:
+format - csv (default, with a header line) or ndjson (one JSON object per line)
+gzip - 1 to compress the file with gzip
+
+Postgres writes the lines itself with COPY ... TO STDOUT, on a thread of the API that
+hands them to the response in chunks of EXPORT_CHUNK_SIZE bytes, compressed on that thread
+as well. At most EXPORT_QUEUE_CHUNKS chunks wait for the client: the memory used does not
+grow with the export, and a slow client slows the COPY down.
+"""
+
+import os
+import zlib
+import queue
+import threading
+from flask import Response
+from dbtypes import DATE_FIELDS, LABELS_FIELD
+from repositories import ProjectRepository, IssueRepository
+from streaming import NDJSON_MIMETYPE
+
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", str(256 * 1024)))
+EXPORT_QUEUE_CHUNKS = int(os.environ.get("EXPORT_QUEUE_CHUNKS", "8"))
+EXPORT_GZIP_LEVEL = int(os.environ.get("EXPORT_GZIP_LEVEL", "1"))
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": NDJSON_MIMETYPE}
+
+# Issue columns of a line, the project id is already in the project columns
+ISSUE_COLUMNS = tuple(
+    column for column in IssueRepository.columns if column != "project_id"
+)
+
+
+class ExportCancelled(Exception):
+    """
+    Raised in the COPY of an export whose client went away.
+    """
+
+
+def parse_export_args(args):
+    """
+    Reads the export query parameters of a request.
+
+    :param args: Query parameters of the request
+    :return: (format, whether to compress with gzip)
+    :raises ValueError: If a parameter is invalid
+    """
+    export_format = args.get("format", "csv").lower()
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(
+            f"Invalid format: {export_format}. Use {' or '.join(EXPORT_FORMATS)}"
+        )
+    compress = args.get("gzip", "0").lower()
+    if compress not in ("0", "1", "true", "false"):
+        raise ValueError(f"Invalid gzip: {compress}. Use 1 or 0")
+    return export_format, compress in ("1", "true")
+
+
+def export_column(alias, column, prefix, export_format):
+    """
+    Returns the select expression of a column of an export line.
+
+    :param alias: Alias of the table
+    :param column: Name of the column
+    :param prefix: Prefix of the name of the column in the file
+    :param export_format: "csv" or "ndjson"
+    """
+    expression = f"{alias}.{column}"
+    if column in DATE_FIELDS:
+        # "YYYY-MM-DD HH:MM:SS[.ffffff]" in UTC, like dbtypes.cast_timestamptz
+        expression = f"({expression} AT TIME ZONE 'UTC')::text"
+    elif column == LABELS_FIELD and export_format == "csv":
+        expression = f"array_to_string({expression}, ',')"
+    return f"{expression} AS {prefix}_{column}"
+
+
+def export_query(cur, export_format, project_id=None):
+    """
+    Builds the COPY statement of an export.
+
+    :param cur: Cursor, to inline the parameters since COPY does not take any
+    :param export_format: "csv" or "ndjson"
+    :param project_id: ID of the project to export, or None for every project
+    :return: COPY statement
+    """
+    columns = [
+        export_column("p", column, "project", export_format)
+        for column in ProjectRepository.columns
+    ] + [export_column("i", column, "issue", export_format) for column in ISSUE_COLUMNS]
+    select = (
+        f"SELECT {', '.join(columns)} FROM projects p "
+        "LEFT JOIN issues i ON i.project_id = p.id"
+    )
+    if project_id is not None:
+        select += cur.mogrify(" WHERE p.id = %s", (project_id,)).decode()
+    select += " ORDER BY p.id, i.id"
+    if export_format == "csv":
+        return f"COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER)"
+    # JSON escapes control characters, so with these quote and delimiter characters the
+    # CSV format writes every object as it is, unlike the text format which escapes "\"
+    return (
+        f"COPY (SELECT row_to_json(e) FROM ({select}) e) TO STDOUT "
+        "WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')"
+    )
+
+
+class ChunkWriter:
+    """
+    File the COPY of an export writes to, which queues its output in chunks.
+    """
+
+    def __init__(self, chunks, cancelled, compress):
+        """
+        :param chunks: Bounded queue.Queue the chunks are put in
+        :param cancelled: threading.Event set when the client went away
+        :param compress: Whether to compress the chunks with gzip
+        """
+        self._chunks = chunks
+        self._cancelled = cancelled
+        self._buffer = []
+        self._size = 0
+        self._compressor = (
+            zlib.compressobj(EXPORT_GZIP_LEVEL, wbits=31) if compress else None
+        )
+
+    def put(self, item):
+        """
+        Queues a chunk, an error or the end of the export, waiting for room in the queue.
+
+        :raises ExportCancelled: If the client went away
+        """
+        while True:
+            if self._cancelled.is_set():
+                raise ExportCancelled()
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, data):
+        """
+        Adds output of the COPY, called by psycopg2 for every line.
+        """
+        self._buffer.append(data if isinstance(data, bytes) else data.encode())
+        self._size += len(data)
+        if self._size >= EXPORT_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        """
+        Queues the output written since the last chunk.
+        """
+        chunk = b"".join(self._buffer)
+        self._buffer = []
+        self._size = 0
+        if self._compressor is not None:
+            chunk = self._compressor.compress(chunk)
+        if chunk:
+            self.put(chunk)
+
+    def close(self):
+        """
+        Queues the end of the output.
+        """
+        self.flush()
+        if self._compressor is not None:
+            self.put(self._compressor.flush())
+        self.put(None)
+
+
+def export_response(pool, export_format, compress, project_id=None):
+    """
+    Runs the COPY of an export and streams its output as the response.
+
+    The response is returned once the first chunk was written, so that database errors
+    still result in an error status code. The connection is given back to the pool once
+    the COPY is done, or closed if the client went away before.
+
+    :param pool: Connection pool to borrow the connection from
+    :param export_format: "csv" or "ndjson"
+    :param compress: Whether to compress the file with gzip
+    :param project_id: ID of the project to export, or None for every project
+    :return: Streaming flask response
+    :raises psycopg2.Error: If the COPY could not be started
+    """
+    chunks = queue.Queue(maxsize=EXPORT_QUEUE_CHUNKS)
+    cancelled = threading.Event()
+    writer = ChunkWriter(chunks, cancelled, compress)
+    conn = pool.getconn()
+
+    def copy():
+        broken = False
+        try:
+            with conn.cursor() as cur:
+                cur.copy_expert(export_query(cur, export_format, project_id), writer)
+            writer.close()
+        except ExportCancelled:
+            # The COPY was left unfinished, the connection cannot be used anymore
+            broken = True
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # Handed to the response, which raises it
+            try:
+                writer.put(e)
+            except ExportCancelled:
+                pass
+        finally:
+            pool.putconn(conn, broken=broken)
+
+    threading.Thread(target=copy, name="export", daemon=True).start()
+    first = chunks.get()
+    if isinstance(first, Exception):
+        raise first
+
+    def generate():
+        item = first
+        while item is not None:
+            if isinstance(item, Exception):
+                # Too late for an error status, end the response without its end
+                raise item
+            yield item
+            item = chunks.get()
+
+    name = f"project-{project_id}" if project_id is not None else "projects"
+    extension = export_format + (".gz" if compress else "")
+    # Ask nginx to pass the chunks on instead of buffering the whole response
+    response = Response(
+        generate(),
+        mimetype="application/gzip" if compress else EXPORT_FORMATS[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{name}.{extension}"',
+            "X-Accel-Buffering": "no",
+        },
+    )
+    # Stops the COPY when the response is closed before its end, e.g. if the client went
+    # away
+    response.call_on_close(cancelled.set)
+    return response
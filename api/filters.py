@@ -0,0 +1,102 @@
+"""
+filters.py
+
+Contains the filters of the issue list endpoints of the API.
+
+Filters are read from the query parameters of the request and turned into parameterized
+SQL conditions. Only the columns listed here can be filtered on, the column names never
+come from the request.
+
+Query parameters:
+status, priority, type - Only issues with one of the given values. Values can be repeated
+                         (status=New&status=Done) or comma separated (status=New,Done)
+label - Only issues that have the given label
+date_due_from, date_due_to - Only issues due from (inclusive) to (exclusive) the given
+                             ISO 8601 dates
+date_created_from, date_created_to - Only issues created from (inclusive) to (exclusive)
+                                     the given ISO 8601 dates
+
+Issues can be sorted by the columns of ISSUE_SORTS, see pagination.py.
+"""
+
+from datetime import datetime as dt
+
+# Sortable columns of the issues, column -> whether it can be NULL
+ISSUE_SORTS = {
+    "id": False,
+    "title": False,
+    "type": False,
+    "status": False,
+    "priority": True,
+    "date_created": False,
+    "date_started": True,
+    "date_due": True,
+    "date_closed": True,
+}
+
+# Query parameter -> column compared with one of the given values
+ISSUE_VALUE_FILTERS = {
+    "status": "status",
+    "priority": "priority",
+    "type": "type",
+}
+
+# Query parameter -> (column, comparison operator)
+ISSUE_RANGE_FILTERS = {
+    "date_due_from": ("date_due", ">="),
+    "date_due_to": ("date_due", "<"),
+    "date_created_from": ("date_created", ">="),
+    "date_created_to": ("date_created", "<"),
+}
+
+
+def get_values(args, name):
+    """
+    Returns every value of a query parameter, splitting comma separated values.
+
+    :param args: Query parameters of the request
+    :param name: Name of the query parameter
+    :return: List of non-empty values
+    """
+    values = []
+    for value in args.getlist(name):
+        values += [part.strip() for part in value.split(",") if part.strip()]
+    return values
+
+
+def parse_issue_filters(args):
+    """
+    Builds the SQL conditions of the issue filters given in the query parameters.
+
+    :param args: Query parameters of the request
+    :return: (conditions, params) to be used in a WHERE clause
+    :raises ValueError: If a filter value is invalid
+    """
+    conditions = []
+    params = []
+
+    for name, column in ISSUE_VALUE_FILTERS.items():
+        values = get_values(args, name)
+        if values:
+            conditions.append(f"{column} = ANY(%s)")
+            params.append(values)
+
+    for label in get_values(args, "label"):
+        # Containment can use the GIN index on the labels
+        conditions.append("labels @> %s::text[]")
+        params.append([label])
+
+    for name, (column, operator) in ISSUE_RANGE_FILTERS.items():
+        value = args.get(name)
+        if not value:
+            continue
+        try:
+            dt.fromisoformat(value)
+        except ValueError as e:
+            raise ValueError(
+                f"Invalid {name}: {value}. Use an ISO 8601 date, e.g. 2024-01-31"
+            ) from e
+        conditions.append(f"{column} {operator} %s")
+        params.append(value)
+
+    return conditions, params
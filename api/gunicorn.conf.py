@@ -0,0 +1,154 @@
+"""
+gunicorn.conf.py
+
+Contains the configuration of gunicorn, the production server of the API.
+
+    gunicorn --config gunicorn.conf.py api:app
+
+The server runs GUNICORN_WORKERS processes with GUNICORN_THREADS threads each. Every
+process has its own database connection pool, so POSTGRES_POOL_MAX should be at least the
+number of threads, and the workers times POSTGRES_POOL_MAX plus their listener
+connections below the max_connections of the database. The startup check warns when they
+are not. Streams of /events hold a thread each while they are open, up to
+EVENTS_MAX_CLIENTS per process (see events.py), so the server serves at most the workers
+times EVENTS_MAX_CLIENTS streams, see docker-compose.yml and nginx.conf.
+
+Before listening, the master process checks the database: it waits for it, applies or
+checks the migrations (see MIGRATIONS_MODE in migrations.py) and refuses to start if the
+schema is not at the latest version. Workers then open their pools before taking requests.
+
+Every process writes its metrics to PROMETHEUS_MULTIPROC_DIR (default trackify-metrics in
+the temporary directory), cleared when the server starts, so that /metrics adds up the
+values of all of them (see metrics.py).
+
+Sending SIGHUP to the master reloads the code and the configuration: new workers are
+started, and the old ones finish their requests (for at most GUNICORN_GRACEFUL_TIMEOUT
+seconds) before exiting. SIGTERM stops the server the same way.
+"""
+
+import os
+import logging
+import tempfile
+import multiprocessing
+import psycopg2
+
+# Set before metrics.py imports prometheus_client, in this process and the workers
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "trackify-metrics")
+)
+# pylint: disable=wrong-import-position
+from migrations import MigrationError, latest_version, migrate_on_startup
+from metrics import clear_multiprocess_dir, mark_process_dead
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5001')}"
+workers = int(os.environ.get("GUNICORN_WORKERS", str(multiprocessing.cpu_count())))
+# Threads let a worker serve other requests while one waits on the database
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+# Workers that stop responding for this many seconds are restarted
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+# Longer than the keepalive_timeout of nginx, so that nginx closes idle connections first
+# and never sends a request on a connection the API is closing
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "75"))
+# Restart workers after this many requests (0 never), with jitter so they do not all
+# restart at once
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+# Every worker loads the app itself, so that no connection or thread is shared by forks
+preload_app = False
+accesslog = "-"
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+# Connections every worker opens besides its pools: the listeners of the change feed and of
+# the cache invalidations, see events.py and cache.py
+LISTENER_CONNECTIONS = 2
+
+
+def check_pool_size(server, conn):
+    """
+    Warns if the connection pools do not fit the threads or the database, see the module
+    docstring.
+
+    :param server: gunicorn arbiter
+    :param conn: Open connection to the database
+    """
+    pool_max = int(os.environ.get("POSTGRES_POOL_MAX", "10"))
+    if pool_max < threads:
+        server.log.warning(
+            "POSTGRES_POOL_MAX (%d) is below GUNICORN_THREADS (%d), requests will wait "
+            "for connections",
+            pool_max,
+            threads,
+        )
+    needed = workers * (pool_max + LISTENER_CONNECTIONS)
+    with conn.cursor() as cur:
+        cur.execute("SHOW max_connections")
+        max_connections = int(cur.fetchone()[0])
+    if needed > max_connections:
+        server.log.warning(
+            "The workers may open %d connections, above the max_connections of the "
+            "database (%d)",
+            needed,
+            max_connections,
+        )
+
+
+def on_starting(server):
+    """
+    Checks the database and its schema before the server listens, see the module docstring.
+
+    :param server: gunicorn arbiter
+    :raises SystemExit: If the database is unreachable or the schema is not up to date
+    """
+    try:
+        migrate_on_startup(os.environ["POSTGRES_URL"])
+    except (MigrationError, psycopg2.Error) as e:
+        server.log.critical("Startup check failed: %s", e)
+        raise SystemExit(1) from e
+    server.log.info("Database schema is at version %d", latest_version())
+    try:
+        with psycopg2.connect(os.environ["POSTGRES_URL"]) as conn:
+            check_pool_size(server, conn)
+        conn.close()
+    except psycopg2.Error as e:
+        server.log.warning("Could not check the pool size: %s", e)
+    clear_multiprocess_dir()
+
+
+def post_worker_init(worker):
+    """
+    Sets up the logging of the API and opens the connection pool of a worker before it takes
+    requests.
+
+    A failure is only logged, so that a database outage during a reload does not stop the
+    server: the pool connects again on the first request.
+
+    :param worker: gunicorn worker
+    """
+    # Imported here, the master process must not load the app
+    from api import pool  # pylint: disable=import-outside-toplevel
+
+    # Log the messages of the API (e.g. slow statements, see timing.py) like gunicorn's
+    logging.basicConfig(
+        format="%(asctime)s [%(process)d] [%(levelname)s] %(name)s: %(message)s",
+        datefmt="[%Y-%m-%d %H:%M:%S %z]",
+        level=logging.INFO,
+    )
+
+    try:
+        with pool.connection():
+            pass
+    except psycopg2.Error as e:
+        worker.log.warning("Could not open the connection pool: %s", e)
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """
+    Drops the in progress requests of an exited worker from the metrics, see metrics.py.
+
+    :param server: gunicorn arbiter
+    :param worker: gunicorn worker
+    """
+    mark_process_dead(worker.pid)
@@ -0,0 +1,247 @@
+"""
+metrics.py
+
+Contains the Prometheus metrics of the API, served by /metrics.
+
+Every request is measured by hooks around the flask app (see `measure_requests`):
+- trackify_http_requests_total: requests by method, route and status
+- trackify_http_request_duration_seconds: latency, until the last byte of the response was
+  handed to the server, so streamed responses are measured whole
+- trackify_http_requests_in_progress: requests being served
+- trackify_http_response_size_bytes: size of the serialized response bodies
+- trackify_db_query_duration_seconds: time spent in database queries by a request
+- trackify_db_queries_total: database queries run by the requests
+- trackify_db_pool_wait_seconds: time a request waited for pooled database connections
+Read from the database when /metrics is requested (see `record_horizon_lag`):
+- trackify_db_revision_horizon_lag: transactions started since the oldest one still open,
+  whose changes /events and /sync hold back until it ends (see
+  migrations/0007_change_events.sql). A lag that keeps growing means a long transaction or
+  a session idle in a transaction.
+The route label is the rule of the endpoint ("/issues/<int:issue_id>"), so the number of series
+stays bounded whatever the URLs requested.
+
+The database time and pool waits come from the timings of the requests, see timing.py.
+
+gunicorn runs several processes, each with their own values. With PROMETHEUS_MULTIPROC_DIR
+set (gunicorn.conf.py sets it up) every process writes its values to files in that
+directory, and /metrics of any process adds up the files of all of them. Without it, as
+with `python api.py`, /metrics returns the values of its own process.
+
+prometheus_client is optional: without it requests are not measured and /metrics answers
+501 Not Implemented.
+"""
+
+import os
+import time
+import glob
+from timing import current_timings
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:  # pragma: no cover - prometheus_client is optional
+    prometheus_client = None
+
+# Directory of the values of every process, read when prometheus_client is imported
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+# Seconds, from fast cached reads to long streams
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+# Bytes, from a single row to a streamed table
+SIZE_BUCKETS = tuple(256 * 4**power for power in range(10))
+
+
+class Metrics:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """
+    Collectors of the metrics of the requests, see the module docstring.
+    """
+
+    def __init__(self):
+        self.requests = prometheus_client.Counter(
+            "trackify_http_requests_total",
+            "Requests served",
+            ["method", "route", "status"],
+        )
+        self.request_duration = prometheus_client.Histogram(
+            "trackify_http_request_duration_seconds",
+            "Time to serve a request",
+            ["method", "route"],
+            buckets=LATENCY_BUCKETS,
+        )
+        self.in_progress = prometheus_client.Gauge(
+            "trackify_http_requests_in_progress",
+            "Requests being served",
+            ["method", "route"],
+            multiprocess_mode="livesum",
+        )
+        self.response_size = prometheus_client.Histogram(
+            "trackify_http_response_size_bytes",
+            "Size of the response bodies",
+            ["method", "route"],
+            buckets=SIZE_BUCKETS,
+        )
+        self.db_duration = prometheus_client.Histogram(
+            "trackify_db_query_duration_seconds",
+            "Time spent in database queries by a request",
+            ["method", "route"],
+            buckets=LATENCY_BUCKETS,
+        )
+        self.db_queries = prometheus_client.Counter(
+            "trackify_db_queries_total",
+            "Database queries run by the requests",
+            ["method", "route"],
+        )
+        self.pool_wait = prometheus_client.Histogram(
+            "trackify_db_pool_wait_seconds",
+            "Time a request waited for pooled database connections",
+            ["method", "route"],
+            buckets=LATENCY_BUCKETS,
+        )
+        self.horizon_lag = prometheus_client.Gauge(
+            "trackify_db_revision_horizon_lag",
+            "Transactions started since the oldest one still open",
+            multiprocess_mode="mostrecent",
+        )
+
+
+# Collectors of this process, None without prometheus_client
+_metrics = Metrics() if prometheus_client is not None else None
+
+
+def _count_size(body, timings):
+    """
+    Passes the chunks of a streamed response through, counting their size.
+    """
+    try:
+        for chunk in body:
+            timings.size += len(chunk if isinstance(chunk, bytes) else chunk.encode())
+            yield chunk
+    finally:
+        if hasattr(body, "close"):
+            body.close()
+
+
+def _start_request():
+    """
+    Counts a request in progress. Registered with `app.before_request`, after the hook of
+    timing.py.
+    """
+    _metrics.in_progress.labels(*current_timings().labels).inc()
+
+
+def _finish_request(timings, status):
+    """
+    Records the measures of a request once its response was sent.
+    """
+    labels = timings.labels
+    _metrics.in_progress.labels(*labels).dec()
+    _metrics.requests.labels(*labels, str(status)).inc()
+    _metrics.request_duration.labels(*labels).observe(
+        time.perf_counter() - timings.start
+    )
+    _metrics.response_size.labels(*labels).observe(timings.size)
+    _metrics.db_duration.labels(*labels).observe(timings.db_time)
+    _metrics.db_queries.labels(*labels).inc(timings.db_queries)
+    _metrics.pool_wait.labels(*labels).observe(timings.pool_wait)
+
+
+def _end_request(response):
+    """
+    Measures the response of a request when it is closed. Registered with
+    `app.after_request`.
+
+    :param response: Response of the handler
+    :return: The same response
+    """
+    timings = current_timings()
+    if timings is None:
+        return response
+    if response.is_streamed:
+        response.response = _count_size(response.response, timings)
+    else:
+        timings.size = response.content_length or 0
+    status = response.status_code
+    response.call_on_close(lambda: _finish_request(timings, status))
+    return response
+
+
+def measure_requests(app):
+    """
+    Measures every request of a flask app, if prometheus_client is installed. Must be called
+    after timing.time_requests.
+
+    :param app: Flask application
+    """
+    if _metrics is not None:
+        app.before_request(_start_request)
+        app.after_request(_end_request)
+
+
+def metrics_enabled():
+    """
+    Returns whether prometheus_client is installed.
+    """
+    return prometheus_client is not None
+
+
+def record_horizon_lag(lag):
+    """
+    Records the revision horizon lag read from the database, see the module docstring.
+
+    :param lag: Value of row_revisions_horizon_lag()
+    """
+    if _metrics is not None:
+        _metrics.horizon_lag.set(lag)
+
+
+def render_metrics():
+    """
+    Returns the metrics of every process of the API in the Prometheus text format.
+
+    :return: (body, content type)
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return (
+        prometheus_client.generate_latest(registry),
+        prometheus_client.CONTENT_TYPE_LATEST,
+    )
+
+
+def clear_multiprocess_dir():
+    """
+    Creates PROMETHEUS_MULTIPROC_DIR, or deletes the values left in it by a previous run.
+    Must be called before the processes of the API start.
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+        for path in glob.glob(os.path.join(PROMETHEUS_MULTIPROC_DIR, "*.db")):
+            os.remove(path)
+
+
+def mark_process_dead(pid):
+    """
+    Drops the live gauges of an exited process, its counters and histograms are kept.
+
+    :param pid: Process id
+    """
+    if prometheus_client is not None and PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid, PROMETHEUS_MULTIPROC_DIR)
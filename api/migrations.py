@@ -0,0 +1,376 @@
+"""
+migrations.py
+
+Contains the versioned schema migrations of the database.
+
+init.sql creates the baseline schema when the database container is first created. Every
+later schema change is a file in the migrations directory named <version>_<name>.sql or
+<version>_<name>.py, e.g. 0001_issue_indexes.sql, applied in version order. Applied
+versions are recorded in the schema_migrations table, so each migration runs exactly once
+per database.
+
+A SQL migration runs in a single transaction, unless its first line is
+`-- migrate: no-transaction`. Its statements, one per line ending with a semicolon, then
+run one by one in autocommit mode, which is needed for CREATE INDEX CONCURRENTLY.
+
+A Python migration defines `migrate(conn, log)` and commits on its own, which lets it
+change large tables in batches instead of in one long transaction.
+
+Migrations that are not a single transaction must be safe to run again if they fail
+halfway (e.g. IF NOT EXISTS). A CREATE INDEX CONCURRENTLY that failed leaves an invalid
+index behind, which IF NOT EXISTS would then keep: the invalid index is dropped before the
+statement runs again, by the runner for SQL migrations, and with `drop_invalid_index` in
+Python migrations.
+
+The API applies (or only checks) the pending migrations at startup, see MIGRATIONS_MODE.
+They can also be managed from the command line:
+    python migrations.py status - List the migrations and whether they are applied
+    python migrations.py apply - Apply the pending migrations
+    python migrations.py check - Exit with an error if there are pending migrations
+"""
+
+import os
+import re
+import sys
+import time
+import importlib.util
+import psycopg2
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE = re.compile(r"^(\d+)_(\w+)\.(sql|py)$")
+NO_TRANSACTION = "-- migrate: no-transaction"
+CREATE_INDEX_CONCURRENTLY = re.compile(
+    r"^\s*CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)",
+    re.IGNORECASE,
+)
+# Key of the advisory lock held while migrating, so that API processes starting at the
+# same time do not apply the same migration twice
+LOCK_KEY = 7_310_512
+
+
+class MigrationError(Exception):
+    """
+    Raised when the schema is not at the expected version, or a migration fails.
+    """
+
+
+def list_migrations(directory=MIGRATIONS_DIR):
+    """
+    Returns the migrations found in the migrations directory.
+
+    :param directory: Directory holding the migration files
+    :return: List of (version, name, path) sorted by version
+    """
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append(
+                (int(match[1]), match[2], os.path.join(directory, filename))
+            )
+    migrations.sort()
+    versions = [version for version, _, _ in migrations]
+    if len(set(versions)) != len(versions):
+        raise MigrationError(f"Duplicate migration versions in {directory}")
+    return migrations
+
+
+def latest_version(directory=MIGRATIONS_DIR):
+    """
+    Returns the version the schema has once every migration is applied.
+
+    :param directory: Directory holding the migration files
+    :return: Latest migration version, 0 if there are none
+    """
+    migrations = list_migrations(directory)
+    return migrations[-1][0] if migrations else 0
+
+
+def ensure_migrations_table(conn):
+    """
+    Creates the table recording the applied migrations if it does not exist yet.
+
+    :param conn: Open psycopg2 connection
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+              version INTEGER PRIMARY KEY,
+              name VARCHAR(255) NOT NULL,
+              applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+            """)
+    conn.commit()
+
+
+def applied_versions(conn):
+    """
+    Returns the versions of the migrations applied to the database.
+
+    :param conn: Open psycopg2 connection
+    :return: Set of applied versions, empty if no migration was ever applied
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            return set()
+        cur.execute("SELECT version FROM schema_migrations")
+        versions = {row[0] for row in cur.fetchall()}
+    conn.rollback()
+    return versions
+
+
+def pending_migrations(conn, directory=MIGRATIONS_DIR):
+    """
+    Returns the migrations that still have to be applied to the database.
+
+    :param conn: Open psycopg2 connection
+    :param directory: Directory holding the migration files
+    :return: List of (version, name, path) sorted by version
+    """
+    applied = applied_versions(conn)
+    return [
+        migration
+        for migration in list_migrations(directory)
+        if migration[0] not in applied
+    ]
+
+
+def split_statements(sql):
+    """
+    Splits the SQL of a no-transaction migration into its statements.
+
+    Statements end with a semicolon at the end of a line, comment lines are dropped.
+
+    :param sql: SQL of the migration
+    :return: List of statements
+    """
+    statements = []
+    current = []
+    for line in sql.splitlines():
+        if line.strip().startswith("--") or not line.strip():
+            continue
+        current.append(line)
+        if line.rstrip().endswith(";"):
+            statements.append("\n".join(current))
+            current = []
+    if current:
+        statements.append("\n".join(current))
+    return statements
+
+
+def drop_invalid_index(cur, name):
+    """
+    Drops an index left invalid by a failed CREATE INDEX CONCURRENTLY, so that it is built
+    again instead of being skipped by IF NOT EXISTS. Must run in autocommit mode.
+
+    :param cur: Cursor of a connection in autocommit mode
+    :param name: Name of the index
+    :return: Whether an invalid index was dropped
+    """
+    cur.execute(
+        "SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)",
+        (name,),
+    )
+    row = cur.fetchone()
+    if row is None or not row[0]:
+        return False
+    cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    return True
+
+
+def run_sql_migration(conn, path):
+    """
+    Runs the statements of a SQL migration, see NO_TRANSACTION.
+
+    :param conn: Open psycopg2 connection, not in autocommit mode
+    :param path: Path of the migration file
+    """
+    with open(path, encoding="utf-8") as file:
+        sql = file.read()
+    if not sql.lstrip().startswith(NO_TRANSACTION):
+        with conn.cursor() as cur:
+            cur.execute(sql)
+        return
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for statement in split_statements(sql):
+                index = CREATE_INDEX_CONCURRENTLY.match(statement)
+                if index is not None:
+                    drop_invalid_index(cur, index.group(1))
+                cur.execute(statement)
+    finally:
+        conn.autocommit = False
+
+
+def run_python_migration(conn, version, path, log):
+    """
+    Runs the `migrate(conn, log)` function of a Python migration.
+
+    :param conn: Open psycopg2 connection, not in autocommit mode
+    :param version: Version of the migration
+    :param path: Path of the migration file
+    :param log: Function called with progress messages
+    """
+    spec = importlib.util.spec_from_file_location(f"migration_{version:04d}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.migrate(conn, log)
+
+
+def apply_migration(conn, version, name, path, log=print):
+    """
+    Applies a single migration and records it as applied.
+
+    :param conn: Open psycopg2 connection, not in autocommit mode
+    :param version: Version of the migration
+    :param name: Name of the migration
+    :param path: Path of the migration file
+    :param log: Function called with progress messages of Python migrations
+    :raises MigrationError: If the migration fails
+    """
+    try:
+        if path.endswith(".py"):
+            run_python_migration(conn, version, path, log)
+        else:
+            run_sql_migration(conn, path)
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (version, name),
+            )
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        raise MigrationError(
+            f"Migration {version:04d}_{name} failed: {str(e).strip()}"
+        ) from e
+
+
+def apply_migrations(dsn, directory=MIGRATIONS_DIR, log=print):
+    """
+    Applies every pending migration in version order.
+
+    :param dsn: Connection string of the database
+    :param directory: Directory holding the migration files
+    :param log: Function called with a message for every applied migration
+    :return: List of the applied versions
+    :raises MigrationError: If a migration fails, later migrations are not applied
+    """
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (LOCK_KEY,))
+        conn.commit()
+        try:
+            ensure_migrations_table(conn)
+            applied = []
+            for version, name, path in pending_migrations(conn, directory):
+                started = time.monotonic()
+                apply_migration(conn, version, name, path, log)
+                applied.append(version)
+                log(
+                    f"Applied migration {version:04d}_{name} in {time.monotonic() - started:.2f}s"
+                )
+            return applied
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (LOCK_KEY,))
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def check_migrations(dsn, directory=MIGRATIONS_DIR):
+    """
+    Checks that every migration was applied to the database.
+
+    :param dsn: Connection string of the database
+    :param directory: Directory holding the migration files
+    :raises MigrationError: If there are pending migrations
+    """
+    conn = psycopg2.connect(dsn)
+    try:
+        pending = pending_migrations(conn, directory)
+    finally:
+        conn.close()
+    if pending:
+        names = ", ".join(f"{version:04d}_{name}" for version, name, _ in pending)
+        raise MigrationError(f"Database schema is missing migrations: {names}")
+
+
+def wait_for_database(dsn, timeout=30.0):
+    """
+    Waits until the database accepts connections, e.g. while its container starts.
+
+    :param dsn: Connection string of the database
+    :param timeout: Seconds to wait before giving up
+    :raises psycopg2.OperationalError: If the database is still unreachable after the timeout
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            psycopg2.connect(dsn).close()
+            return
+        except psycopg2.OperationalError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(1)
+
+
+def migrate_on_startup(dsn, mode=None):
+    """
+    Applies or checks the migrations before the API starts accepting requests.
+
+    :param dsn: Connection string of the database
+    :param mode: "apply" (default), "check" or "off", read from MIGRATIONS_MODE if not given
+    :raises MigrationError: If the schema is not up to date afterwards
+    """
+    mode = mode or os.environ.get("MIGRATIONS_MODE", "apply")
+    if mode == "off":
+        return
+    if mode not in ("apply", "check"):
+        raise MigrationError(
+            f"Invalid MIGRATIONS_MODE: {mode}. Use apply, check or off"
+        )
+    wait_for_database(dsn, float(os.environ.get("MIGRATIONS_WAIT", "30")))
+    if mode == "apply":
+        apply_migrations(dsn)
+    check_migrations(dsn)
+
+
+def main(argv):
+    """
+    Command line entry point, see the module docstring.
+    """
+    command = argv[1] if len(argv) > 1 else "status"
+    dsn = os.environ["POSTGRES_URL"]
+    try:
+        if command == "apply":
+            applied = apply_migrations(dsn)
+            print(f"{len(applied)} migration(s) applied")
+        elif command == "check":
+            check_migrations(dsn)
+            print("Database schema is up to date")
+        elif command == "status":
+            conn = psycopg2.connect(dsn)
+            try:
+                applied = applied_versions(conn)
+            finally:
+                conn.close()
+            for version, name, _ in list_migrations():
+                state = "applied" if version in applied else "pending"
+                print(f"{version:04d}_{name}: {state}")
+        else:
+            print(__doc__)
+            return 2
+    except MigrationError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
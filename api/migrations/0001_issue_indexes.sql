@@ -0,0 +1,16 @@
+-- migrate: no-transaction
+-- Indexes of the issue lookups, filters and sorts.
+-- Built concurrently so that writes to issues are not blocked on large tables.
+
+-- Issues of a project (get, paginate and delete by project_id)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS issues_project_id_idx ON issues (project_id, id);
+-- Issues of a project filtered by status
+CREATE INDEX CONCURRENTLY IF NOT EXISTS issues_project_id_status_idx ON issues (project_id, status);
+-- Issues filtered or sorted by due date
+CREATE INDEX CONCURRENTLY IF NOT EXISTS issues_date_due_idx ON issues (date_due, id);
+
+-- Filters and sorts of the issue list endpoints
+CREATE INDEX CONCURRENTLY IF NOT EXISTS issues_status_idx ON issues (status);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS issues_priority_idx ON issues (priority);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS issues_type_idx ON issues (type);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS issues_date_created_idx ON issues (date_created, id);
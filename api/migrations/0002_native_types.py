@@ -0,0 +1,237 @@
+"""
+0002_native_types.py
+
+Converts the date columns of projects and issues from VARCHAR(255) to timestamptz, and
+their labels from VARCHAR(255) to text[] with a GIN index on the issue labels.
+
+The tables are not rewritten under a long lock. Instead, for each table:
+1. New columns are added next to the old ones, and a trigger fills them for the rows
+   written while the migration runs
+2. Existing rows are converted in batches of MIGRATION_BATCH_SIZE ids, each batch in its
+   own transaction
+3. The indexes of the new columns are built concurrently
+4. A short transaction drops the old columns and gives their names to the new ones
+
+Dates are read in UTC, like the API wrote them. Values that cannot be converted become
+NULL, except date_created which cannot be NULL and falls back to the conversion time.
+Labels stored as a postgres array literal ({a,b}) or as comma separated text (a,b) both
+become arrays. Every step can run again if the migration is interrupted.
+"""
+
+import os
+from migrations import drop_invalid_index
+
+BATCH_SIZE = int(os.environ.get("MIGRATION_BATCH_SIZE", "10000"))
+
+# Table -> date columns, in table order. The new columns are added in the same order so
+# that the columns keep their positions once the old ones are dropped.
+DATE_COLUMNS = {
+    "projects": ["date_created", "date_started", "date_closed"],
+    "issues": ["date_created", "date_started", "date_due", "date_closed"],
+}
+
+# Indexes on the converted columns, built as <name>_new on the new columns.
+# The old indexes go away with the old columns.
+INDEXES = {
+    "projects": {},
+    "issues": {
+        "issues_date_due_idx": "(date_due_new, id)",
+        "issues_date_created_idx": "(date_created_new, id)",
+        "issues_labels_idx": "USING GIN (labels_new)",
+    },
+}
+
+FUNCTIONS = r"""
+CREATE OR REPLACE FUNCTION trackify_to_timestamptz(value text) RETURNS timestamptz AS $$
+BEGIN
+  RETURN NULLIF(btrim(value), '')::timestamptz;
+EXCEPTION WHEN others THEN
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+CREATE OR REPLACE FUNCTION trackify_to_labels(value text) RETURNS text[] AS $$
+BEGIN
+  IF value IS NULL OR btrim(value) = '' THEN
+    RETURN NULL;
+  END IF;
+  IF left(btrim(value), 1) = '{' THEN
+    RETURN btrim(value)::text[];
+  END IF;
+  RETURN array_remove(regexp_split_to_array(btrim(value), '\s*,\s*'), '');
+EXCEPTION WHEN others THEN
+  RETURN ARRAY[value];
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+"""
+
+
+def conversions(table, row=""):
+    """
+    Returns the expressions converting the old columns of a table into the new ones.
+
+    :param table: Name of the table
+    :param row: Prefix of the old columns, e.g. "NEW." in a trigger
+    :return: List of (new column, expression)
+    """
+    result = []
+    for column in DATE_COLUMNS[table]:
+        expression = f"trackify_to_timestamptz({row}{column})"
+        if column == "date_created":
+            expression = f"COALESCE({expression}, now())"
+        result.append((f"{column}_new", expression))
+    result.append(("labels_new", f"trackify_to_labels({row}labels)"))
+    return result
+
+
+def is_converted(cur, table):
+    """
+    Returns whether the labels of a table already are an array, i.e. the table was swapped.
+    """
+    cur.execute(
+        """
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND column_name = 'labels'
+        """,
+        (table,),
+    )
+    return cur.fetchone()[0] == "ARRAY"
+
+
+def add_columns(conn, table):
+    """
+    Adds the new columns and the trigger that keeps them in sync with the old ones.
+    """
+    with conn.cursor() as cur:
+        columns = [
+            f"ADD COLUMN IF NOT EXISTS {c}_new timestamptz" for c in DATE_COLUMNS[table]
+        ]
+        columns.append("ADD COLUMN IF NOT EXISTS labels_new text[]")
+        cur.execute(f"ALTER TABLE {table} {', '.join(columns)}")
+        assignments = "\n".join(
+            f"  NEW.{column} := {expression};"
+            for column, expression in conversions(table, "NEW.")
+        )
+        cur.execute(f"""
+            CREATE OR REPLACE FUNCTION trackify_{table}_sync_types() RETURNS trigger AS $$
+            BEGIN
+            {assignments}
+              RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            CREATE OR REPLACE TRIGGER trackify_{table}_sync_types
+            BEFORE INSERT OR UPDATE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION trackify_{table}_sync_types();
+            """)
+    conn.commit()
+
+
+def backfill(conn, table, log):
+    """
+    Converts the existing rows in batches of ids, committing after each batch.
+    """
+    assignments = ", ".join(
+        f"{column} = {expression}" for column, expression in conversions(table)
+    )
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT min(id), max(id) FROM {table}")
+        first, last = cur.fetchone()
+        conn.commit()
+        if first is None:
+            return
+        for start in range(first, last + 1, BATCH_SIZE):
+            cur.execute(
+                f"UPDATE {table} SET {assignments} WHERE id >= %s AND id < %s",
+                (start, start + BATCH_SIZE),
+            )
+            conn.commit()
+        log(f"Converted {table} ids {first} to {last}")
+
+
+def prepare_not_null(conn, table):
+    """
+    Validates that the new date_created is never NULL without blocking writes, so that
+    setting it NOT NULL during the swap does not have to scan the table.
+    """
+    constraint = f"{table}_date_created_new_not_null"
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_constraint WHERE conname = %s", (constraint,))
+        if cur.fetchone() is None:
+            cur.execute(
+                f"ALTER TABLE {table} ADD CONSTRAINT {constraint} "
+                "CHECK (date_created_new IS NOT NULL) NOT VALID"
+            )
+            conn.commit()
+        cur.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {constraint}")
+    conn.commit()
+
+
+def build_indexes(conn, table):
+    """
+    Builds the indexes of the new columns without blocking writes.
+    """
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for name, definition in INDEXES[table].items():
+                drop_invalid_index(cur, f"{name}_new")
+                cur.execute(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name}_new "
+                    f"ON {table} {definition}"
+                )
+    finally:
+        conn.autocommit = False
+
+
+def swap(conn, table):
+    """
+    Replaces the old columns by the new ones in a single short transaction.
+    """
+    with conn.cursor() as cur:
+        # Give up instead of queueing every other query behind the lock for long
+        cur.execute("SET LOCAL lock_timeout = '10s'")
+        cur.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+        cur.execute(f"DROP TRIGGER trackify_{table}_sync_types ON {table}")
+        cur.execute(f"DROP FUNCTION trackify_{table}_sync_types()")
+        dropped = [f"DROP COLUMN {c}" for c in DATE_COLUMNS[table]] + [
+            "DROP COLUMN labels"
+        ]
+        cur.execute(f"ALTER TABLE {table} {', '.join(dropped)}")
+        for column in DATE_COLUMNS[table] + ["labels"]:
+            cur.execute(f"ALTER TABLE {table} RENAME COLUMN {column}_new TO {column}")
+        cur.execute(f"""
+            ALTER TABLE {table}
+              ALTER COLUMN date_created SET NOT NULL,
+              ALTER COLUMN date_created SET DEFAULT now(),
+              DROP CONSTRAINT {table}_date_created_new_not_null
+            """)
+        for name in INDEXES[table]:
+            cur.execute(f"ALTER INDEX {name}_new RENAME TO {name}")
+    conn.commit()
+
+
+def migrate(conn, log):
+    """
+    Converts the columns of every table, see the module docstring.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SET TIME ZONE 'UTC'")
+        cur.execute(FUNCTIONS)
+    conn.commit()
+    for table in DATE_COLUMNS:
+        with conn.cursor() as cur:
+            converted = is_converted(cur, table)
+        conn.commit()
+        if converted:
+            continue
+        add_columns(conn, table)
+        backfill(conn, table, log)
+        prepare_not_null(conn, table)
+        build_indexes(conn, table)
+        swap(conn, table)
+        log(f"Converted the dates and labels of {table}")
+    with conn.cursor() as cur:
+        cur.execute("DROP FUNCTION trackify_to_timestamptz(text)")
+        cur.execute("DROP FUNCTION trackify_to_labels(text)")
+    conn.commit()
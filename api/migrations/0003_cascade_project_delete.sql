@@ -0,0 +1,7 @@
+-- migrate: no-transaction
+-- Delete the issues of a project together with the project, in the same statement.
+-- The new foreign key is added NOT VALID and validated on its own, so that checking the
+-- existing issues does not block writes to them.
+
+ALTER TABLE issues DROP CONSTRAINT IF EXISTS issues_project_id_fkey, ADD CONSTRAINT issues_project_id_fkey FOREIGN KEY (project_id) REFERENCES projects (id) ON DELETE CASCADE NOT VALID;
+ALTER TABLE issues VALIDATE CONSTRAINT issues_project_id_fkey;
@@ -0,0 +1,124 @@
+"""
+0004_project_issue_stats.py
+
+Adds the project_issue_stats summary table, holding the number of issues and the last
+activity of every (project, status, priority) group, so that the statistics of a page of
+projects are read from a few rows instead of every issue of the projects (see stats.py).
+
+The table is kept up to date by statement level triggers on issues, which apply the
+changes of a whole statement (e.g. a bulk insert) at once. The table is filled while
+writes to issues are blocked, so that no change is counted twice or missed.
+
+Also adds an index of the issues by project, status and due date, used to count the
+overdue issues of the projects.
+"""
+
+from migrations import drop_invalid_index
+
+STATS_TABLE = """
+CREATE TABLE IF NOT EXISTS project_issue_stats (
+  project_id INTEGER NOT NULL,
+  status VARCHAR(255) NOT NULL,
+  priority VARCHAR(255),
+  issues INTEGER NOT NULL,
+  last_activity TIMESTAMPTZ,
+  UNIQUE NULLS NOT DISTINCT (project_id, status, priority)
+);
+"""
+
+# Latest date of an issue, the activity of a group is the latest of its issues
+ACTIVITY = "greatest(date_created, date_started, date_closed)"
+ISSUE_ACTIVITY = "greatest(i.date_created, i.date_started, i.date_closed)"
+
+STATS_TRIGGER = f"""
+CREATE OR REPLACE FUNCTION project_issue_stats_apply() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    UPDATE project_issue_stats s SET issues = s.issues - d.issues
+    FROM (
+      SELECT project_id, status, priority, count(*) AS issues
+      FROM old_rows GROUP BY project_id, status, priority
+    ) d
+    WHERE s.project_id = d.project_id AND s.status = d.status
+      AND s.priority IS NOT DISTINCT FROM d.priority;
+  END IF;
+
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    INSERT INTO project_issue_stats AS s (project_id, status, priority, issues, last_activity)
+    SELECT project_id, status, priority, count(*), max({ACTIVITY})
+    FROM new_rows GROUP BY project_id, status, priority
+    ORDER BY project_id, status, priority
+    ON CONFLICT (project_id, status, priority) DO UPDATE
+    SET issues = s.issues + EXCLUDED.issues,
+        last_activity = greatest(s.last_activity, EXCLUDED.last_activity);
+  END IF;
+
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    DELETE FROM project_issue_stats s
+    USING (SELECT DISTINCT project_id, status, priority FROM old_rows) d
+    WHERE s.project_id = d.project_id AND s.status = d.status
+      AND s.priority IS NOT DISTINCT FROM d.priority AND s.issues <= 0;
+    -- Groups that lost their latest issue get the activity of their remaining issues
+    UPDATE project_issue_stats s SET last_activity = (
+      SELECT max({ISSUE_ACTIVITY}) FROM issues i
+      WHERE i.project_id = s.project_id AND i.status = s.status
+        AND i.priority IS NOT DISTINCT FROM s.priority
+    )
+    FROM (
+      SELECT project_id, status, priority, max({ACTIVITY}) AS last_activity
+      FROM old_rows GROUP BY project_id, status, priority
+    ) d
+    WHERE s.project_id = d.project_id AND s.status = d.status
+      AND s.priority IS NOT DISTINCT FROM d.priority
+      AND d.last_activity >= s.last_activity;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER project_issue_stats_insert AFTER INSERT ON issues
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION project_issue_stats_apply();
+
+CREATE OR REPLACE TRIGGER project_issue_stats_update AFTER UPDATE ON issues
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION project_issue_stats_apply();
+
+CREATE OR REPLACE TRIGGER project_issue_stats_delete AFTER DELETE ON issues
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION project_issue_stats_apply();
+"""
+
+BACKFILL = f"""
+TRUNCATE project_issue_stats;
+INSERT INTO project_issue_stats (project_id, status, priority, issues, last_activity)
+SELECT project_id, status, priority, count(*), max({ACTIVITY})
+FROM issues GROUP BY project_id, status, priority;
+"""
+
+OVERDUE_INDEX = """
+CREATE INDEX CONCURRENTLY IF NOT EXISTS issues_project_id_status_due_idx
+ON issues (project_id, status, date_due)
+"""
+
+
+def migrate(conn, log):
+    """
+    Creates, fills and indexes the summary table, see the module docstring.
+    """
+    with conn.cursor() as cur:
+        cur.execute(STATS_TABLE)
+        # Blocks writes to issues until the table is filled and the triggers exist
+        cur.execute("LOCK TABLE issues IN SHARE MODE")
+        cur.execute(STATS_TRIGGER)
+        cur.execute(BACKFILL)
+        cur.execute("SELECT count(*) FROM project_issue_stats")
+        log(f"Filled project_issue_stats with {cur.fetchone()[0]} groups")
+    conn.commit()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            drop_invalid_index(cur, "issues_project_id_status_due_idx")
+            cur.execute(OVERDUE_INDEX)
+    finally:
+        conn.autocommit = False
@@ -0,0 +1,110 @@
+-- Versions of the data, used as the ETags of the read endpoints (see etags.py).
+-- table_writes holds a row per table and backend, with the id of the latest transaction
+-- of the backend that wrote to the table. A backend runs one transaction at a time, so
+-- writers never wait for each other, unlike with a single row per table which every writer
+-- would keep locked until its commit. The version of a table is then read from the
+-- snapshot of the reader (see etags.py): the latest writer below the xmin of the snapshot,
+-- every transaction below it being over, and the visible writers from the xmin on, usually
+-- none. Two snapshots with the same version of a table see the same writes to it.
+-- project_versions holds a version per project, bumped when the project or one of its
+-- issues is written. Versions come from a single sequence, so a version is never reused,
+-- not even after the tables are truncated and the ids start over.
+
+CREATE SEQUENCE IF NOT EXISTS data_version_seq;
+
+CREATE TABLE IF NOT EXISTS table_writes (
+  name VARCHAR(255) NOT NULL,
+  backend INTEGER NOT NULL,
+  xid XID8 NOT NULL,
+  PRIMARY KEY (name, backend)
+);
+
+CREATE OR REPLACE FUNCTION data_versions_table_written(table_name VARCHAR) RETURNS void AS $$
+  INSERT INTO table_writes (name, backend, xid)
+  VALUES (table_name, pg_backend_pid(), pg_current_xact_id())
+  ON CONFLICT (name, backend) DO UPDATE SET xid = EXCLUDED.xid
+  WHERE table_writes.xid <> EXCLUDED.xid;
+$$ LANGUAGE sql;
+
+-- Deletes the rows of the backends gone, except the latest of each table. They are below
+-- the latest writer under the xmin of every snapshot taken after, so versions stay the same
+CREATE OR REPLACE FUNCTION data_versions_prune() RETURNS void AS $$
+  DELETE FROM table_writes written
+  WHERE backend NOT IN (SELECT pid FROM pg_stat_activity)
+    AND xid < (
+      SELECT max(xid) FROM table_writes latest
+      WHERE latest.name = written.name
+        AND latest.xid < pg_snapshot_xmin(pg_current_snapshot())
+    );
+$$ LANGUAGE sql;
+
+CREATE TABLE IF NOT EXISTS project_versions (
+  project_id INTEGER PRIMARY KEY,
+  version BIGINT NOT NULL
+);
+INSERT INTO project_versions (project_id, version)
+SELECT id, nextval('data_version_seq') FROM projects
+ON CONFLICT (project_id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION data_versions_bump_projects(ids INTEGER[]) RETURNS void AS $$
+  INSERT INTO project_versions (project_id, version)
+  SELECT project_id, nextval('data_version_seq')
+  FROM (SELECT DISTINCT unnest(ids) AS project_id ORDER BY 1) changed
+  ON CONFLICT (project_id) DO UPDATE SET version = EXCLUDED.version;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION data_versions_projects() RETURNS trigger AS $$
+BEGIN
+  PERFORM data_versions_table_written('projects');
+  IF TG_OP = 'TRUNCATE' THEN
+    DELETE FROM project_versions;
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM data_versions_bump_projects(ARRAY(SELECT id FROM old_rows));
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM data_versions_bump_projects(ARRAY(SELECT id FROM new_rows));
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION data_versions_issues() RETURNS trigger AS $$
+BEGIN
+  PERFORM data_versions_table_written('issues');
+  IF TG_OP = 'TRUNCATE' THEN
+    UPDATE project_versions SET version = nextval('data_version_seq');
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM data_versions_bump_projects(ARRAY(SELECT project_id FROM old_rows));
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM data_versions_bump_projects(ARRAY(SELECT project_id FROM new_rows));
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER projects_versions_insert AFTER INSERT ON projects
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION data_versions_projects();
+CREATE OR REPLACE TRIGGER projects_versions_update AFTER UPDATE ON projects
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION data_versions_projects();
+CREATE OR REPLACE TRIGGER projects_versions_delete AFTER DELETE ON projects
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION data_versions_projects();
+CREATE OR REPLACE TRIGGER projects_versions_truncate AFTER TRUNCATE ON projects
+FOR EACH STATEMENT EXECUTE FUNCTION data_versions_projects();
+
+CREATE OR REPLACE TRIGGER issues_versions_insert AFTER INSERT ON issues
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION data_versions_issues();
+CREATE OR REPLACE TRIGGER issues_versions_update AFTER UPDATE ON issues
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION data_versions_issues();
+CREATE OR REPLACE TRIGGER issues_versions_delete AFTER DELETE ON issues
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION data_versions_issues();
+CREATE OR REPLACE TRIGGER issues_versions_truncate AFTER TRUNCATE ON issues
+FOR EACH STATEMENT EXECUTE FUNCTION data_versions_issues();
@@ -0,0 +1,9 @@
+-- migrate: no-transaction
+-- Full-text search over the titles and descriptions of the issues (see search.py).
+-- The document of an issue is an expression of its title and description, indexed by a GIN
+-- expression index. Unlike a stored generated column, the index does not rewrite the issues
+-- table under an ACCESS EXCLUSIVE lock: it is built concurrently, so that writes are not
+-- blocked on large tables. Queries must use the same expression (SEARCH_DOCUMENT in
+-- search.py) for the index to be used.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS issues_search_idx ON issues USING GIN ((setweight(to_tsvector('english', coalesce(title, '')), 'A') || setweight(to_tsvector('english', coalesce(description, '')), 'B')));
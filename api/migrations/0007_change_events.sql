@@ -0,0 +1,103 @@
+-- Change feed of the projects and issues, streamed to the clients of /events (see events.py).
+-- Every written row adds an event to change_events, then a NOTIFY on the trackify_events
+-- channel, sent at commit, wakes up the listeners of the API processes, which read the new
+-- events from the table. Clients resuming after a disconnect read the events they missed
+-- from the table as well.
+-- A listener must never move past an event and then read one committed later with a
+-- smaller position. Events are therefore ordered by (revision, id), the revision of an event
+-- being the id of its transaction (row_revision), which the row revisions of the delta sync
+-- use as well (see 0008_row_revisions.py). Transactions do not commit in the order of their
+-- ids, so readers only return the changes below the xmin of their snapshot
+-- (row_revisions_horizon), whose transactions are all over: a change committed later always
+-- has a greater revision than the changes returned, and writers never wait for each other.
+-- A transaction left open (an export, a migration, a session idle in transaction) holds
+-- back the changes of the transactions that started after it until it ends, with no
+-- timeout: /metrics exports the lag as trackify_db_revision_horizon_lag (see
+-- row_revisions_horizon_lag), and idle_in_transaction_session_timeout bounds the idle
+-- sessions.
+
+CREATE OR REPLACE FUNCTION row_revision() RETURNS BIGINT AS $$
+  SELECT pg_current_xact_id()::text::bigint;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION row_revisions_horizon() RETURNS BIGINT AS $$
+  SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint;
+$$ LANGUAGE sql STABLE;
+
+-- Transactions started since the oldest one still open, 0 when none is held back
+CREATE OR REPLACE FUNCTION row_revisions_horizon_lag() RETURNS BIGINT AS $$
+  SELECT pg_snapshot_xmax(snapshot)::text::bigint - pg_snapshot_xmin(snapshot)::text::bigint
+  FROM pg_current_snapshot() snapshot;
+$$ LANGUAGE sql STABLE;
+
+CREATE TABLE IF NOT EXISTS change_events (
+  id BIGSERIAL PRIMARY KEY,
+  table_name VARCHAR(255) NOT NULL,
+  operation VARCHAR(16) NOT NULL,
+  row_id INTEGER,
+  project_id INTEGER,
+  revision BIGINT NOT NULL,
+  date_created TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS change_events_revision_idx ON change_events (revision, id);
+CREATE INDEX IF NOT EXISTS change_events_project_revision_idx
+ON change_events (project_id, revision, id);
+CREATE INDEX IF NOT EXISTS change_events_date_created_idx ON change_events (date_created);
+
+CREATE OR REPLACE FUNCTION change_events_projects() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP = 'TRUNCATE' THEN
+    INSERT INTO change_events (table_name, operation, revision)
+    VALUES ('projects', 'truncate', row_revision());
+  ELSIF TG_OP = 'DELETE' THEN
+    INSERT INTO change_events (table_name, operation, row_id, project_id, revision)
+    SELECT 'projects', 'delete', id, id, row_revision() FROM old_rows ORDER BY id;
+  ELSE
+    INSERT INTO change_events (table_name, operation, row_id, project_id, revision)
+    SELECT 'projects', lower(TG_OP), id, id, row_revision() FROM new_rows ORDER BY id;
+  END IF;
+  PERFORM pg_notify('trackify_events', '');
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION change_events_issues() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP = 'TRUNCATE' THEN
+    INSERT INTO change_events (table_name, operation, revision)
+    VALUES ('issues', 'truncate', row_revision());
+  ELSIF TG_OP = 'DELETE' THEN
+    INSERT INTO change_events (table_name, operation, row_id, project_id, revision)
+    SELECT 'issues', 'delete', id, project_id, row_revision() FROM old_rows ORDER BY id;
+  ELSE
+    INSERT INTO change_events (table_name, operation, row_id, project_id, revision)
+    SELECT 'issues', lower(TG_OP), id, project_id, row_revision() FROM new_rows ORDER BY id;
+  END IF;
+  PERFORM pg_notify('trackify_events', '');
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER projects_events_insert AFTER INSERT ON projects
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION change_events_projects();
+CREATE OR REPLACE TRIGGER projects_events_update AFTER UPDATE ON projects
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION change_events_projects();
+CREATE OR REPLACE TRIGGER projects_events_delete AFTER DELETE ON projects
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION change_events_projects();
+CREATE OR REPLACE TRIGGER projects_events_truncate AFTER TRUNCATE ON projects
+FOR EACH STATEMENT EXECUTE FUNCTION change_events_projects();
+
+CREATE OR REPLACE TRIGGER issues_events_insert AFTER INSERT ON issues
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION change_events_issues();
+CREATE OR REPLACE TRIGGER issues_events_update AFTER UPDATE ON issues
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION change_events_issues();
+CREATE OR REPLACE TRIGGER issues_events_delete AFTER DELETE ON issues
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION change_events_issues();
+CREATE OR REPLACE TRIGGER issues_events_truncate AFTER TRUNCATE ON issues
+FOR EACH STATEMENT EXECUTE FUNCTION change_events_issues();
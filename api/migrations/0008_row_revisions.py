@@ -0,0 +1,120 @@
+"""
+0008_row_revisions.py
+
+Adds a revision and an updated_at column to the projects and issues, and a tombstones
+table recording the deleted rows, for the delta sync of the clients (see sync.py).
+
+Every insert or update gives the row the revision of its transaction and the current
+time. Every delete adds a tombstone with the revision of its transaction, and a truncation
+a tombstone without a row id. Revisions are the ones of the change feed (row_revision, see
+0007_change_events.sql): readers only return the changes below the horizon of their
+snapshot, so a client that synced up to a revision never misses a row committed later with
+a smaller one.
+
+The columns are added with a default of 0, which postgres stores without rewriting the
+tables: rows written before this migration have revision 0 until they are written again.
+The (revision, id) indexes are then built concurrently.
+"""
+
+from migrations import drop_invalid_index
+
+COLUMNS = """
+ALTER TABLE projects
+  ADD COLUMN IF NOT EXISTS revision BIGINT NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ;
+ALTER TABLE issues
+  ADD COLUMN IF NOT EXISTS revision BIGINT NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ;
+
+CREATE TABLE IF NOT EXISTS tombstones (
+  revision BIGINT NOT NULL,
+  table_name VARCHAR(255),
+  row_id INTEGER,
+  project_id INTEGER,
+  operation VARCHAR(16) NOT NULL,
+  date_deleted TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS tombstones_revision_idx ON tombstones (revision, row_id);
+CREATE INDEX IF NOT EXISTS tombstones_date_deleted_idx ON tombstones (date_deleted);
+"""
+
+TRIGGERS = """
+CREATE OR REPLACE FUNCTION row_revisions_set() RETURNS trigger AS $$
+BEGIN
+  NEW.revision := row_revision();
+  NEW.updated_at := now();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION row_revisions_tombstones() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP = 'TRUNCATE' THEN
+    INSERT INTO tombstones (revision, table_name, operation)
+    VALUES (row_revision(), TG_TABLE_NAME, 'truncate');
+  ELSIF TG_TABLE_NAME = 'projects' THEN
+    INSERT INTO tombstones (revision, table_name, row_id, project_id, operation)
+    SELECT row_revision(), 'projects', id, id, 'delete' FROM old_rows;
+  ELSE
+    INSERT INTO tombstones (revision, table_name, row_id, project_id, operation)
+    SELECT row_revision(), 'issues', id, project_id, 'delete' FROM old_rows;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Replaces the tombstones older than an interval by a single 'prune' tombstone holding
+-- their latest revision, clients that synced before it have to sync everything again
+CREATE OR REPLACE FUNCTION row_revisions_prune(older_than INTERVAL) RETURNS void AS $$
+  WITH pruned AS (
+    DELETE FROM tombstones
+    WHERE date_deleted < now() - older_than OR operation = 'prune'
+    RETURNING revision
+  )
+  INSERT INTO tombstones (revision, operation)
+  SELECT max(revision), 'prune' FROM pruned HAVING max(revision) IS NOT NULL;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE TRIGGER projects_revision BEFORE INSERT OR UPDATE ON projects
+FOR EACH ROW EXECUTE FUNCTION row_revisions_set();
+CREATE OR REPLACE TRIGGER issues_revision BEFORE INSERT OR UPDATE ON issues
+FOR EACH ROW EXECUTE FUNCTION row_revisions_set();
+
+CREATE OR REPLACE TRIGGER projects_tombstones AFTER DELETE ON projects
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION row_revisions_tombstones();
+CREATE OR REPLACE TRIGGER projects_tombstones_truncate AFTER TRUNCATE ON projects
+FOR EACH STATEMENT EXECUTE FUNCTION row_revisions_tombstones();
+CREATE OR REPLACE TRIGGER issues_tombstones AFTER DELETE ON issues
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION row_revisions_tombstones();
+CREATE OR REPLACE TRIGGER issues_tombstones_truncate AFTER TRUNCATE ON issues
+FOR EACH STATEMENT EXECUTE FUNCTION row_revisions_tombstones();
+"""
+
+INDEXES = {
+    "projects_revision_idx": "projects (revision, id)",
+    "issues_revision_idx": "issues (revision, id)",
+}
+
+
+def migrate(conn, log):
+    """
+    Adds the columns, the tombstones and the triggers, then builds the indexes, see the
+    module docstring.
+    """
+    with conn.cursor() as cur:
+        cur.execute(COLUMNS)
+        cur.execute(TRIGGERS)
+    conn.commit()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for name, definition in INDEXES.items():
+                drop_invalid_index(cur, name)
+                cur.execute(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}"
+                )
+                log(f"Built {name}")
+    finally:
+        conn.autocommit = False
@@ -0,0 +1,233 @@
+"""
+pagination.py
+
+Contains the keyset (cursor) pagination helpers used by the list endpoints of the API.
+
+List endpoints return at most `limit` rows ordered by the sort column and id, together
+with a `next_cursor` token. Passing that token back as `after` returns the rows that come
+after the last row of the previous page, using an index range scan instead of an OFFSET.
+
+Query parameters:
+limit - Page size, defaults to PAGE_SIZE_DEFAULT and is capped at PAGE_SIZE_MAX.
+        `limit=all` explicitly asks for every row in a single response.
+after - Cursor returned as `next_cursor` by the previous page
+sort - Column to sort by, out of the columns allowed by the endpoint (default id)
+order - asc (default) or desc. Empty values come last in ascending order and first in
+        descending order.
+"""
+
+import os
+import json
+import base64
+import binascii
+from collections import namedtuple
+from datetime import datetime as dt
+from dbtypes import DATE_FIELDS
+
+DEFAULT_PAGE_SIZE = int(os.environ.get("PAGE_SIZE_DEFAULT", "100"))
+MAX_PAGE_SIZE = int(os.environ.get("PAGE_SIZE_MAX", "1000"))
+
+# Sortable columns of an endpoint that only sorts by id, column -> whether it can be NULL
+ID_SORTS = {"id": False}
+
+# Pagination arguments of a request
+# limit: page size or None for every row, after: cursor values or None for the first page,
+# sort: column to sort by, order: "asc" or "desc", nullable: whether the sort column can be NULL
+Page = namedtuple("Page", ["limit", "after", "sort", "order", "nullable"])
+
+
+def encode_cursor(values):
+    """
+    Encodes the sort key of the last row of a page into an opaque cursor.
+
+    :param values: List of values identifying the last row, non JSON values are
+                   stored as strings
+    :return: URL safe cursor string
+    """
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor created by `encode_cursor`.
+
+    :param cursor: Cursor string
+    :return: List of values identifying the last row of the previous page
+    :raises ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(values, list) or not values:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return values
+
+
+def check_cursor(values, sort, nullable):
+    """
+    Checks that the values of a cursor match the sort column, so that a cursor of
+    another sort or an edited one is refused before reaching the query.
+
+    Cursors hold the id of the last row, preceded by its sort value unless sorting by id.
+    Sort values are strings, dates in the format returned by the API, or None if the
+    column can be NULL.
+
+    :param values: Values returned by `decode_cursor`
+    :param sort: Column the page is sorted by
+    :param nullable: Whether the sort column can be NULL
+    :return: Whether the values are a cursor of the sort
+    """
+    if len(values) != (1 if sort == "id" else 2):
+        return False
+    last_id = values[-1]
+    if not isinstance(last_id, int) or isinstance(last_id, bool):
+        return False
+    if sort == "id":
+        return True
+    value = values[0]
+    if value is None:
+        return nullable
+    if not isinstance(value, str):
+        return False
+    if sort in DATE_FIELDS:
+        try:
+            dt.fromisoformat(value)
+        except ValueError:
+            return False
+    return True
+
+
+def parse_limit(args):
+    """
+    Reads the `limit` query parameter of a request.
+
+    :param args: Query parameters of the request
+    :return: Page size, or None for every row
+    :raises ValueError: If the limit is invalid
+    """
+    limit = args.get("limit")
+    if limit is None or limit == "":
+        return DEFAULT_PAGE_SIZE
+    if limit.lower() == "all":
+        return None
+    try:
+        limit = int(limit)
+    except ValueError as e:
+        raise ValueError(
+            f"Invalid limit: {limit}. Use a positive integer or 'all'"
+        ) from e
+    if limit < 1:
+        raise ValueError(f"Invalid limit: {limit}. Use a positive integer or 'all'")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def parse_page_args(args, sorts=None):
+    """
+    Reads the pagination query parameters of a request.
+
+    :param args: Query parameters of the request
+    :param sorts: Columns the endpoint can be sorted by, column -> whether it can be NULL
+    :return: Page with the pagination arguments
+    :raises ValueError: If a parameter is invalid
+    """
+    sorts = sorts or ID_SORTS
+    limit = parse_limit(args)
+
+    sort = args.get("sort") or "id"
+    if sort not in sorts:
+        raise ValueError(f"Invalid sort: {sort}. Use one of {', '.join(sorts)}")
+    order = (args.get("order") or "asc").lower()
+    if order not in ("asc", "desc"):
+        raise ValueError(f"Invalid order: {order}. Use asc or desc")
+
+    after = args.get("after")
+    if after:
+        values = decode_cursor(after)
+        if not check_cursor(values, sort, sorts[sort]):
+            raise ValueError(f"Invalid cursor for sort {sort}: {after}")
+    else:
+        values = None
+    return Page(limit, values, sort, order, sorts[sort])
+
+
+def keyset_condition(page):
+    """
+    Builds the condition selecting the rows after the cursor of a page.
+
+    Rows are ordered by (sort column, id). Postgres puts NULLs last in ascending and
+    first in descending order, which is mirrored here.
+
+    :param page: Page with a cursor
+    :return: (condition, params)
+    """
+    op = ">" if page.order == "asc" else "<"
+    if page.sort == "id":
+        return f"id {op} %s", [page.after[0]]
+    column = page.sort
+    value, last_id = page.after
+    if not page.nullable:
+        return f"({column}, id) {op} (%s, %s)", [value, last_id]
+    if page.order == "asc":
+        if value is None:
+            return f"({column} IS NULL AND id > %s)", [last_id]
+        return f"(({column}, id) > (%s, %s) OR {column} IS NULL)", [value, last_id]
+    if value is None:
+        return f"({column} IS NULL AND id < %s OR {column} IS NOT NULL)", [last_id]
+    return f"({column}, id) < (%s, %s)", [value, last_id]
+
+
+def page_query(table, conditions, params, page, columns=("*",)):
+    """
+    Builds the query returning one page of a table.
+
+    One more row than the page size is selected so that `split_page` can tell whether
+    there is a next page.
+
+    :param table: Name of the table to select from
+    :param conditions: List of SQL conditions (with %s placeholders) the rows must match
+    :param params: Parameters of the conditions
+    :param page: Page with the pagination arguments
+    :param columns: Columns to select, every column by default
+    :return: (query, params)
+    """
+    conditions = list(conditions)
+    params = list(params)
+    if page.after is not None:
+        condition, condition_params = keyset_condition(page)
+        conditions.append(condition)
+        params += condition_params
+    query = f"SELECT {', '.join(columns)} FROM {table}"
+    if conditions:
+        query += f" WHERE {' AND '.join(conditions)}"
+    if page.sort == "id":
+        query += f" ORDER BY id {page.order.upper()}"
+    else:
+        query += f" ORDER BY {page.sort} {page.order.upper()}, id {page.order.upper()}"
+    if page.limit is not None:
+        query += " LIMIT %s"
+        params.append(page.limit + 1)
+    return query, params
+
+
+def split_page(rows, page, description):
+    """
+    Separates the rows of a page from the extra row selected by `page_query`.
+
+    :param rows: Rows returned by the page query
+    :param page: Page with the pagination arguments
+    :param description: Description of the cursor the rows were fetched from
+    :return: (rows of the page, cursor of the next page or None on the last page)
+    """
+    if page.limit is None or len(rows) <= page.limit:
+        return rows, None
+    rows = rows[: page.limit]
+    columns = [column.name for column in description]
+    last = rows[-1]
+    if page.sort == "id":
+        return rows, encode_cursor([last[columns.index("id")]])
+    return rows, encode_cursor(
+        [last[columns.index(page.sort)], last[columns.index("id")]]
+    )
@@ -0,0 +1,294 @@
+"""
+profiling.py
+
+Contains the opt-in profiling of single requests of the API, to see where the time of a slow
+request goes on real data.
+
+A request is profiled when:
+- it has an X-Profile header equal to PROFILE_TOKEN. Without PROFILE_TOKEN set, the header
+  is ignored, so that clients cannot profile requests unless they know the secret
+- or it is picked at random, with PROFILE_SAMPLE_RATE the fraction of requests picked
+  (default 0, none)
+
+While the handler runs, a sampling profiler reads the stack of the thread serving it every
+PROFILE_INTERVAL seconds (default 0.001), following async handlers to the thread they run
+on. The hooks of the app are profiled too, streamed responses only up to the handler's
+return. Unlike a deterministic profiler it barely slows the request down, and each sample
+is a whole stack.
+
+The profile is written to PROFILE_DIR (default trackify-profiles in the temporary
+directory) as <profile id>.folded, in the collapsed stack format of flamegraph.pl,
+speedscope and inferno: one line per stack, its frames from the root separated by ";",
+then the number of samples. The request id is the X-Request-ID header of the request (e.g.
+set by nginx), or a new one, and is returned in the X-Request-ID header of the response.
+The profile id is the request id followed by a new uuid, so that a repeated or forged
+request id cannot overwrite an earlier profile, and is returned in the X-Profile-ID
+header. Every profile is logged to the trackify.profiles logger.
+"""
+
+import os
+import re
+import sys
+import hmac
+import time
+import uuid
+import inspect
+import random
+import logging
+import tempfile
+import functools
+import threading
+import contextvars
+from collections import Counter
+from flask import request
+
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN") or None
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", "0.001"))
+PROFILE_DIR = os.environ.get(
+    "PROFILE_DIR", os.path.join(tempfile.gettempdir(), "trackify-profiles")
+)
+# Header asking for a profile, with PROFILE_TOKEN as value
+PROFILE_HEADER = "X-Profile"
+REQUEST_ID_HEADER = "X-Request-ID"
+PROFILE_ID_HEADER = "X-Profile-ID"
+# Request ids taken from the request, they start the names of the profile files
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9_.-]{1,64}")
+
+logger = logging.getLogger("trackify.profiles")
+
+
+def frame_name(frame):
+    """
+    Returns the name of a frame in a stack, "function (file:line)".
+    """
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def collapse(frame):
+    """
+    Returns a stack in the collapsed format, from the root to a frame.
+
+    :param frame: Innermost frame of the stack
+    :return: Names of the frames, separated by ";"
+    """
+    frames = []
+    while frame is not None:
+        frames.append(frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(frames))
+
+
+def collapse_awaits(coroutine):
+    """
+    Returns the stack of a suspended coroutine in the collapsed format: the coroutines it
+    awaits, down to the awaited future.
+
+    :param coroutine: Coroutine object
+    :return: Names of the frames, separated by ";"
+    """
+    frames = []
+    awaitable = coroutine
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(
+            awaitable, "gi_frame", None
+        )
+        if frame is None:
+            frames.append(f"<awaiting {type(awaitable).__name__}>")
+            break
+        frames.append(frame_name(frame))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(
+            awaitable, "gi_yieldfrom", None
+        )
+    return ";".join(frames)
+
+
+class StackSampler:  # pylint: disable=too-many-instance-attributes
+    """
+    Sampling profiler of the thread serving a request, see the module docstring.
+    """
+
+    def __init__(self, request_id, interval):
+        """
+        :param request_id: Id of the profiled request
+        :param interval: Seconds between samples
+        """
+        self.request_id = request_id
+        # Names the profile file, unique even if request ids repeat
+        self.profile_id = f"{request_id}-{uuid.uuid4().hex}"
+        self.interval = interval
+        # Thread running the code of the request, changed while async handlers run
+        self.thread_id = threading.get_ident()
+        # (stack, coroutine) of the async handler running, see `_follow_async`
+        self.handler = None
+        self.stacks = Counter()
+        self.start = time.perf_counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f"profiler-{request_id}", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        """
+        Samples the stack of the request until stopped.
+        """
+        while not self._stopped.wait(self.interval):
+            # pylint: disable-next=protected-access
+            frame = sys._current_frames().get(self.thread_id)
+            stack, coroutine = self.handler or (None, None)
+            if (
+                coroutine is not None
+                and inspect.getcoroutinestate(coroutine) == inspect.CORO_SUSPENDED
+            ):
+                # The thread waits in its event loop, the time goes to what the handler
+                # awaits
+                self.stacks[f"{stack};{collapse_awaits(coroutine)}"] += 1
+            elif frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+    def stop(self):
+        """
+        Stops sampling.
+
+        :return: Seconds the request was profiled for
+        """
+        self._stopped.set()
+        self._thread.join()
+        return time.perf_counter() - self.start
+
+    def collapsed(self):
+        """
+        Returns the samples in the collapsed stack format, the most frequent stacks first.
+        """
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+
+# Profiler of the request being served, None if it is not profiled
+_sampler = contextvars.ContextVar("request_sampler", default=None)
+
+
+def wants_profile(headers):
+    """
+    Returns whether a request must be profiled, see the module docstring.
+
+    :param headers: Headers of the request
+    """
+    token = headers.get(PROFILE_HEADER)
+    if token is not None and PROFILE_TOKEN is not None:
+        # Compared in constant time, so that the token cannot be guessed from timings
+        if hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode()):
+            return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def get_request_id(headers):
+    """
+    Returns the id of a request: its X-Request-ID header if it is a valid id, else a new
+    one.
+
+    :param headers: Headers of the request
+    """
+    given = headers.get(REQUEST_ID_HEADER, "")
+    if REQUEST_ID_PATTERN.fullmatch(given):
+        return given
+    return uuid.uuid4().hex
+
+
+def profile_path(profile_id):
+    """
+    Returns the path of a profile.
+
+    :param profile_id: Id of the profile, see `StackSampler`
+    """
+    return os.path.join(PROFILE_DIR, f"{profile_id}.folded")
+
+
+def _start_profile():
+    """
+    Starts profiling the request if asked for. Registered with `app.before_request`.
+    """
+    if wants_profile(request.headers):
+        _sampler.set(StackSampler(get_request_id(request.headers), PROFILE_INTERVAL))
+
+
+def _finish_profile(response):
+    """
+    Stops profiling the request and saves its profile. Registered with
+    `app.after_request`.
+
+    :param response: Response of the handler
+    :return: The same response, with the ids of the request and its profile
+    """
+    sampler = _sampler.get()
+    if sampler is None:
+        return response
+    _sampler.set(None)
+    seconds = sampler.stop()
+    path = profile_path(sampler.profile_id)
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(sampler.collapsed())
+    except OSError as e:
+        logger.error("Could not save the profile of %s: %s", sampler.request_id, e)
+    else:
+        route = request.url_rule.rule if request.url_rule else request.path
+        logger.info(
+            "Profiled %s %s (request %s, %.1f ms, %d samples) to %s",
+            request.method,
+            route,
+            sampler.request_id,
+            seconds * 1000,
+            sum(sampler.stacks.values()),
+            path,
+        )
+    response.headers[REQUEST_ID_HEADER] = sampler.request_id
+    response.headers[PROFILE_ID_HEADER] = sampler.profile_id
+    return response
+
+
+def _follow_async(func):
+    """
+    Wraps an async view or hook so that the profiler of the request samples the thread it
+    runs on, flask runs them on their own event loop thread, and what it awaits.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        sampler = _sampler.get()
+        if sampler is None:
+            return await func(*args, **kwargs)
+        previous = (sampler.thread_id, sampler.handler)
+        coroutine = func(*args, **kwargs)
+        sampler.thread_id = threading.get_ident()
+        sampler.handler = (collapse(inspect.currentframe()), coroutine)
+        try:
+            return await coroutine
+        finally:
+            sampler.thread_id, sampler.handler = previous
+
+    return wrapper
+
+
+def profile_requests(app):
+    """
+    Profiles the requests of a flask app that ask for it, see the module docstring. Must be
+    called before the other hooks are registered, so that they are profiled too.
+
+    :param app: Flask application
+    """
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    # Async views run through app.ensure_sync, which flask lets apps override
+    ensure_sync = app.ensure_sync
+
+    def profiled_ensure_sync(func):
+        if inspect.iscoroutinefunction(func):
+            func = _follow_async(func)
+        return ensure_sync(func)
+
+    app.ensure_sync = profiled_ensure_sync
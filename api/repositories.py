@@ -0,0 +1,310 @@
+"""
+repositories.py
+
+Contains the queries of the projects and issues tables, shared by every route handler.
+
+Every query names its columns instead of using SELECT *, so that a migration adding or
+reordering columns does not change what the API returns. Reads run on the database access
+of the read endpoints (see aiodb.py), writes on the cursor of the handler's transaction.
+
+The hot lookups are server-side prepared statements, parsed and planned once per
+connection instead of on every request:
+- projects_by_id, issues_by_id: a project or issue by id
+- issues_by_project: a page of the issues of a project, sorted by id and not filtered
+
+The reads can be limited to some columns with the `fields` query parameter of the GET
+endpoints (e.g. `fields=id,title,status`), so that large columns like the descriptions are
+neither read nor sent. The id and sort columns are still selected for the pagination, and
+dropped from the response by `trim` if they were not asked for. Reads of some columns are
+not prepared.
+"""
+
+from pagination import page_query, split_page
+from search import search_query, split_search_page
+from serialize import row_dicts
+
+
+class Repository:
+    """
+    Queries of one table, see the module docstring.
+    """
+
+    # Name of the table
+    table = None
+    # Columns returned by the reads, in the order of the JSON objects
+    columns = ()
+    # Columns the API sets, every column but the id
+    writable = ()
+
+    def parse_fields(self, args):
+        """
+        Validates the `fields` query parameter of a request.
+
+        :param args: Query parameters of the request
+        :return: Tuple of the columns asked for in column order, or None for every column
+        :raises ValueError: If a field is not a column
+        """
+        value = args.get("fields")
+        if value is None:
+            return None
+        fields = {field.strip() for field in value.split(",") if field.strip()}
+        unknown = sorted(fields - set(self.columns))
+        if not fields or unknown:
+            raise ValueError(
+                f"Invalid fields: {', '.join(unknown) or value}. "
+                f"Use a comma separated list of {', '.join(self.columns)}"
+            )
+        return tuple(column for column in self.columns if column in fields)
+
+    def select_columns(self, fields, *required):
+        """
+        Returns the columns to select for the given fields.
+
+        :param fields: Columns asked for, or None for every column
+        :param required: Columns the query needs besides the fields
+        """
+        if fields is None:
+            return self.columns
+        return tuple(
+            column for column in self.columns if column in fields or column in required
+        )
+
+    def trim(self, rows, fields):
+        """
+        Drops the columns that were not asked for from rows, see `select_columns`.
+
+        :param rows: List of rows as dicts
+        :param fields: Columns asked for, or None for every column
+        :return: List of rows as dicts, keys that are not columns are kept
+        """
+        if fields is None:
+            return rows
+        dropped = set(self.columns) - set(fields)
+        return [
+            {key: value for key, value in row.items() if key not in dropped}
+            for row in rows
+        ]
+
+    def page_query(self, conditions, params, page, columns=None):
+        """
+        Returns the query of a page of rows, see pagination.page_query.
+
+        :param columns: Columns to select, every column by default
+        """
+        return page_query(self.table, conditions, params, page, columns or self.columns)
+
+    async def get(self, db, row_id, fields=None):
+        """
+        Returns a row by id.
+
+        :param db: Database access of the read endpoints, see aiodb.py
+        :param row_id: ID of the row
+        :param fields: Columns to select besides the id, or None for every column
+        :return: Row as a dict, or None if there is no such row
+        :raises psycopg2.Error: If the query fails
+        """
+        columns = self.select_columns(fields, "id")
+        rows, description = await db.fetch(
+            f"SELECT {', '.join(columns)} FROM {self.table} WHERE id = %s",
+            (row_id,),
+            prepare=f"{self.table}_by_id" if fields is None else None,
+        )
+        return row_dicts(rows, description)[0] if rows else None
+
+    async def get_many(self, db, row_ids):
+        """
+        Returns rows by id.
+
+        :param db: Database access of the read endpoints, see aiodb.py
+        :param row_ids: IDs of the rows
+        :return: List of rows as dicts, in no particular order, without missing rows
+        :raises psycopg2.Error: If the query fails
+        """
+        rows, description = await db.fetch(
+            f"SELECT {', '.join(self.columns)} FROM {self.table} WHERE id = ANY(%s)",
+            (list(row_ids),),
+        )
+        return row_dicts(rows, description)
+
+    async def page(self, db, conditions, params, page, fields=None):
+        """
+        Returns a page of rows.
+
+        :param db: Database access of the read endpoints, see aiodb.py
+        :param conditions: List of SQL conditions (with %s placeholders) the rows must match
+        :param params: Parameters of the conditions
+        :param page: Page with the pagination arguments
+        :param fields: Columns to select besides the id and sort column, or None for all
+        :return: (list of rows as dicts, cursor of the next page or None)
+        :raises psycopg2.Error: If the query fails
+        """
+        columns = self.select_columns(fields, "id", page.sort)
+        rows, description = await db.fetch(
+            *self.page_query(conditions, params, page, columns)
+        )
+        rows, next_cursor = split_page(rows, page, description)
+        return row_dicts(rows, description), next_cursor
+
+    def insert(self, cur, data):
+        """
+        Inserts a row.
+
+        :param cur: Open cursor
+        :param data: dict of column -> value, with the `writable` columns
+        :return: Number of inserted rows
+        """
+        columns = [column for column in self.writable if column in data]
+        cur.execute(
+            f"INSERT INTO {self.table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))}) RETURNING id",
+            [data[column] for column in columns],
+        )
+        return cur.rowcount
+
+    def update(self, cur, row_id, data):
+        """
+        Updates the given columns of a row, columns set to None are left unchanged.
+
+        :param cur: Open cursor
+        :param row_id: ID of the row
+        :param data: dict of column -> value
+        :return: Number of updated rows, -1 if there was nothing to update
+        """
+        updates = []
+        args = []
+        for column in self.writable:
+            if data.get(column) is not None:
+                updates.append(f"{column} = %s")
+                args.append(data[column])
+        if not updates:
+            return -1
+        cur.execute(
+            f"UPDATE {self.table} SET {', '.join(updates)} WHERE id = %s",
+            args + [row_id],
+        )
+        return cur.rowcount
+
+    def delete(self, cur, row_id):
+        """
+        Deletes a row.
+
+        :param cur: Open cursor
+        :param row_id: ID of the row
+        :return: Number of deleted rows
+        """
+        cur.execute(f"DELETE FROM {self.table} WHERE id = %s", (row_id,))
+        return cur.rowcount
+
+
+class ProjectRepository(Repository):
+    """
+    Queries of the projects table.
+    """
+
+    table = "projects"
+    columns = (
+        "id",
+        "name",
+        "description",
+        "status",
+        "priority",
+        "date_created",
+        "date_started",
+        "date_closed",
+        "labels",
+    )
+    writable = columns[1:]
+
+    def lock(self, cur, project_id):
+        """
+        Locks a project against deletion until the end of the transaction.
+
+        :param cur: Open cursor
+        :param project_id: ID of the project
+        :return: Whether the project exists
+        """
+        cur.execute("SELECT id FROM projects WHERE id = %s FOR SHARE", (project_id,))
+        return cur.fetchone() is not None
+
+
+class IssueRepository(Repository):
+    """
+    Queries of the issues table.
+    """
+
+    table = "issues"
+    columns = (
+        "id",
+        "project_id",
+        "title",
+        "type",
+        "description",
+        "status",
+        "priority",
+        "date_created",
+        "date_started",
+        "date_due",
+        "date_closed",
+        "labels",
+    )
+    writable = columns[1:]
+
+    def project_page_query(self, project_id, conditions, params, page, columns=None):
+        """
+        Returns the query of a page of the issues of a project, see `page_query`.
+        """
+        return self.page_query(
+            ["project_id = %s"] + conditions, [project_id] + params, page, columns
+        )
+
+    async def project_page(
+        self, db, project_id, conditions, params, page, fields=None
+    ):  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        """
+        Returns a page of the issues of a project, see `page`.
+
+        The first and following pages of every column sorted by id without filters, which
+        is how the app lists the issues of a project, use the issues_by_project prepared
+        statement.
+
+        :param project_id: ID of the project
+        """
+        if conditions or fields is not None or page.sort != "id" or page.order != "asc":
+            return await self.page(
+                db,
+                ["project_id = %s"] + conditions,
+                [project_id] + params,
+                page,
+                fields,
+            )
+        rows, description = await db.fetch(
+            f"SELECT {', '.join(self.columns)} FROM issues "
+            "WHERE project_id = %s AND id > %s ORDER BY id LIMIT %s",
+            (
+                project_id,
+                page.after[0] if page.after is not None else 0,
+                page.limit + 1 if page.limit is not None else None,
+            ),
+            prepare="issues_by_project",
+        )
+        rows, next_cursor = split_page(rows, page, description)
+        return row_dicts(rows, description), next_cursor
+
+    async def search(self, db, search, conditions, params, fields=None):
+        """
+        Returns a page of the issues matching a full-text search, see search.py.
+
+        :param db: Database access of the read endpoints, see aiodb.py
+        :param search: Search with the search arguments
+        :param conditions: List of SQL conditions (with %s placeholders) the issues must match
+        :param params: Parameters of the conditions
+        :param fields: Columns to select besides the id, or None for every column
+        :return: (list of issues as dicts with their rank, cursor of the next page or None)
+        :raises psycopg2.Error: If the query fails
+        """
+        columns = self.select_columns(fields, "id")
+        rows, description = await db.fetch(
+            *search_query(search, conditions, params, columns)
+        )
+        rows, next_cursor = split_search_page(rows, search, description)
+        return row_dicts(rows, description), next_cursor
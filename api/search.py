@@ -0,0 +1,154 @@
+"""
+search.py
+
+Contains the full-text search of the issues, used by the /search endpoint of the API.
+
+Issues are matched on their title and description through the SEARCH_DOCUMENT expression
+and its GIN index, see migrations/0006_issue_search.sql. A match in the title ranks higher
+than a match in the description.
+
+Query parameters:
+q - Search terms, in the syntax of web search engines: every word must appear, "quoted
+    phrases" must appear in that order, `or` separates alternatives and -word excludes
+    a word. Words are stemmed, so `crash` also finds `crashes`.
+project_id - Only issues of the given project
+status, priority, type, label, date_* - Only issues matching these filters, see filters.py
+limit - Page size, see pagination.py
+after - Cursor returned as `next_cursor` by the previous page
+
+Results are sorted by rank, best first, then by id. Pages are selected by keyset on
+(rank, id), like the list endpoints, see pagination.py.
+
+Ranking a match builds its document again from the title and description, so a word found
+in a large part of the issues would make every search of it parse and rank that many rows. Only the SEARCH_MAX_MATCHES (default
+5000, 0 for no limit) most recent matches, by id, are ranked: searches with more matches
+return the best of those, and older matches past the cap are not ranked nor returned.
+Such searches should be narrowed down with more words or filters. The ranked matches are
+the same for every page, so pages neither skip nor repeat matches.
+"""
+
+import os
+from collections import namedtuple
+from pagination import decode_cursor, encode_cursor, parse_limit
+
+# Text search configuration and document of the issues, the expression of the index of the
+# migration: the index is only used by queries with the very same expression
+SEARCH_CONFIG = "english"
+SEARCH_DOCUMENT = (
+    f"(setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B'))"
+)
+SEARCH_MAX_MATCHES = int(os.environ.get("SEARCH_MAX_MATCHES", "5000"))
+
+# Search arguments of a request
+# terms: search terms, limit: page size or None for every match,
+# after: (rank, id) of the last match of the previous page or None for the first page
+Search = namedtuple("Search", ["terms", "limit", "after"])
+
+
+def parse_search_args(args):
+    """
+    Reads the search, scope and pagination query parameters of a request.
+
+    :param args: Query parameters of the request
+    :return: Search with the search arguments
+    :raises ValueError: If a parameter is invalid
+    """
+    terms = (args.get("q") or "").strip()
+    if not terms:
+        raise ValueError("Missing search terms. Use q, e.g. q=login error")
+    limit = parse_limit(args)
+
+    after = args.get("after")
+    if after:
+        values = decode_cursor(after)
+        # Cursors hold the rank and id of the last match
+        if (
+            len(values) != 2
+            or not isinstance(values[0], (int, float))
+            or isinstance(values[0], bool)
+            or not isinstance(values[1], int)
+        ):
+            raise ValueError(f"Invalid cursor for a search: {after}")
+    else:
+        values = None
+    return Search(terms, limit, values)
+
+
+def parse_search_scope(args):
+    """
+    Builds the SQL condition of the `project_id` query parameter.
+
+    :param args: Query parameters of the request
+    :return: (conditions, params) to be used in a WHERE clause
+    :raises ValueError: If the project id is not an integer
+    """
+    project_id = args.get("project_id")
+    if not project_id:
+        return [], []
+    try:
+        return ["project_id = %s"], [int(project_id)]
+    except ValueError as e:
+        raise ValueError(f"Invalid project_id: {project_id}. Use an integer") from e
+
+
+def search_query(search, conditions, params, columns):
+    """
+    Builds the query returning one page of the issues matching a search.
+
+    The most recent SEARCH_MAX_MATCHES matches are ranked, then the best ones after the
+    cursor are kept. One more match than the page size is selected so that
+    `split_search_page` can tell whether there is a next page.
+
+    :param search: Search with the search arguments
+    :param conditions: List of SQL conditions (with %s placeholders) the issues must match
+    :param params: Parameters of the conditions
+    :param columns: Columns of the issues to select, must include the id
+    :return: (query, params)
+    """
+    # The matches are collected from the GIN index first: ordered by id, the planner could
+    # otherwise walk the primary key backwards and build the document of every row until
+    # it found enough matches, which is a scan of the whole table for rare terms
+    query = (
+        "WITH matches AS MATERIALIZED ("
+        f"SELECT id FROM issues, websearch_to_tsquery('{SEARCH_CONFIG}', %s) query "
+        f"WHERE {' AND '.join([f'{SEARCH_DOCUMENT} @@ query'] + list(conditions))}) "
+        # The rank is a double precision, so that it round trips exactly through the cursor
+        f"SELECT {', '.join(columns)}, rank FROM ("
+        f"SELECT {', '.join(columns)}, "
+        f"ts_rank({SEARCH_DOCUMENT}, query)::float8 AS rank "
+        f"FROM issues, websearch_to_tsquery('{SEARCH_CONFIG}', %s) query "
+    )
+    params = [search.terms] + list(params) + [search.terms]
+    if SEARCH_MAX_MATCHES:
+        # The same matches for every page, only these are ranked
+        query += "WHERE id IN (SELECT id FROM matches ORDER BY id DESC LIMIT %s)"
+        params.append(SEARCH_MAX_MATCHES)
+    else:
+        query += "WHERE id IN (SELECT id FROM matches)"
+    query += ") ranked"
+    if search.after is not None:
+        query += " WHERE (rank < %s OR rank = %s AND id > %s)"
+        params += [search.after[0], search.after[0], search.after[1]]
+    query += " ORDER BY rank DESC, id"
+    if search.limit is not None:
+        query += " LIMIT %s"
+        params.append(search.limit + 1)
+    return query, params
+
+
+def split_search_page(rows, search, description):
+    """
+    Separates the matches of a page from the extra match selected by `search_query`.
+
+    :param rows: Rows returned by the search query
+    :param search: Search with the search arguments
+    :param description: Description of the cursor the rows were fetched from
+    :return: (rows of the page, cursor of the next page or None on the last page)
+    """
+    if search.limit is None or len(rows) <= search.limit:
+        return rows, None
+    rows = rows[: search.limit]
+    columns = [column.name for column in description]
+    last = rows[-1]
+    return rows, encode_cursor([last[columns.index("rank")], last[columns.index("id")]])
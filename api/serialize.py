@@ -0,0 +1,114 @@
+"""
+serialize.py
+
+Contains the JSON serialization of the API responses.
+
+Rows are turned into JSON objects straight from the column names of the cursor
+description, and encoded with orjson when it is installed, which is several times faster
+than the json module on large lists. JSON_SERIALIZER selects the encoder:
+- auto (default): orjson if it is installed, else json
+- orjson: orjson, failing at startup if it is not installed
+- json: the json module, like flask does by default
+
+The encoder is plugged into flask as its JSON provider, so jsonify and the streamed
+responses use it too. Values orjson does not know (dates, decimals, ...) are converted like
+flask does.
+
+The time spent building the dicts and encoding the responses is added to the serialize
+timing of the request, see timing.py.
+"""
+
+import os
+import time
+from flask import Response
+from flask.json.provider import DefaultJSONProvider
+from timing import record_serialize
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+JSON_SERIALIZER = os.environ.get("JSON_SERIALIZER", "auto")
+
+
+def row_dicts(rows, description):
+    """
+    Returns the rows of a query as dicts keyed by column name.
+
+    :param rows: Rows fetched from a cursor
+    :param description: Description of the cursor the rows were fetched from
+    :return: List of dicts
+    """
+    start = time.perf_counter()
+    columns = [column.name for column in description]
+    dicts = [dict(zip(columns, row)) for row in rows]
+    record_serialize(time.perf_counter() - start)
+    return dicts
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider encoding with orjson when available, see the module docstring.
+    """
+
+    # Keep the keys in column order, sorting them only costs time
+    sort_keys = False
+
+    def __init__(self, app, serializer=None):
+        """
+        :param app: Flask application
+        :param serializer: "auto", "orjson" or "json", JSON_SERIALIZER by default
+        :raises ValueError: If the serializer is unknown or orjson is not installed
+        """
+        super().__init__(app)
+        serializer = serializer or JSON_SERIALIZER
+        if serializer not in ("auto", "orjson", "json"):
+            raise ValueError(
+                f"Invalid JSON_SERIALIZER: {serializer}. Use auto, orjson or json"
+            )
+        if serializer == "orjson" and orjson is None:
+            raise ValueError("JSON_SERIALIZER is orjson, but orjson is not installed")
+        self.use_orjson = orjson is not None and serializer != "json"
+
+    def dumps_bytes(self, obj, indent=False):
+        """
+        Encodes a value to JSON bytes.
+
+        :param obj: Value to encode
+        :param indent: Whether to indent the JSON for humans
+        :return: UTF-8 encoded JSON
+        """
+        # pylint: disable=no-member
+        if not self.use_orjson:
+            return self.dumps(obj).encode()
+        # Dates go through the default function, so that they look like flask's
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        """
+        Encodes a value to a JSON string, see `dumps_bytes`.
+        """
+        if not self.use_orjson or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode()
+
+    def response(self, *args, **kwargs):
+        """
+        Builds a JSON response like jsonify, without going through a string.
+        """
+        start = time.perf_counter()
+        if not self.use_orjson:
+            response = super().response(*args, **kwargs)
+        else:
+            obj = self._prepare_response_obj(args, kwargs)
+            # Indented in debug mode unless `compact` says otherwise, like flask
+            indent = not self.compact if self.compact is not None else self._app.debug
+            response = Response(self.dumps_bytes(obj, indent), mimetype=self.mimetype)
+        record_serialize(time.perf_counter() - start)
+        return response
@@ -0,0 +1,134 @@
+"""
+stats.py
+
+Contains the issue statistics of the projects, returned by the project endpoints with
+`stats=1`.
+
+The statistics of a project are:
+- issues: Number of issues
+- by_status, by_priority: Number of issues per status and per priority ("none" for issues
+  without a priority)
+- overdue: Number of issues that are not done or closed and whose due date has passed
+- last_activity: Latest date an issue of the project was created, started or closed
+
+They are computed for a whole page of projects with one grouped query. By default the
+counts come from the project_issue_stats summary table, which triggers keep up to date
+(see migration 0004), so the cost does not grow with the number of issues. Setting
+PROJECT_STATS_SOURCE=issues computes them from the issues table instead.
+"""
+
+import os
+
+PROJECT_STATS_SOURCE = os.environ.get("PROJECT_STATS_SOURCE", "summary")
+
+# Statuses of the issues that cannot be overdue
+CLOSED_STATUSES = ["Done", "Closed"]
+
+# One row per (project, status, priority):
+# project_id, status, priority, issues, overdue issues, last activity
+STATS_QUERIES = {
+    "summary": """
+        SELECT s.project_id, s.status, s.priority, s.issues,
+               CASE WHEN s.status = ANY(%(closed)s) THEN 0 ELSE (
+                 SELECT count(*) FROM issues i
+                 WHERE i.project_id = s.project_id AND i.status = s.status
+                   AND i.priority IS NOT DISTINCT FROM s.priority AND i.date_due < now()
+               ) END,
+               s.last_activity
+        FROM project_issue_stats s
+        WHERE s.project_id = ANY(%(projects)s)
+        """,
+    "issues": """
+        SELECT project_id, status, priority, count(*),
+               count(*) FILTER (WHERE date_due < now() AND status <> ALL(%(closed)s)),
+               max(greatest(date_created, date_started, date_closed))
+        FROM issues
+        WHERE project_id = ANY(%(projects)s)
+        GROUP BY project_id, status, priority
+        """,
+}
+
+
+def empty_stats():
+    """
+    Returns the statistics of a project without issues.
+    """
+    return {
+        "issues": 0,
+        "by_status": {},
+        "by_priority": {},
+        "overdue": 0,
+        "last_activity": None,
+    }
+
+
+def stats_query(project_ids, source=None):
+    """
+    Returns the query of the statistics rows of the given projects.
+
+    :param project_ids: IDs of the projects
+    :param source: "summary" or "issues", PROJECT_STATS_SOURCE by default
+    :return: (query, params)
+    :raises ValueError: If the source is unknown
+    """
+    source = source or PROJECT_STATS_SOURCE
+    if source not in STATS_QUERIES:
+        raise ValueError(
+            f"Invalid PROJECT_STATS_SOURCE: {source}. Use {' or '.join(STATS_QUERIES)}"
+        )
+    return STATS_QUERIES[source], {
+        "projects": list(project_ids),
+        "closed": CLOSED_STATUSES,
+    }
+
+
+def collect_stats(project_ids, rows):
+    """
+    Adds up the statistics rows of the given projects.
+
+    :param project_ids: IDs of the projects
+    :param rows: Rows returned by the query of `stats_query`
+    :return: dict of project id -> statistics
+    """
+    stats = {project_id: empty_stats() for project_id in project_ids}
+    for project_id, status, priority, issues, overdue, last_activity in rows:
+        project = stats[project_id]
+        project["issues"] += issues
+        project["by_status"][status] = project["by_status"].get(status, 0) + issues
+        priority = priority or "none"
+        project["by_priority"][priority] = (
+            project["by_priority"].get(priority, 0) + issues
+        )
+        project["overdue"] += overdue
+        # Dates are "YYYY-MM-DD HH:MM:SS[.ffffff]" strings, which sort like the dates
+        if last_activity and (
+            project["last_activity"] is None or last_activity > project["last_activity"]
+        ):
+            project["last_activity"] = last_activity
+    return stats
+
+
+async def fetch_project_stats(db, project_ids, source=None):
+    """
+    Returns the issue statistics of the given projects.
+
+    :param db: Database access of the read endpoints, see aiodb.py
+    :param project_ids: IDs of the projects
+    :param source: "summary" or "issues", PROJECT_STATS_SOURCE by default
+    :return: dict of project id -> statistics
+    :raises ValueError: If the source is unknown
+    """
+    query, params = stats_query(project_ids, source)
+    if not project_ids:
+        return collect_stats(project_ids, [])
+    rows, _ = await db.fetch(query, params)
+    return collect_stats(project_ids, rows)
+
+
+def wants_stats(args):
+    """
+    Returns whether a request asked for the statistics of the projects.
+
+    :param args: Query parameters of the request
+    """
+    return args.get("stats", "").lower() in ("1", "true", "yes")
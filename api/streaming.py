@@ -0,0 +1,110 @@
+"""
+streaming.py
+
+Contains the streaming response mode of the list endpoints of the API.
+
+Instead of building every row in memory before serializing it, the rows are read from a
+server-side (named) cursor in batches of STREAM_BATCH_SIZE and each batch is encoded and
+sent as soon as it was read, so the memory used by the API does not grow with the table.
+
+A list endpoint streams its rows when:
+- the request has an `Accept: application/x-ndjson` header, the response then has one
+  JSON object per line (NDJSON)
+- the request has a `stream=1` query parameter, the response then has the same
+  {"message": [...], "next_cursor": null} body as a single page listing every row
+"""
+
+import os
+import uuid
+import psycopg2
+from flask import Response, current_app, request
+
+STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", "2000"))
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+def get_stream_format():
+    """
+    Returns the streaming format asked for by the current request.
+
+    :return: "ndjson", "json", or None if the request did not ask for a stream
+    """
+    best = request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE])
+    if best == NDJSON_MIMETYPE:
+        return "ndjson"
+    if request.args.get("stream", "").lower() in ("1", "true", "yes"):
+        return "json"
+    return None
+
+
+def stream_response(pool, query, params, stream_format):
+    """
+    Runs a query on a server-side cursor and streams its rows as the response.
+
+    The query is declared before the response is returned, so that database errors
+    still result in an error status code. The connection is given back to the pool
+    once the stream is consumed or the response is closed, which also covers the
+    responses whose body is never read (HEAD requests, clients gone before the first
+    chunk).
+
+    :param pool: Connection pool to borrow the connection from
+    :param query: Query returning the rows, column names are used as keys
+    :param params: Parameters of the query
+    :param stream_format: "ndjson" or "json", see get_stream_format
+    :return: Streaming flask response
+    :raises psycopg2.Error: If the query could not be started
+    """
+    conn = pool.getconn()
+    try:
+        cur = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+        cur.itersize = STREAM_BATCH_SIZE
+        cur.execute(query, params)
+    except psycopg2.Error:
+        pool.putconn(conn)
+        raise
+
+    # The generator runs outside of the request and app context, which async views
+    # cannot hand over with stream_with_context, so take what it needs now
+    dumps = current_app.json.dumps
+    released = []
+
+    def release():
+        # Called by both the end of the stream and the closing of the response
+        if not released:
+            released.append(True)
+            pool.putconn(conn)
+
+    def generate():
+        try:
+            if stream_format == "json":
+                yield '{"message": ['
+            separator = ""
+            columns = None
+            while True:
+                rows = cur.fetchmany(STREAM_BATCH_SIZE)
+                if not rows:
+                    break
+                if columns is None:
+                    columns = [column.name for column in cur.description]
+                if stream_format == "ndjson":
+                    yield "".join(dumps(dict(zip(columns, row))) + "\n" for row in rows)
+                else:
+                    yield separator + ", ".join(
+                        dumps(dict(zip(columns, row))) for row in rows
+                    )
+                    separator = ", "
+            if stream_format == "json":
+                yield '], "next_cursor": null}'
+            cur.close()
+        finally:
+            release()
+
+    mimetype = NDJSON_MIMETYPE if stream_format == "ndjson" else "application/json"
+    # Ask nginx to pass the chunks on instead of buffering the whole response
+    response = Response(
+        generate(),
+        mimetype=mimetype,
+        headers={"X-Accel-Buffering": "no"},
+    )
+    response.call_on_close(release)
+    return response
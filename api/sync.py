@@ -0,0 +1,217 @@
+"""
+sync.py
+
+Contains the delta sync of the API, which lets clients keep a copy of the projects and
+issues up to date by downloading only what changed since their last sync.
+
+Every write gives the row the revision of its transaction, and every delete leaves a
+tombstone with one, see migrations/0007_change_events.sql and
+migrations/0008_row_revisions.py. Changes are only returned once every transaction with a
+smaller revision is over, so a client that has every change up to a revision only needs
+the changes after it. A transaction left open holds them back until it ends, see
+trackify_db_revision_horizon_lag in metrics.py.
+
+Query parameters of /sync:
+since - `revision` returned by the last complete sync, absent to get everything
+limit - Number of changes per page, see pagination.py
+after - Cursor returned as `next_cursor` by the previous page of the same sync
+
+The response holds a page of changes in revision order, the deletes of a revision before
+its upserts. Each change is:
+- {"table", "operation": "upsert", "revision", "row"}: the current row, as returned by the
+  other endpoints
+- {"table", "operation": "delete", "revision", "id"}: the row was deleted
+- {"table", "operation": "truncate", "revision"}: every row of the table before this
+  change was deleted
+Clients apply the changes in order and follow `next_cursor` until it is null, then keep
+`revision` for the next sync. With `reset` true, the tombstones the client needed were
+pruned (see SYNC_RETENTION_DAYS): it must drop its copy first. Syncs of everything skip
+the tombstones of the changes over before their first page, whose rows are already gone,
+but not the ones of the rows deleted while the client follows the pages.
+"""
+
+import os
+from pagination import decode_cursor, encode_cursor, parse_limit
+
+# Days the tombstones are kept, see row_revisions_prune in the migration
+SYNC_RETENTION_DAYS = float(os.environ.get("SYNC_RETENTION_DAYS", "30"))
+
+# Kinds of changes, in the order of the changes sharing a revision: the changes of a
+# transaction share its revision, and the rows upserted are the current ones, so they come
+# after its tombstones
+TOMBSTONE, PROJECT, ISSUE = 0, 1, 2
+# Revision before every row, the rows written before the migration have revision 0
+EVERYTHING = -1
+
+
+def parse_sync_args(args):
+    """
+    Reads the sync query parameters of a request.
+
+    :param args: Query parameters of the request
+    :return: (since, limit, after), after is the (revision, kind, id, revision from which
+             tombstones are returned) of the last change of the previous page or None
+    :raises ValueError: If a parameter is invalid
+    """
+    since = args.get("since")
+    if since is None or since == "":
+        since = EVERYTHING
+    else:
+        try:
+            since = int(since)
+        except ValueError as e:
+            raise ValueError(f"Invalid since: {since}. Use a revision") from e
+    limit = parse_limit(args)
+
+    after = args.get("after")
+    if after:
+        values = decode_cursor(after)
+        if len(values) != 4 or not all(isinstance(value, int) for value in values):
+            raise ValueError(f"Invalid cursor for a sync: {after}")
+    else:
+        values = None
+    return since, limit, values
+
+
+def after_condition(kind, after, id_column="id"):
+    """
+    Builds the condition selecting the changes of a kind after a change.
+
+    Changes are ordered by (revision, kind, id), every change of a kind has the same kind.
+
+    :param kind: Kind of the changes of the query
+    :param after: (revision, kind, id) of the last change sent
+    :param id_column: Column or expression of the id
+    :return: (condition, params)
+    """
+    revision, after_kind, after_id = after[:3]
+    if kind > after_kind:
+        return "revision >= %s", [revision]
+    if kind == after_kind:
+        return f"(revision, {id_column}) > (%s, %s)", [revision, after_id]
+    return "revision > %s", [revision]
+
+
+def changes_query(after, limit):
+    """
+    Builds the query returning the (revision, kind, id, table) of a page of changes.
+
+    The changes of every table are read in a single statement, so that they come from the
+    same snapshot of the database, and only below its horizon, see the module docstring.
+
+    :param after: (revision, kind, id, revision from which tombstones are returned) of the
+                  last change sent
+    :param limit: Number of changes, or None for every change
+    :return: (query, params)
+    """
+    sources = [
+        (PROJECT, "projects", "id", "NULL", "TRUE", []),
+        (ISSUE, "issues", "id", "NULL", "TRUE", []),
+        (
+            TOMBSTONE,
+            "tombstones",
+            "coalesce(row_id, 0)",
+            "table_name",
+            "operation <> 'prune' AND revision >= %s",
+            [after[3]],
+        ),
+    ]
+    selects = []
+    params = []
+    for kind, table, id_column, table_name, condition, condition_params in sources:
+        after_sql, after_params = after_condition(kind, after, id_column)
+        select = (
+            f"(SELECT revision, {kind} AS kind, {id_column} AS id, "
+            f"{table_name}::varchar AS table_name FROM {table} "
+            f"WHERE {condition} AND {after_sql} AND revision < row_revisions_horizon() "
+            f"ORDER BY revision, {id_column}"
+        )
+        params += condition_params + after_params
+        if limit is not None:
+            select += " LIMIT %s"
+            params.append(limit + 1)
+        selects.append(select + ")")
+    query = f"{' UNION ALL '.join(selects)} ORDER BY revision, kind, id"
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit + 1)
+    return query, params
+
+
+def format_changes(keys, rows, repositories):
+    """
+    Builds the changes of a page, see the module docstring.
+
+    :param keys: (revision, kind, id, table) of the changes, from `changes_query`
+    :param rows: dict of kind -> dict of id -> row, of the rows still present
+    :param repositories: dict of kind -> repository of the table, see repositories.py
+    :return: List of changes
+    """
+    changes = []
+    for revision, kind, row_id, table_name in keys:
+        if kind == TOMBSTONE:
+            change = {
+                "table": table_name,
+                "operation": "delete" if row_id else "truncate",
+                "revision": revision,
+            }
+            if row_id:
+                change["id"] = row_id
+            changes.append(change)
+        elif row_id in rows[kind]:
+            changes.append(
+                {
+                    "table": repositories[kind].table,
+                    "operation": "upsert",
+                    "revision": revision,
+                    "row": rows[kind][row_id],
+                }
+            )
+    return changes
+
+
+async def fetch_changes(db, repositories, since, limit, after):
+    """
+    Returns a page of the changes of a sync, see the module docstring.
+
+    :param db: Database access of the read endpoints, see aiodb.py
+    :param repositories: dict of kind -> repository of the table, see repositories.py
+    :param since: Revision of the last complete sync of the client, or EVERYTHING
+    :param limit: Number of changes, or None for every change
+    :param after: Cursor values of the last change of the previous page, or None
+    :return: (list of changes, revision to sync from next, cursor of the next page or None,
+              whether the client must drop its copy)
+    :raises psycopg2.Error: If a query fails
+    """
+    reset = False
+    if after is None:
+        rows, _ = await db.fetch(
+            "SELECT coalesce(max(revision), %s), row_revisions_horizon() FROM tombstones "
+            "WHERE operation = 'prune'",
+            (EVERYTHING,),
+        )
+        horizon = rows[0][1]
+        if since < rows[0][0]:
+            since = EVERYTHING
+            reset = True
+        # The first page starts after every change of revision `since`. A sync of
+        # everything skips the tombstones below the horizon, which is at or below the one
+        # of the first page: their transactions were over, so their rows are not sent.
+        # The rows deleted from the horizon on may have been sent, their tombstones are
+        # returned by the following pages.
+        after = [since, ISSUE + 1, 0, horizon if since == EVERYTHING else EVERYTHING]
+    keys, _ = await db.fetch(*changes_query(after, limit))
+    next_cursor = None
+    if limit is not None and len(keys) > limit:
+        keys = keys[:limit]
+        next_cursor = encode_cursor(list(keys[-1][:3]) + [after[3]])
+
+    # Rows deleted since the first query are left out, their tombstones come later
+    rows = {}
+    for kind, repository in repositories.items():
+        ids = [key[2] for key in keys if key[1] == kind]
+        if ids:
+            rows[kind] = {row["id"]: row for row in await repository.get_many(db, ids)}
+    changes = format_changes(keys, rows, repositories)
+    revision = keys[-1][0] if keys else max(since, 0)
+    return changes, revision, next_cursor, reset
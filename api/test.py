@@ -5,6 +5,7 @@ This test suite covers the following endpoints:
     Root endpoint (/)
     Reset endpoint (/reset)
     Get all projects (/projects)
+    Issue statistics of the projects (/projects?stats=1, stats.py)
     Create project (/projects)
     Get project by ID (/projects/{id})
     Update project (/projects/{id})
@@ -12,17 +13,57 @@ This test suite covers the following endpoints:
     Get issues by project (/projects/{id}/issues)
     Get all issues (/issues)
     Create issue (/issues)
+    Create issues in bulk (/projects/{id}/issues/bulk)
     Get issue by ID (/issues/{id})
     Update issue (/issues/{id})
+    Update issues in bulk (/issues)
     Delete issue (/issues/{id})
+    Connection pool statistics (/pool)
+    Prometheus metrics (/metrics, metrics.py)
+    Server-Timing header and slow statement log (timing.py)
+    Profiling of single requests (X-Profile, profiling.py)
+    Conditional GETs of the read endpoints (ETag, If-None-Match)
+    Read cache (/cache, cache.py)
+    JSON encoders of the responses (serialize.py)
+    Queries and prepared statements of the tables (repositories.py)
+    Sparse fieldsets of the read endpoints (fields=, repositories.py)
+    Full-text search of the issues (/search, search.py)
+    Change feed (/events, events.py)
+    Delta sync (/sync, sync.py)
+    Pagination of the list endpoints (/projects, /issues, /projects/{id}/issues)
+    Streaming of the issue list endpoints (/issues, /projects/{id}/issues)
+    Export of the projects and their issues (/projects/{id}/export, export.py)
+    Filtering and sorting of the issue list endpoints (/issues, /projects/{id}/issues)
+    Date and label columns (/issues/{id})
+    Schema migrations (migrations.py)
 """
 
-# import os
+import os
+import io
 import sys
+import csv
+import select
+import time
+import threading
+import gzip
+import tempfile
 import unittest
 import json
 import psycopg2
-from api import app, POSTGRES_URL
+import api
+from db import ConnectionPool
+from api import app, pool, POSTGRES_URL
+from cache import ReadCache, LocalInvalidation, PostgresInvalidation
+from serialize import FastJSONProvider
+from repositories import IssueRepository
+import timing
+import profiling
+import search
+from stats import collect_stats, stats_query
+from pagination import encode_cursor
+from events import ChangeFeed
+from prometheus_client.parser import text_string_to_metric_families
+from migrations import check_migrations, run_sql_migration, MigrationError
 from datetime import datetime as dt
 
 # POSTGRES_URL = os.environ["POSTGRES_URL"]
@@ -80,6 +121,9 @@ class TestAPI(unittest.TestCase):
         create_test_data()
         self.test_project_ids = get_test_project_ids()
         self.test_issue_ids = get_test_issue_ids()
+        # Ids start over after a reset
+        self.assertEqual(min(self.test_project_ids), 1)
+        self.assertEqual(min(self.test_issue_ids), 1)
 
     def test_root_endpoint(self):
         """
@@ -124,6 +168,58 @@ class TestAPI(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIsInstance(response.json["message"], list)
 
+    def test_get_projects_stats(self):
+        """
+        Test that the get projects endpoint adds the issue statistics of every project,
+        and that the summary table kept by the triggers matches the issues table after
+        issues are added, updated and deleted.
+        """
+        project_id = self.test_project_ids[0]
+        issues = [
+            {"title": "Stats Issue 1", "type": "Bug", "status": "New", "priority": "High"},
+            {"title": "Stats Issue 2", "type": "Bug", "status": "New"},
+            {"title": "Stats Issue 3", "type": "Bug", "status": "Done"},
+        ]
+        issues[1]["date_due"] = issues[2]["date_due"] = "2000-01-01"
+        ids = self.app.post(
+            f"/projects/{project_id}/issues/bulk",
+            data=json.dumps(issues),
+            content_type="application/json",
+        ).json["ids"]
+        # Call
+        response = self.app.get("/projects?stats=1")
+        response_project = self.app.get(f"/projects/{project_id}?stats=1")
+        stats = {
+            project["id"]: project["stats"] for project in response.json["message"]
+        }
+        # Test
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(stats[project_id], response_project.json["message"]["stats"])
+        self.assertEqual(stats[project_id]["issues"], 4)
+        self.assertEqual(stats[project_id]["by_status"], {"New": 3, "Done": 1})
+        self.assertEqual(stats[project_id]["by_priority"], {"High": 1, "none": 3})
+        self.assertEqual(stats[project_id]["overdue"], 1)
+        self.assertIsNotNone(stats[project_id]["last_activity"])
+        self.assertNotIn("stats", self.app.get("/projects").json["message"][0])
+
+        # Change the issues and compare the summary table with the issues table
+        self.app.patch(
+            "/issues",
+            data=json.dumps({"ids": ids[:2], "patch": {"status": "Closed"}}),
+            content_type="application/json",
+        )
+        self.app.delete(f"/issues/{ids[2]}")
+        computed = {}
+        with pool.connection() as conn:
+            cur = conn.cursor()
+            for source in ("summary", "issues"):
+                cur.execute(*stats_query(self.test_project_ids, source))
+                computed[source] = collect_stats(self.test_project_ids, cur.fetchall())
+        summary = computed["summary"]
+        self.assertEqual(summary, computed["issues"])
+        self.assertEqual(summary[project_id]["by_status"], {"New": 1, "Closed": 2})
+        self.assertEqual(summary[project_id]["overdue"], 0)
+
     def test_get_project_by_id(self):
         """
         Test that the get project by ID endpoint returns a 200 status code and a JSON response
@@ -198,6 +294,71 @@ class TestAPI(unittest.TestCase):
         self.assertEqual(response.status_code, 201)
         self.assertEqual(response.json["message"], "Data added successfully")
 
+    def test_create_issues_bulk(self):
+        """
+        Test that the bulk create endpoint adds every issue of a JSON array or an NDJSON
+        body and returns their ids in order.
+        """
+        # Call
+        issues = [
+            {"title": f"Bulk Test Issue {i}", "type": "Task", "status": "New"}
+            for i in range(3)
+        ]
+        response = self.app.post(
+            f"/projects/{self.test_project_ids[0]}/issues/bulk",
+            data=json.dumps(issues),
+            content_type="application/json",
+        )
+        response_ndjson = self.app.post(
+            f"/projects/{self.test_project_ids[0]}/issues/bulk",
+            data="\n".join(json.dumps(issue) for issue in issues),
+            content_type="application/x-ndjson",
+        )
+        # Test
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response_ndjson.status_code, 201)
+        self.assertEqual(len(response.json["ids"]), 3)
+        self.assertEqual(response.json["ids"], sorted(response.json["ids"]))
+        issue = self.app.get(f"/issues/{response.json['ids'][2]}").json["message"]
+        self.assertEqual(issue["title"], "Bulk Test Issue 2")
+        self.assertEqual(issue["project_id"], self.test_project_ids[0])
+
+    def test_create_issues_bulk_invalid(self):
+        """
+        Test that the bulk create endpoint reports every invalid issue and adds none of
+        the issues, and returns a 404 status code for an unknown project.
+        """
+        # Call
+        issues = [
+            {"title": "Valid Bulk Issue", "type": "Task", "status": "New"},
+            {"title": "Missing Status Bulk Issue", "type": "Task"},
+            {
+                "title": "Bad Date Bulk Issue",
+                "type": "Task",
+                "status": "New",
+                "date_due": "soon",
+            },
+        ]
+        response = self.app.post(
+            f"/projects/{self.test_project_ids[0]}/issues/bulk",
+            data=json.dumps(issues),
+            content_type="application/json",
+        )
+        response_not_found = self.app.post(
+            "/projects/10000/issues/bulk",
+            data=json.dumps(issues[:1]),
+            content_type="application/json",
+        )
+        titles = [
+            issue["title"]
+            for issue in self.app.get("/issues?limit=all").json["message"]
+        ]
+        # Test
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error["index"] for error in response.json["errors"]], [1, 2])
+        self.assertNotIn("Valid Bulk Issue", titles)
+        self.assertEqual(response_not_found.status_code, 404)
+
     def test_get_issues_by_project(self):
         """
         Test that the get issues by project endpoint returns a 200 status code and a JSON response
@@ -260,6 +421,76 @@ class TestAPI(unittest.TestCase):
             "Updated Test Issue 1 for Project 1",
         )
 
+    def test_update_issues_bulk(self):
+        """
+        Test that the bulk update endpoint applies the patch to the issues selected by
+        ids or by a filter, and returns the number of updated issues.
+        """
+        # Call
+        response_ids = self.app.patch(
+            "/issues",
+            data=json.dumps(
+                {
+                    "ids": self.test_issue_ids[:2],
+                    "patch": {"status": "Closed", "date_closed": "2024-02-01"},
+                }
+            ),
+            content_type="application/json",
+        )
+        response_filter = self.app.patch(
+            "/issues",
+            data=json.dumps(
+                {
+                    "filter": {
+                        "project_id": self.test_project_ids[0],
+                        "status": "Closed",
+                    },
+                    "patch": {"priority": "High"},
+                }
+            ),
+            content_type="application/json",
+        )
+        issue = self.app.get(f"/issues/{self.test_issue_ids[0]}").json["message"]
+        # Test
+        self.assertEqual(response_ids.status_code, 200)
+        self.assertEqual(response_ids.json["count"], 2)
+        self.assertEqual(response_filter.status_code, 200)
+        self.assertEqual(response_filter.json["count"], 1)
+        self.assertEqual(issue["status"], "Closed")
+        self.assertEqual(issue["priority"], "High")
+        self.assertEqual(issue["date_closed"], "2024-02-01 00:00:00")
+
+    def test_update_issues_bulk_invalid(self):
+        """
+        Test that the bulk update endpoint returns a 400 status code when the issues are
+        not selected, or the patch is empty or changes an unknown field, and a 404 status
+        code when the issues are moved to a project that does not exist.
+        """
+        for body in (
+            {"patch": {"status": "Closed"}},
+            {"filter": {}, "patch": {"status": "Closed"}},
+            {"ids": [self.test_issue_ids[0]], "patch": {}},
+            {"ids": [self.test_issue_ids[0]], "patch": {"id": 1}},
+            {"ids": [self.test_issue_ids[0]], "patch": {"title": ""}},
+            {"filter": {"colour": "red"}, "patch": {"status": "Closed"}},
+            {"ids": [True], "patch": {"status": "Closed"}},
+            {"filter": {"project_id": True}, "patch": {"status": "Closed"}},
+            {"ids": [self.test_issue_ids[0]], "patch": {"project_id": True}},
+        ):
+            response = self.app.patch(
+                "/issues", data=json.dumps(body), content_type="application/json"
+            )
+            self.assertEqual(response.status_code, 400, body)
+        response = self.app.patch(
+            "/issues",
+            data=json.dumps(
+                {"ids": [self.test_issue_ids[0]], "patch": {"project_id": 2147483647}}
+            ),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json["message"], "Project not found")
+
     def test_delete_issue(self):
         """
         Test that the delete issue endpoint returns a 204 status code and deletes the
@@ -273,7 +504,1072 @@ class TestAPI(unittest.TestCase):
         self.assertEqual(response.status_code, 204)
         self.assertEqual(response_issue_del.status_code, 404)
 
+    def test_get_issues_paginated(self):
+        """
+        Test that the get issues endpoint returns pages of the requested size ordered by id,
+        and that following the next cursor until it is null returns every issue once.
+        """
+        # Call
+        response = self.app.get("/issues?limit=1")
+        ids = [issue["id"] for issue in response.json["message"]]
+        next_cursor = response.json["next_cursor"]
+        while next_cursor is not None:
+            next_response = self.app.get(f"/issues?limit=1&after={next_cursor}")
+            self.assertEqual(next_response.status_code, 200)
+            self.assertLessEqual(len(next_response.json["message"]), 1)
+            ids += [issue["id"] for issue in next_response.json["message"]]
+            next_cursor = next_response.json["next_cursor"]
+        response_all = self.app.get("/issues?limit=all")
+        # Test
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json["message"]), 1)
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(ids, [issue["id"] for issue in response_all.json["message"]])
+        self.assertIsNone(response_all.json["next_cursor"])
+
+    def test_get_issues_by_project_paginated(self):
+        """
+        Test that the get issues by project endpoint only pages through the issues of the project.
+        """
+        # Call
+        response = self.app.get(f"/projects/{self.test_project_ids[0]}/issues?limit=1")
+        # Test
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json["message"]), 1)
+        self.assertIsNone(response.json["next_cursor"])
+
+    def test_get_issues_streamed(self):
+        """
+        Test that the get issues endpoint streams every issue as a single JSON document
+        when given stream=1, and as one JSON object per line when asked for NDJSON.
+        """
+        # Call
+        response_all = self.app.get("/issues?limit=all")
+        response_json = self.app.get("/issues?stream=1")
+        response_ndjson = self.app.get(
+            "/issues", headers={"Accept": "application/x-ndjson"}
+        )
+        # Test
+        self.assertEqual(response_json.status_code, 200)
+        self.assertEqual(response_json.json, response_all.json)
+        self.assertEqual(response_ndjson.status_code, 200)
+        self.assertEqual(response_ndjson.mimetype, "application/x-ndjson")
+        self.assertEqual(
+            [json.loads(line) for line in response_ndjson.text.splitlines()],
+            response_all.json["message"],
+        )
+
+    def test_get_issues_streamed_unread(self):
+        """
+        Test that streamed responses give their connection back to the pool when their
+        body is never read, for HEAD requests and clients gone before the first chunk.
+        """
+        # Call
+        for _ in range(3):
+            self.app.head("/issues?stream=1").close()
+        self.app.get("/issues?stream=1", buffered=False).close()
+        response = self.app.get("/pool")
+        # Test
+        self.assertEqual(response.json["message"]["in_use"], 0)
+
+    def test_get_issues_by_project_streamed(self):
+        """
+        Test that the get issues by project endpoint only streams the issues of the project.
+        """
+        # Call
+        response = self.app.get(
+            f"/projects/{self.test_project_ids[0]}/issues",
+            headers={"Accept": "application/x-ndjson"},
+        )
+        issues = [json.loads(line) for line in response.text.splitlines()]
+        # Test
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(issues), 1)
+        self.assertEqual(issues[0]["project_id"], self.test_project_ids[0])
+
+    def test_export(self):
+        """
+        Test that the export endpoints return a project and its issues as CSV or gzipped
+        NDJSON files, with the values of the other endpoints, and every project without
+        a project ID.
+        """
+        self.app.put(
+            f"/issues/{self.test_issue_ids[0]}",
+            data=json.dumps(
+                {
+                    "description": 'A "quoted", multi-line\ndescription with a \\',
+                    "labels": ["backend", "api"],
+                }
+            ),
+            content_type="application/json",
+        )
+        issue = self.app.get(f"/issues/{self.test_issue_ids[0]}").json["message"]
+        # Call
+        response_csv = self.app.get(f"/projects/{self.test_project_ids[0]}/export")
+        response_ndjson = self.app.get(
+            f"/projects/{self.test_project_ids[0]}/export?format=ndjson&gzip=1"
+        )
+        response_all = self.app.get("/projects/export?format=ndjson")
+        response_missing = self.app.get("/projects/10000/export")
+        response_invalid = self.app.get("/projects/export?format=xml")
+        # Test
+        self.assertEqual(response_csv.status_code, 200)
+        self.assertEqual(response_csv.mimetype, "text/csv")
+        rows = list(csv.DictReader(io.StringIO(response_csv.text)))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["project_id"], str(self.test_project_ids[0]))
+        self.assertEqual(rows[0]["issue_id"], str(issue["id"]))
+        self.assertEqual(rows[0]["issue_description"], issue["description"])
+        self.assertEqual(rows[0]["issue_date_created"], issue["date_created"])
+        self.assertEqual(rows[0]["issue_labels"], "backend,api")
+        self.assertEqual(response_ndjson.status_code, 200)
+        self.assertEqual(response_ndjson.mimetype, "application/gzip")
+        lines = gzip.decompress(response_ndjson.data).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        line = json.loads(lines[0])
+        self.assertEqual(
+            {key: line[f"issue_{key}"] for key in issue if key != "project_id"},
+            {key: value for key, value in issue.items() if key != "project_id"},
+        )
+        exported = {
+            json.loads(line)["project_id"] for line in response_all.text.splitlines()
+        }
+        self.assertTrue(set(self.test_project_ids) <= exported)
+        self.assertEqual(response_missing.status_code, 404)
+        self.assertEqual(response_invalid.status_code, 400)
+
+    def test_get_issues_filtered(self):
+        """
+        Test that the issue list endpoints only return the issues matching the
+        status, type and label filters.
+        """
+        # Create an issue that matches the filters
+        issue_data = {
+            "title": "Filtered Test Issue",
+            "type": "Feature",
+            "status": "Done",
+            "labels": ["frontend", "ui"],
+        }
+        self.app.post(
+            f"/projects/{self.test_project_ids[0]}/issues",
+            data=json.dumps(issue_data),
+            content_type="application/json",
+        )
+        # Call
+        response_status = self.app.get("/issues?status=Done,Closed")
+        response_type = self.app.get(
+            f"/projects/{self.test_project_ids[0]}/issues?type=Feature&status=Done"
+        )
+        response_label = self.app.get("/issues?label=frontend")
+        response_none = self.app.get(
+            f"/projects/{self.test_project_ids[1]}/issues?status=Done"
+        )
+        # Test
+        for response in (response_status, response_type, response_label):
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                [issue["title"] for issue in response.json["message"]],
+                ["Filtered Test Issue"],
+            )
+        self.assertEqual(response_none.json["message"], [])
+
+    def test_get_issues_sorted(self):
+        """
+        Test that the get issues endpoint sorts by the given column and order,
+        including across pages.
+        """
+        # Call
+        response = self.app.get("/issues?sort=title&order=desc&limit=2")
+        response_next = self.app.get(
+            f"/issues?sort=title&order=desc&limit=2&after={response.json['next_cursor']}"
+        )
+        titles = [issue["title"] for issue in response.json["message"]]
+        titles += [issue["title"] for issue in response_next.json["message"]]
+        # Test
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response_next.status_code, 200)
+        self.assertEqual(titles, sorted(titles, reverse=True))
+        self.assertEqual(len(titles), 3)
+
+        # Cursors of dates, including empty ones
+        ids = []
+        url = "/issues?sort=date_due&limit=1"
+        while url:
+            response = self.app.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [issue["id"] for issue in response.json["message"]]
+            cursor = response.json["next_cursor"]
+            url = cursor and f"/issues?sort=date_due&limit=1&after={cursor}"
+        self.assertEqual(sorted(ids), sorted(self.test_issue_ids))
+
+    def test_invalid_issue_filters(self):
+        """
+        Test that the get issues endpoint returns a 400 status code and an error
+        message when given an unknown sort column, an invalid order, an invalid date or
+        a cursor whose values do not match the sort column.
+        """
+        self.assertEqual(self.app.get("/issues?sort=description").status_code, 400)
+        for sort, values in (
+            ("id", [True]),
+            ("id", ["1"]),
+            ("title", [1, 1]),
+            ("title", [None, 1]),
+            ("date_created", [1, 1]),
+            ("date_due", ["yesterday", 1]),
+            ("date_due", ["2024-01-31", "1"]),
+        ):
+            response = self.app.get(
+                f"/issues?sort={sort}&after={encode_cursor(values)}"
+            )
+            self.assertEqual(response.status_code, 400, (sort, values))
+        self.assertEqual(self.app.get("/issues?order=sideways").status_code, 400)
+        self.assertEqual(
+            self.app.get("/issues?date_due_from=yesterday").status_code, 400
+        )
+
+    def test_issue_dates_and_labels(self):
+        """
+        Test that dates are returned in UTC in the API date format, labels are returned
+        as a list, and invalid dates or labels are rejected with a 400 status code.
+        """
+        # Call
+        response_update = self.app.put(
+            f"/issues/{self.test_issue_ids[0]}",
+            data=json.dumps(
+                {"date_due": "2024-01-31T12:30:00+01:00", "labels": "backend, api"}
+            ),
+            content_type="application/json",
+        )
+        response = self.app.get(f"/issues/{self.test_issue_ids[0]}")
+        response_date = self.app.put(
+            f"/issues/{self.test_issue_ids[0]}",
+            data=json.dumps({"date_due": "next week"}),
+            content_type="application/json",
+        )
+        response_labels = self.app.put(
+            f"/issues/{self.test_issue_ids[0]}",
+            data=json.dumps({"labels": [1, 2]}),
+            content_type="application/json",
+        )
+        # Test
+        self.assertEqual(response_update.status_code, 200)
+        self.assertEqual(response.json["message"]["date_due"], "2024-01-31 11:30:00")
+        self.assertEqual(response.json["message"]["labels"], ["backend", "api"])
+        dt.fromisoformat(response.json["message"]["date_created"])
+        self.assertEqual(response_date.status_code, 400)
+        self.assertEqual(response_labels.status_code, 400)
+
+    def test_conditional_get(self):
+        """
+        Test that the read endpoints return an ETag and a 304 status code for a matching
+        If-None-Match header, until the data they depend on changes.
+        """
+        project_id = self.test_project_ids[0]
+        urls = [
+            "/projects",
+            f"/projects/{project_id}",
+            f"/projects/{project_id}/issues",
+            "/issues",
+            f"/issues/{self.test_issue_ids[0]}",
+        ]
+        etags = {url: self.app.get(url).headers["ETag"] for url in urls}
+        # Call
+        unchanged = {
+            url: self.app.get(url, headers={"If-None-Match": etags[url]})
+            for url in urls
+        }
+        weak = self.app.get(
+            "/issues", headers={"If-None-Match": f"W/{etags['/issues']}"}
+        )
+        other_project = self.app.get(
+            f"/projects/{self.test_project_ids[1]}/issues",
+            headers={"If-None-Match": etags[f"/projects/{project_id}/issues"]},
+        )
+        self.app.put(
+            f"/issues/{self.test_issue_ids[0]}",
+            data=json.dumps({"priority": "Critical"}),
+            content_type="application/json",
+        )
+        changed = {
+            url: self.app.get(url, headers={"If-None-Match": etags[url]})
+            for url in urls
+        }
+        # Test
+        for url in urls:
+            self.assertEqual(unchanged[url].status_code, 304, url)
+            self.assertEqual(unchanged[url].data, b"")
+        self.assertEqual(weak.status_code, 304)
+        self.assertEqual(other_project.status_code, 200)
+        self.assertEqual(changed["/projects"].status_code, 304)
+        for url in urls[2:]:
+            self.assertEqual(changed[url].status_code, 200, url)
+            self.assertNotEqual(changed[url].headers["ETag"], etags[url])
+
+    def test_conditional_get_concurrent_writes(self):
+        """
+        Test that writers of the same table do not wait for each other to bump its
+        version, and that the ETag changes with every commit.
+        """
+        writer = psycopg2.connect(POSTGRES_URL)
+        try:
+            with writer.cursor() as cur:
+                # Ends the transaction, which the API would otherwise wait for forever
+                cur.execute("SET idle_in_transaction_session_timeout = '5s'")
+                cur.execute(
+                    "UPDATE issues SET priority = 'Low' WHERE id = %s",
+                    (self.test_issue_ids[0],),
+                )
+            before = self.app.get("/issues").headers["ETag"]
+            # Call
+            updated = self.app.put(
+                f"/issues/{self.test_issue_ids[-1]}",
+                data=json.dumps({"priority": "Critical"}),
+                content_type="application/json",
+            )
+            during = self.app.get("/issues").headers["ETag"]
+            writer.commit()
+            after = self.app.get("/issues").headers["ETag"]
+        finally:
+            writer.close()
+        # Test
+        self.assertEqual(updated.status_code, 200)
+        self.assertEqual(len({before, during, after}), 3)
+
+    def test_read_cache(self):
+        """
+        Test that the read cache answers repeated reads, drops the entries changed by a
+        write, evicts the least recently used entry and counts hits and misses.
+        """
+        cache = api.read_cache
+        api.read_cache = ReadCache(size=2, ttl=60)
+        try:
+            project_url = f"/projects/{self.test_project_ids[0]}"
+            # Call
+            first = self.app.get(project_url)
+            second = self.app.get(project_url)
+            self.app.put(
+                project_url,
+                data=json.dumps({"name": "Cached Project"}),
+                content_type="application/json",
+            )
+            updated = self.app.get(project_url)
+            self.app.get("/issues")
+            self.app.get("/projects")
+            stats = self.app.get("/cache").json["message"]
+        finally:
+            api.read_cache = cache
+        # Test
+        self.assertEqual(first.json, second.json)
+        self.assertEqual(first.headers["ETag"], second.headers["ETag"])
+        self.assertEqual(updated.json["message"]["name"], "Cached Project")
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 4)
+        self.assertEqual(stats["invalidations"], 1)
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["size"], 2)
+
+    def test_read_cache_invalidation(self):
+        """
+        Test that writes invalidate the cache entries of every URL of the same id, and send
+        the invalidations to the other processes on their own connection once committed.
+        """
+        cache = api.read_cache
+        api.read_cache = ReadCache(size=10, ttl=60)
+        project_id = self.test_project_ids[0]
+        try:
+            # Call
+            self.app.get(f"/projects/0{project_id}")
+            self.app.put(
+                f"/projects/{project_id}",
+                data=json.dumps({"name": "Invalidated Project"}),
+                content_type="application/json",
+            )
+            updated = self.app.get(f"/projects/0{project_id}")
+        finally:
+            api.read_cache = cache
+        listener = psycopg2.connect(POSTGRES_URL)
+        writer = psycopg2.connect(POSTGRES_URL)
+        try:
+            listener.autocommit = True
+            with listener.cursor() as cur:
+                cur.execute('LISTEN "test_read_cache"')
+            cache = ReadCache(
+                size=2,
+                ttl=60,
+                backend=PostgresInvalidation(POSTGRES_URL, "test_read_cache"),
+            )
+            with writer.cursor() as cur:
+                cur.execute(
+                    "UPDATE projects SET name = 'Notified' WHERE id = %s", (project_id,)
+                )
+            cache.commit(writer, f"project:{project_id}")
+            select.select([listener], [], [], 5)
+            listener.poll()
+            notifies = [json.loads(notify.payload) for notify in listener.notifies]
+        finally:
+            listener.close()
+            writer.close()
+        # Test
+        self.assertEqual(updated.json["message"]["name"], "Invalidated Project")
+        self.assertEqual(
+            [notify["tags"] for notify in notifies], [[f"project:{project_id}"]]
+        )
+
+    def test_read_cache_keys(self):
+        """
+        Test that the read cache keeps one entry per Accept header, with the ETag computed
+        for it, and that a result stored before the invalidation of another process
+        arrived is dropped by it.
+        """
+
+        class RemoteInvalidation(LocalInvalidation):
+            """
+            Backend receiving the invalidations of the test as if sent by another process.
+            """
+
+            receive = None
+
+            def start(self, callback):
+                self.receive = callback
+
+        cache = api.read_cache
+        api.read_cache = ReadCache(size=10, ttl=60)
+        project_url = f"/projects/{self.test_project_ids[0]}"
+        try:
+            # Call
+            responses = [
+                self.app.get(project_url, headers={"Accept": accept})
+                for accept in ("application/json", "*/*", "application/json", "*/*")
+            ]
+            stats = self.app.get("/cache").json["message"]
+            backend = RemoteInvalidation()
+            stale = ReadCache(size=10, ttl=60, backend=backend)
+            stale.set("key", "stale", ["project:1"], stale.token())
+            backend.receive(["project:1"])
+        finally:
+            api.read_cache = cache
+        # Test
+        self.assertNotEqual(responses[0].headers["ETag"], responses[1].headers["ETag"])
+        self.assertEqual(responses[0].headers["ETag"], responses[2].headers["ETag"])
+        self.assertEqual(responses[1].headers["ETag"], responses[3].headers["ETag"])
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 2))
+        self.assertIsNone(stale.get("key"))
+
+    def test_json_serializers(self):
+        """
+        Test that every JSON encoder returns the same documents, with the keys in column
+        order.
+        """
+        provider = app.json
+        bodies = {}
+        try:
+            for serializer in ("json", "orjson"):
+                app.json = FastJSONProvider(app, serializer=serializer)
+                # Call
+                bodies[serializer] = self.app.get("/issues?limit=all").data
+        finally:
+            app.json = provider
+        # Test
+        self.assertEqual(json.loads(bodies["json"]), json.loads(bodies["orjson"]))
+        issue = json.loads(bodies["orjson"])["message"][0]
+        self.assertEqual(list(issue)[:3], ["id", "project_id", "title"])
+
+    def test_explicit_columns(self):
+        """
+        Test that the issue endpoints keep returning the same fields, through the prepared
+        statements, after a column is added to the issues table.
+        """
+        urls = [
+            f"/issues/{self.test_issue_ids[0]}",
+            f"/projects/{self.test_project_ids[0]}/issues",
+        ]
+        before = [self.app.get(url).json["message"] for url in urls]
+        conn = psycopg2.connect(POSTGRES_URL)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("ALTER TABLE issues ADD COLUMN test_column INTEGER")
+            conn.commit()
+            # Call
+            after = [self.app.get(url).json["message"] for url in urls]
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("ALTER TABLE issues DROP COLUMN IF EXISTS test_column")
+            conn.commit()
+            conn.close()
+        # Test
+        self.assertEqual(before, after)
+        self.assertEqual(list(after[0]), list(IssueRepository.columns))
+
+    def test_sparse_fieldsets(self):
+        """
+        Test that the read endpoints only return the fields asked for with `fields`.
+        """
+        # Call
+        all_issues = self.app.get("/issues?fields=title,id&sort=title&limit=2")
+        project_issues = self.app.get(
+            f"/projects/{self.test_project_ids[0]}/issues?fields=status"
+        )
+        issue = self.app.get(f"/issues/{self.test_issue_ids[0]}?fields=title")
+        projects = self.app.get("/projects?stats=1&fields=name")
+        project = self.app.get(f"/projects/{self.test_project_ids[0]}?fields=name")
+        streamed = self.app.get("/issues?stream=1&fields=id,title")
+        invalid = self.app.get("/issues?fields=title,password")
+        # Test
+        self.assertEqual(all_issues.status_code, 200)
+        self.assertEqual(list(all_issues.json["message"][0]), ["id", "title"])
+        self.assertIsNotNone(all_issues.json["next_cursor"])
+        self.assertEqual(
+            [list(row) for row in project_issues.json["message"]], [["status"]]
+        )
+        self.assertEqual(issue.json["message"], {"title": "Test Issue 1 for Project 1"})
+        for row in projects.json["message"]:
+            self.assertEqual(list(row), ["name", "stats"])
+        self.assertEqual(project.json["message"], {"name": "Test Project 1"})
+        self.assertEqual(
+            [list(row) for row in streamed.json["message"]], [["id", "title"]] * 3
+        )
+        self.assertEqual(invalid.status_code, 400)
+
+    def test_search(self):
+        """
+        Test that the search endpoint returns the matching issues ranked, paginated and
+        scoped, and that matches in the title rank first.
+        """
+        conn = psycopg2.connect(POSTGRES_URL)
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO issues (project_id, title, description, type, status)
+                VALUES (%s, 'Login page', 'Users see a crash on submit', 'Bug', 'New'),
+                       (%s, 'Crashes on login', 'The login crashed twice', 'Bug', 'Done')
+                RETURNING id
+                """,
+                (self.test_project_ids[0], self.test_project_ids[1]),
+            )
+            search_ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        conn.close()
+        # Call
+        ranked = self.app.get("/search?q=crash")
+        first_page = self.app.get("/search?q=test issue&limit=2&fields=title")
+        next_page = self.app.get(
+            f"/search?q=test issue&limit=2&after={first_page.json['next_cursor']}"
+        )
+        scoped = self.app.get(f"/search?q=crash&project_id={self.test_project_ids[0]}")
+        filtered = self.app.get("/search?q=login&status=Done")
+        phrase = self.app.get('/search?q="issue 2"')
+        # Test
+        self.assertEqual(ranked.status_code, 200)
+        self.assertEqual(
+            [issue["id"] for issue in ranked.json["message"]], search_ids[::-1]
+        )
+        self.assertGreater(
+            ranked.json["message"][0]["rank"], ranked.json["message"][1]["rank"]
+        )
+        self.assertEqual(list(first_page.json["message"][0]), ["title", "rank"])
+        self.assertEqual(len(next_page.json["message"]), 1)
+        self.assertIsNone(next_page.json["next_cursor"])
+        self.assertEqual(
+            [issue["id"] for issue in scoped.json["message"]], search_ids[:1]
+        )
+        self.assertEqual(
+            [issue["id"] for issue in filtered.json["message"]], search_ids[1:]
+        )
+        self.assertEqual(
+            [issue["title"] for issue in phrase.json["message"]],
+            ["Test Issue 2 for Project 2"],
+        )
+        self.assertEqual(self.app.get("/search").status_code, 400)
+        self.assertEqual(self.app.get("/search?q=a&project_id=x").status_code, 400)
+
+    def test_search_max_matches(self):
+        """
+        Test that searches with more matches than SEARCH_MAX_MATCHES only rank the most
+        recent ones, the same for every page, so that pages neither skip nor repeat them.
+        """
+        conn = psycopg2.connect(POSTGRES_URL)
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO issues (project_id, title, description, type, status)
+                VALUES (%s, 'Zephyrcap zephyrcap', 'Zephyrcap', 'Bug', 'New'),
+                       (%s, 'Other', 'A zephyrcap', 'Bug', 'New'),
+                       (%s, 'Other', 'Another zephyrcap', 'Bug', 'New')
+                RETURNING id
+                """,
+                [self.test_project_ids[0]] * 3,
+            )
+            match_ids = sorted(row[0] for row in cur.fetchall())
+        conn.commit()
+        conn.close()
+        max_matches = search.SEARCH_MAX_MATCHES
+        try:
+            search.SEARCH_MAX_MATCHES = 2
+            # Call
+            pages = [self.app.get("/search?q=zephyrcap&limit=1")]
+            while pages[-1].json["next_cursor"]:
+                pages.append(
+                    self.app.get(
+                        f"/search?q=zephyrcap&limit=1&after={pages[-1].json['next_cursor']}"
+                    )
+                )
+            search.SEARCH_MAX_MATCHES = 0
+            uncapped = self.app.get("/search?q=zephyrcap")
+        finally:
+            search.SEARCH_MAX_MATCHES = max_matches
+        # Test
+        paged_ids = [page.json["message"][0]["id"] for page in pages]
+        self.assertEqual(sorted(paged_ids), match_ids[1:])
+        self.assertEqual(
+            [issue["id"] for issue in uncapped.json["message"]][0], match_ids[0]
+        )
+
+    def test_change_feed(self):
+        """
+        Test that the events endpoint streams the changes of a project as they are
+        committed, resumes after the last event received and reads missed events from
+        the change_events table.
+        """
+
+        def read_events(response, count):
+            events = []
+            for chunk in response.response:
+                chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+                if chunk.startswith("id: "):
+                    lines = chunk.splitlines()
+                    events.append((lines[1][len("event: ") :], json.loads(lines[2][6:])))
+                if len(events) == count:
+                    return events
+            return events
+
+        project_id = self.test_project_ids[0]
+        # Call
+        stream = self.app.get(f"/events?project_id={project_id}", buffered=False)
+        try:
+            for target in (self.test_project_ids[1], project_id):
+                self.app.post(
+                    f"/projects/{target}/issues",
+                    data=json.dumps({"title": "Event Issue", "type": "Bug", "status": "New"}),
+                    content_type="application/json",
+                )
+            self.app.delete(f"/issues/{self.test_issue_ids[0]}")
+            live = read_events(stream, 2)
+        finally:
+            stream.close()
+        resumed = self.app.get(
+            "/events", headers={"Last-Event-ID": str(live[0][1]["id"] - 2)}, buffered=False
+        )
+        try:
+            resumed_events = read_events(resumed, 2)
+        finally:
+            resumed.close()
+        feed = ChangeFeed(POSTGRES_URL, pool, buffer_size=1)
+        backlog = feed.events(feed.position(live[0][1]["id"] - 1), project_id, 5)
+        missed = [next(backlog), next(backlog)]
+        reset = self.app.get("/events?last_event_id=1000000000000", buffered=False)
+        try:
+            reset_events = read_events(reset, 1)
+        finally:
+            reset.close()
+        # Test
+        self.assertEqual(stream.status_code, 200)
+        self.assertEqual(stream.mimetype, "text/event-stream")
+        self.assertEqual(
+            [(name, event["table_name"], event["operation"]) for name, event in live],
+            [("change", "issues", "insert"), ("change", "issues", "delete")],
+        )
+        self.assertEqual({event["project_id"] for _, event in live}, {project_id})
+        self.assertEqual(live[1][1]["row_id"], self.test_issue_ids[0])
+        # Without a project filter, the issue created in the other project comes first
+        self.assertEqual(resumed_events[0][1]["project_id"], self.test_project_ids[1])
+        self.assertEqual(resumed_events[1], live[0])
+        self.assertEqual(missed, live)
+        self.assertEqual(reset_events[0][0], "reset")
+        self.assertEqual(self.app.get("/events?project_id=x").status_code, 400)
+
+    def test_sync(self):
+        """
+        Test that the sync endpoint returns every row on a first sync, paginated by cursor,
+        then only the upserts and deletes since the revision of the previous sync.
+        """
+        # Call
+        full = self.app.get("/sync?limit=all")
+        first_page = self.app.get("/sync?limit=2")
+        next_page = self.app.get(f"/sync?limit=2&after={first_page.json['next_cursor']}")
+        self.app.put(f"/issues/{self.test_issue_ids[0]}", json={"status": "Done"})
+        self.app.delete(f"/issues/{self.test_issue_ids[1]}")
+        changes = self.app.get(f"/sync?since={full.json['revision']}")
+        self.app.delete("/reset")
+        after_reset = self.app.get(f"/sync?since={changes.json['revision']}")
+        # Test
+        self.assertEqual(full.status_code, 200)
+        upserts = [(change["table"], change["row"]["id"]) for change in full.json["message"]]
+        self.assertEqual(
+            sorted(upserts),
+            sorted(
+                [("projects", project_id) for project_id in self.test_project_ids]
+                + [("issues", issue_id) for issue_id in self.test_issue_ids]
+            ),
+        )
+        self.assertFalse(full.json["reset"])
+        self.assertEqual(
+            first_page.json["message"] + next_page.json["message"],
+            full.json["message"][:4],
+        )
+        self.assertEqual(
+            [
+                (change["operation"], change.get("id") or change["row"]["id"])
+                for change in changes.json["message"]
+            ],
+            [("upsert", self.test_issue_ids[0]), ("delete", self.test_issue_ids[1])],
+        )
+        self.assertEqual(changes.json["message"][0]["row"]["status"], "Done")
+        self.assertGreater(changes.json["revision"], full.json["revision"])
+        self.assertEqual(
+            {change["operation"] for change in after_reset.json["message"]}, {"truncate"}
+        )
+        self.assertEqual(self.app.get("/sync?since=x").status_code, 400)
+        self.assertEqual(self.app.get("/sync?after=x").status_code, 400)
+        # Recreate the data removed by the reset
+        create_test_data()
+
+    def test_sync_deleted_between_pages(self):
+        """
+        Test that a first sync followed page by page ends with the rows of the database,
+        when a row sent on its first page is deleted before the next page.
+        """
+        copy = {}
+
+        def apply(page):
+            for change in page["message"]:
+                if change["operation"] == "upsert":
+                    copy[(change["table"], change["row"]["id"])] = change["row"]
+                elif change["operation"] == "delete":
+                    copy.pop((change["table"], change["id"]), None)
+                else:
+                    for key in [key for key in copy if key[0] == change["table"]]:
+                        del copy[key]
+
+        # Call
+        page = self.app.get("/sync?limit=1").json
+        apply(page)
+        sent = page["message"][0]
+        self.app.delete(f"/{sent['table']}/{sent['row']['id']}")
+        while page["next_cursor"]:
+            page = self.app.get(f"/sync?limit=1&after={page['next_cursor']}").json
+            apply(page)
+        full = self.app.get("/sync?limit=all").json
+        # Test
+        self.assertNotIn((sent["table"], sent["row"]["id"]), copy)
+        self.assertEqual(
+            copy,
+            {
+                (change["table"], change["row"]["id"]): change["row"]
+                for change in full["message"]
+            },
+        )
+
+    def test_sync_open_transaction(self):
+        """
+        Test that the changes committed while an older transaction is open are held back
+        until it ends, so that a client never skips the changes of that transaction, and
+        that the metrics count the transactions held back.
+        """
+
+        def horizon_lag():
+            metrics = self.app.get("/metrics").text
+            for family in text_string_to_metric_families(metrics):
+                if family.name == "trackify_db_revision_horizon_lag":
+                    return family.samples[0].value
+            return None
+
+        since = self.app.get("/sync?limit=all").json["revision"]
+        writer = psycopg2.connect(POSTGRES_URL)
+        try:
+            with writer.cursor() as cur:
+                cur.execute("SET idle_in_transaction_session_timeout = '5s'")
+                cur.execute(
+                    "UPDATE issues SET priority = 'Low' WHERE id = %s",
+                    (self.test_issue_ids[0],),
+                )
+            # Call
+            self.app.put(f"/issues/{self.test_issue_ids[1]}", json={"status": "Done"})
+            held_back = self.app.get(f"/sync?since={since}")
+            lag = horizon_lag()
+            writer.commit()
+            released = self.app.get(f"/sync?since={since}")
+        finally:
+            writer.close()
+        # Test
+        self.assertEqual(held_back.json["message"], [])
+        self.assertEqual(held_back.json["revision"], since)
+        self.assertGreaterEqual(lag, 2)
+        self.assertEqual(
+            [change["row"]["id"] for change in released.json["message"]],
+            self.test_issue_ids[:2],
+        )
+
+    def test_schema_up_to_date(self):
+        """
+        Test that every migration in the migrations directory was applied to the database.
+        """
+        try:
+            check_migrations(POSTGRES_URL)
+        except MigrationError as e:
+            self.fail(str(e))
+
+    def test_migration_invalid_index(self):
+        """
+        Test that a no-transaction migration builds again an index left invalid by a failed
+        CREATE INDEX CONCURRENTLY, instead of keeping it because of IF NOT EXISTS.
+        """
+        conn = psycopg2.connect(POSTGRES_URL)
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("DROP TABLE IF EXISTS test_migration_index")
+                cur.execute("CREATE TABLE test_migration_index (value INTEGER)")
+                cur.execute("INSERT INTO test_migration_index VALUES (1), (1)")
+                try:
+                    cur.execute(
+                        "CREATE UNIQUE INDEX CONCURRENTLY test_migration_index_idx "
+                        "ON test_migration_index (value)"
+                    )
+                except psycopg2.IntegrityError:
+                    pass
+                cur.execute("DELETE FROM test_migration_index")
+            conn.autocommit = False
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "0001_index.sql")
+                with open(path, "w", encoding="utf-8") as file:
+                    file.write(
+                        "-- migrate: no-transaction\n"
+                        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS "
+                        "test_migration_index_idx ON test_migration_index (value);\n"
+                    )
+                # Call
+                run_sql_migration(conn, path)
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT indisvalid FROM pg_index "
+                    "WHERE indexrelid = 'test_migration_index_idx'::regclass"
+                )
+                valid = cur.fetchone()[0]
+                cur.execute("DROP TABLE test_migration_index")
+            conn.commit()
+        finally:
+            conn.close()
+        # Test
+        self.assertTrue(valid)
+
+    def test_pool_stats(self):
+        """
+        Test that the pool endpoint returns a 200 status code and a JSON response
+        with the usage statistics of the connection pool, and that the handlers
+        returned every connection they borrowed.
+        """
+        # Call
+        self.app.get("/projects")
+        response = self.app.get("/pool")
+        # Test
+        self.assertEqual(response.status_code, 200)
+        stats = response.json["message"]
+        self.assertEqual(stats["in_use"], 0)
+        self.assertGreaterEqual(stats["idle"], 1)
+        self.assertLessEqual(stats["size"], stats["max"])
+        self.assertGreaterEqual(stats["checkouts"], 1)
+
+    def test_pool_max_size(self):
+        """
+        Test that threads checking out connections concurrently never make the pool
+        open more connections than its maximum size.
+        """
+
+        class SlowPool(ConnectionPool):
+            """
+            Pool pausing after each new connection, for the other threads to check out.
+            """
+
+            def _connect(self, *args, **kwargs):
+                conn = super()._connect(*args, **kwargs)
+                time.sleep(0.05)
+                return conn
+
+        test_pool = SlowPool(POSTGRES_URL, 0, 2)
+
+        def checkouts():
+            for _ in range(20):
+                with test_pool.connection():
+                    pass
+
+        # Call
+        threads = [threading.Thread(target=checkouts) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = test_pool.stats()
+        test_pool.closeall()
+        # Test
+        self.assertEqual(stats["in_use"], 0)
+        self.assertLessEqual(stats["connections_opened"], 2)
+
+    def test_metrics(self):
+        """
+        Test that the metrics endpoint counts the requests by route and status, with their
+        latency, response size and database time, streamed responses included.
+        """
+
+        def samples():
+            response = self.app.get("/metrics")
+            self.assertEqual(response.status_code, 200)
+            values = {}
+            for family in text_string_to_metric_families(response.text):
+                for sample in family.samples:
+                    labels = (sample.labels.get("route"), sample.labels.get("status"))
+                    values[(sample.name,) + labels] = sample.value
+            return values
+
+        route = "/projects/<int:project_id>"
+        before = samples()
+        # Call
+        for project_id in self.test_project_ids:
+            self.app.get(f"/projects/{project_id}").close()
+        self.app.get("/projects/0").close()
+        streamed = self.app.get("/issues?stream=1")
+        self.assertTrue(streamed.is_streamed)
+        streamed_size = len(streamed.data)
+        streamed.close()
+        after = samples()
+
+        # Test
+        def delta(name, route, status=None):
+            key = (name, route, status)
+            return after.get(key, 0) - before.get(key, 0)
+
+        requests = len(self.test_project_ids)
+        self.assertEqual(
+            delta("trackify_http_requests_total", route, "200"), requests
+        )
+        self.assertEqual(delta("trackify_http_requests_total", route, "404"), 1)
+        self.assertEqual(
+            delta("trackify_http_request_duration_seconds_count", route), requests + 1
+        )
+        self.assertGreater(delta("trackify_http_request_duration_seconds_sum", route), 0)
+        self.assertGreater(delta("trackify_db_query_duration_seconds_sum", route), 0)
+        self.assertGreaterEqual(delta("trackify_db_queries_total", route), requests)
+        self.assertGreater(delta("trackify_http_response_size_bytes_sum", route), 0)
+        self.assertEqual(
+            delta("trackify_http_response_size_bytes_sum", "/issues"), streamed_size
+        )
+        self.assertEqual(delta("trackify_http_requests_in_progress", route), 0)
+
+    def test_slow_statements(self):
+        """
+        Test that responses have a Server-Timing header, and that slow statements are
+        logged with their request, redacted parameters and plan.
+        """
+        slow_query_seconds = timing.SLOW_QUERY_SECONDS
+        slow_query_explain = timing.SLOW_QUERY_EXPLAIN
+        try:
+            timing.SLOW_QUERY_SECONDS = 0
+            timing.SLOW_QUERY_EXPLAIN = True
+            # Call
+            with self.assertLogs("trackify.queries", level="WARNING") as logs:
+                response = self.app.get("/issues?label=secret-label")
+        finally:
+            timing.SLOW_QUERY_SECONDS = slow_query_seconds
+            timing.SLOW_QUERY_EXPLAIN = slow_query_explain
+        # Test
+        self.assertEqual(response.status_code, 200)
+        durations = dict(
+            metric.strip().split(";dur=")
+            for metric in response.headers["Server-Timing"].split(",")
+        )
+        self.assertEqual(list(durations), ["db", "serialize", "total"])
+        self.assertGreater(float(durations["db"]), 0)
+        self.assertGreaterEqual(
+            float(durations["total"]),
+            float(durations["db"]) + float(durations["serialize"]),
+        )
+        issues_log = [line for line in logs.output if "FROM issues" in line]
+        self.assertTrue(issues_log)
+        self.assertIn("in GET /issues:", issues_log[0])
+        self.assertIn("Execution Time", issues_log[0])
+        self.assertNotIn("secret-label", "".join(logs.output))
+
+    def test_profiling(self):
+        """
+        Test that requests with the profiling token are profiled to a collapsed stack file
+        named after their request id and a unique suffix, so that a repeated request id
+        does not overwrite a profile, and that requests without it are not.
+        """
+        settings = (
+            profiling.PROFILE_TOKEN,
+            profiling.PROFILE_DIR,
+            profiling.PROFILE_INTERVAL,
+        )
+        with tempfile.TemporaryDirectory() as profile_dir:
+            try:
+                profiling.PROFILE_TOKEN = "test-token"
+                profiling.PROFILE_DIR = profile_dir
+                profiling.PROFILE_INTERVAL = 0.0001
+                # Call
+                response, response_repeated = [
+                    self.app.get(
+                        "/issues?limit=all",
+                        headers={
+                            "X-Profile": "test-token",
+                            "X-Request-ID": "test-request",
+                        },
+                    )
+                    for _ in range(2)
+                ]
+                response_wrong_token = self.app.get(
+                    "/issues", headers={"X-Profile": "wrong-token"}
+                )
+            finally:
+                (
+                    profiling.PROFILE_TOKEN,
+                    profiling.PROFILE_DIR,
+                    profiling.PROFILE_INTERVAL,
+                ) = settings
+            # Test
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers["X-Request-ID"], "test-request")
+            self.assertNotIn("X-Request-ID", response_wrong_token.headers)
+            profile_id = response.headers["X-Profile-ID"]
+            self.assertTrue(profile_id.startswith("test-request-"))
+            self.assertNotEqual(profile_id, response_repeated.headers["X-Profile-ID"])
+            self.assertEqual(
+                sorted(os.listdir(profile_dir)),
+                sorted(
+                    f"{r.headers['X-Profile-ID']}.folded"
+                    for r in (response, response_repeated)
+                ),
+            )
+            with open(
+                os.path.join(profile_dir, f"{profile_id}.folded"), encoding="utf-8"
+            ) as file:
+                lines = file.read().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+            self.assertTrue(stack)
+        self.assertTrue(any("get_all_issues (api.py:" in line for line in lines))
+
     # # Invalid data tests
+    def test_invalid_pagination(self):
+        """
+        Test that the list endpoints return a 400 status code and an error
+        message when given an invalid limit or cursor.
+        """
+        response_limit = self.app.get("/projects?limit=0")
+        response_cursor = self.app.get("/issues?after=not-a-cursor")
+        self.assertEqual(response_limit.status_code, 400)
+        self.assertEqual(response_cursor.status_code, 400)
+
     def test_invalid_project_id(self):
         """
         Test that the get project endpoint returns a 404 status code and an error
@@ -0,0 +1,331 @@
+"""
+timing.py
+
+Contains the timing of the requests of the API: where their time goes, and which database
+statements are slow.
+
+Every request gets a `RequestTimings` (see `time_requests`), which adds up:
+- db: time spent in database statements, timed by `InstrumentedCursor` on the psycopg2
+  connections
+- serialize: time spent turning rows into dicts and encoding JSON, see serialize.py
+- pool: time spent waiting for pooled connections, see db.py
+The timings follow the request through a context variable, which also follows the async
+handlers to the thread they run on.
+
+Every response gets a Server-Timing header with the db, serialize and total time of the
+request in milliseconds, which browsers show in their developer tools:
+
+    Server-Timing: db;dur=41.2, serialize;dur=12.8, total;dur=58.0
+
+Streamed responses are timed up to their first byte.
+
+Statements slower than SLOW_QUERY_SECONDS (default 0.5, 0 for every statement, off to
+disable) are logged to the trackify.queries logger with their request, duration and row
+count. The statement is logged with its placeholders, and its parameters are redacted to
+their type, except numbers. With SLOW_QUERY_EXPLAIN=1 slow SELECT statements are run again
+with EXPLAIN (ANALYZE, BUFFERS) and their plan is logged too, with its string literals
+redacted. This runs the statement a
+second time, so it is meant for investigations rather than to be left on.
+"""
+
+import os
+import re
+import time
+import logging
+import contextvars
+from flask import request
+import psycopg2
+import psycopg2.extensions
+from dbtypes import configure_connection
+
+SLOW_QUERY_SECONDS = os.environ.get("SLOW_QUERY_SECONDS", "0.5")
+SLOW_QUERY_SECONDS = None if SLOW_QUERY_SECONDS == "off" else float(SLOW_QUERY_SECONDS)
+SLOW_QUERY_EXPLAIN = os.environ.get("SLOW_QUERY_EXPLAIN", "0") == "1"
+# Longer statements are cut in the log
+SLOW_QUERY_MAX_LENGTH = 2000
+# Label of the requests that matched no route
+UNMATCHED_ROUTE = "<unmatched>"
+
+logger = logging.getLogger("trackify.queries")
+
+
+class RequestTimings:  # pylint: disable=too-few-public-methods
+    """
+    Measures of the request being served.
+    """
+
+    __slots__ = (
+        "labels",
+        "start",
+        "db_time",
+        "db_queries",
+        "pool_wait",
+        "serialize_time",
+        "size",
+    )
+
+    def __init__(self, labels):
+        """
+        :param labels: (method, route) of the request
+        """
+        self.labels = labels
+        self.start = time.perf_counter()
+        self.db_time = 0.0
+        self.db_queries = 0
+        self.pool_wait = 0.0
+        self.serialize_time = 0.0
+        # Bytes of the response body, see metrics.py
+        self.size = 0
+
+
+# Timings of the request being served, None outside of requests
+_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def current_timings():
+    """
+    Returns the timings of the request being served, or None outside of requests.
+    """
+    return _timings.get()
+
+
+def record_pool_wait(seconds):
+    """
+    Adds the time spent waiting for a pooled connection to the request being served, if any.
+
+    :param seconds: Wait of the checkout
+    """
+    timings = _timings.get()
+    if timings is not None:
+        timings.pool_wait += seconds
+
+
+def record_serialize(seconds):
+    """
+    Adds serialization time to the request being served, if any.
+
+    :param seconds: Time spent building or encoding the response
+    """
+    timings = _timings.get()
+    if timings is not None:
+        timings.serialize_time += seconds
+
+
+def redact(params):
+    """
+    Returns the parameters of a statement as they can be logged: numbers, booleans and nulls
+    as they are, the other values as their type.
+
+    :param params: Sequence or dict of parameters, or None
+    :return: Text of the parameters
+    """
+    if params is None:
+        return "none"
+
+    def value(param):
+        if param is None or isinstance(param, (bool, int, float)):
+            return repr(param)
+        return f"<{type(param).__name__}>"
+
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {value(v)}" for k, v in params.items()) + "}"
+    return "[" + ", ".join(value(param) for param in params) + "]"
+
+
+def redact_literals(text):
+    """
+    Replaces the string literals of an SQL text, e.g. a plan showing the parameters of its
+    statement, by '?'.
+    """
+    return re.sub(r"'(?:[^']|'')*'", "'?'", text)
+
+
+def statement_text(query):
+    """
+    Returns the text of a statement as it can be logged, on a single line.
+
+    :param query: Statement with placeholders, or bytes of a statement with its values
+                  inlined (e.g. by psycopg2.extras.execute_values), whose literals are
+                  redacted
+    :return: Text of the statement
+    """
+    if isinstance(query, bytes):
+        query = redact_literals(query.decode(errors="replace"))
+    text = " ".join(query.split())
+    if len(text) > SLOW_QUERY_MAX_LENGTH:
+        text = text[:SLOW_QUERY_MAX_LENGTH] + "..."
+    return text
+
+
+def is_slow(seconds):
+    """
+    Returns whether a statement that took some time must be logged.
+    """
+    return SLOW_QUERY_SECONDS is not None and seconds >= SLOW_QUERY_SECONDS
+
+
+def explain_query(query):
+    """
+    Returns the EXPLAIN (ANALYZE, BUFFERS) of a slow statement, if SLOW_QUERY_EXPLAIN is
+    set and the statement only reads.
+
+    :param query: Statement with placeholders
+    :return: Statement to run with the same parameters, or None
+    """
+    if not SLOW_QUERY_EXPLAIN or not isinstance(query, str):
+        return None
+    # EXPLAIN ANALYZE runs the statement, so writes must not be explained
+    if not re.match(r"\s*SELECT\b", query, re.IGNORECASE):
+        return None
+    return f"EXPLAIN (ANALYZE, BUFFERS) {query}"
+
+
+def record_statement(query, params, seconds, rowcount, plan=None):
+    """
+    Adds the time of a database statement to the request being served, and logs it if it
+    was slow.
+
+    :param query: Statement, see `statement_text`
+    :param params: Parameters of the statement
+    :param seconds: Duration of the statement
+    :param rowcount: Rows returned or changed, -1 if unknown
+    :param plan: Lines of the EXPLAIN of the statement, if captured
+    """
+    timings = _timings.get()
+    if timings is not None:
+        timings.db_time += seconds
+        timings.db_queries += 1
+    if not is_slow(seconds):
+        return
+    where = " ".join(timings.labels) if timings is not None else "outside of a request"
+    message = (
+        f"Slow statement ({seconds * 1000:.1f} ms, {rowcount} rows) in {where}: "
+        f"{statement_text(query)} -- params: {redact(params)}"
+    )
+    if plan:
+        message += "\n" + redact_literals("\n".join(plan))
+    logger.warning(message)
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """
+    psycopg2 cursor timing its statements, see the module docstring.
+    """
+
+    def execute(self, query, vars=None):  # pylint: disable=redefined-builtin
+        """
+        Runs a statement, see psycopg2.
+        """
+        start = time.perf_counter()
+        try:
+            result = super().execute(query, vars)
+        except psycopg2.Error:
+            record_statement(query, vars, time.perf_counter() - start, -1)
+            raise
+        seconds = time.perf_counter() - start
+        plan = None
+        if is_slow(seconds) and self.name is None:
+            plan = self._explain(query, vars)
+        record_statement(query, vars, seconds, self.rowcount, plan)
+        return result
+
+    def executemany(self, query, vars_list):
+        """
+        Runs a statement once for every set of parameters, see psycopg2.
+        """
+        start = time.perf_counter()
+        try:
+            result = super().executemany(query, vars_list)
+        except psycopg2.Error:
+            record_statement(query, None, time.perf_counter() - start, -1)
+            raise
+        record_statement(query, None, time.perf_counter() - start, self.rowcount)
+        return result
+
+    def fetchmany(self, size=None):
+        """
+        Returns the next rows, see psycopg2.
+        """
+        if self.name is None:
+            return super().fetchmany(size)
+        # Named cursors fetch their rows from the server
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        timings = _timings.get()
+        if timings is not None:
+            timings.db_time += time.perf_counter() - start
+        return rows
+
+    def _explain(self, query, params):
+        """
+        Runs the EXPLAIN of a slow statement, see `explain_query`.
+
+        :return: Lines of the plan, or None
+        """
+        explain = explain_query(query)
+        if explain is None:
+            return None
+        conn = self.connection
+        # Inside a transaction, a failed EXPLAIN must not abort it
+        savepoint = not conn.autocommit
+        with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+            try:
+                if savepoint:
+                    cur.execute("SAVEPOINT explain_slow_statement")
+                cur.execute(explain, params)
+                plan = [row[0] for row in cur.fetchall()]
+                if savepoint:
+                    cur.execute("RELEASE SAVEPOINT explain_slow_statement")
+                return plan
+            except psycopg2.Error as e:
+                if savepoint:
+                    cur.execute("ROLLBACK TO SAVEPOINT explain_slow_statement")
+                return [f"EXPLAIN failed: {e}"]
+
+
+def configure_instrumented_connection(conn):
+    """
+    Sets up a new psycopg2 connection like dbtypes.configure_connection, with instrumented
+    cursors.
+
+    :param conn: Open psycopg2 connection
+    """
+    configure_connection(conn)
+    conn.cursor_factory = InstrumentedCursor
+
+
+def _start_request():
+    """
+    Starts timing a request. Registered with `app.before_request`.
+    """
+    route = request.url_rule.rule if request.url_rule else UNMATCHED_ROUTE
+    _timings.set(RequestTimings((request.method, route)))
+
+
+def _add_server_timing(response):
+    """
+    Adds the Server-Timing header to a response. Registered with `app.after_request`.
+
+    :param response: Response of the handler
+    :return: The same response
+    """
+    timings = _timings.get()
+    if timings is not None:
+        total = time.perf_counter() - timings.start
+        response.headers["Server-Timing"] = (
+            f"db;dur={timings.db_time * 1000:.1f}, "
+            f"serialize;dur={timings.serialize_time * 1000:.1f}, "
+            f"total;dur={total * 1000:.1f}"
+        )
+    return response
+
+
+def time_requests(app):
+    """
+    Times every request of a flask app, see the module docstring. Must be called before
+    metrics.measure_requests, which reads the timings.
+
+    :param app: Flask application
+    """
+    app.before_request(_start_request)
+    app.after_request(_add_server_timing)
@@ -5,7 +5,7 @@
 import { Injectable } from '@angular/core';
 import { HttpClient } from '@angular/common/http';
 import { Observable } from 'rxjs/internal/Observable';
-import { map } from 'rxjs';
+import { EMPTY, defer, expand, map, reduce } from 'rxjs';
 import { IS_CONTAINERIZED } from './is_containerized';
 
 
@@ -61,9 +61,49 @@ export interface Issue {
     labels?: Array<string>;
 }
 
+// Filters and sorting of the issue lists, applied by the API when running in a container
+export interface IssueFilters {
+    status?: Array<ItemStatus>;
+    priority?: Array<ItemPriority>;
+    type?: Array<ItemType>;
+    label?: string;
+    date_due_from?: string;
+    date_due_to?: string;
+    date_created_from?: string;
+    date_created_to?: string;
+    sort?: keyof Issue;
+    order?: 'asc' | 'desc';
+}
+
 interface JsonResponse {
     // eslint-disable-next-line @typescript-eslint/no-explicit-any
     message: any;
+    // Cursor of the next page on paginated endpoints, null on the last page
+    next_cursor?: string | null;
+}
+
+// Change of the delta sync, see sync.py in the API
+interface SyncChange {
+    table: 'projects' | 'issues';
+    operation: 'upsert' | 'delete' | 'truncate';
+    revision: number;
+    id?: number;
+    row?: Project | Issue;
+}
+
+interface SyncResponse extends JsonResponse {
+    message: SyncChange[];
+    // Revision to sync from next time
+    revision: number;
+    // Whether the copy must be dropped, the changes since the last sync are no longer known
+    reset: boolean;
+}
+
+// Copy of the projects and issues kept up to date by the delta sync, by id
+interface SyncedTables {
+    projects: Map<string, Project>;
+    issues: Map<string, Issue>;
+    revision: number | null;
 }
 
 @Injectable({
@@ -102,10 +142,8 @@ export class ApiService {
 
     getAllProjects(): Observable<Project[]> {
         if (IS_CONTAINERIZED) {
-            // If we are running in a container, get data from the API
-            return this.http.get<JsonResponse>(`${this.apiUrl}/projects`).pipe(
-                map((response: JsonResponse) => response.message)
-            );
+            // If we are running in a container, get the changes since the last sync from the API
+            return this.sync().pipe(map(tables => this.sortById([...tables.projects.values()])));
         }
         // If we are not running in a container, get data from local storage
         return new Observable<Project[]>(observer => {
@@ -199,16 +237,20 @@ export class ApiService {
         });
     }
 
-    getAllIssuesOfProject(project_id: string): Observable<Issue[]> {
+    getAllIssuesOfProject(project_id: string, filters: IssueFilters = {}): Observable<Issue[]> {
         if (IS_CONTAINERIZED) {
-            // If we are running in a container, get data from the API
-            return this.http.get<JsonResponse>(`${this.apiUrl}/projects/${project_id}/issues`).pipe(
-                map((response: JsonResponse) => response.message)
-            );
+            if (this.hasFilters(filters)) {
+                // If we are running in a container, get data from the API, which does the filtering
+                return this.getAllPages<Issue>(`${this.apiUrl}/projects/${project_id}/issues`, filters);
+            }
+            // Without filters, get the changes since the last sync from the API
+            return this.sync().pipe(map(tables => this.sortById(
+                [...tables.issues.values()].filter(issue => String(issue.project_id) === String(project_id))
+            )));
         }
         // If we are not running in a container, get data from local storage
         const items: Issue[] = this.getLocalStorageIssues();
-        const issues = items.filter(issue => issue.project_id === project_id);
+        const issues = items.filter(issue => issue.project_id === project_id && this.matchesFilters(issue, filters));
         if (issues) {
             return new Observable<Issue[]>(observer => {
                 observer.next(issues);
@@ -312,20 +354,117 @@ export class ApiService {
         });
     }
 
-    getAllIssues(): Observable<Issue[]> {
+    getAllIssues(filters: IssueFilters = {}): Observable<Issue[]> {
         if (IS_CONTAINERIZED) {
-            // If we are running in a container, get data from the API
-            return this.http.get<JsonResponse>(`${this.apiUrl}/issues`).pipe(
-                map((response: JsonResponse) => response.message)
-            );
+            if (this.hasFilters(filters)) {
+                // If we are running in a container, get data from the API, which does the filtering
+                return this.getAllPages<Issue>(`${this.apiUrl}/issues`, filters);
+            }
+            // Without filters, get the changes since the last sync from the API
+            return this.sync().pipe(map(tables => this.sortById([...tables.issues.values()])));
         }
         // If we are not running in a container, get data from local storage
         return new Observable<Issue[]>(observer => {
-            observer.next(this.getLocalStorageIssues());
+            observer.next(this.getLocalStorageIssues().filter(issue => this.matchesFilters(issue, filters)));
             observer.complete();
         });
     }
 
+    // Gets every page of a paginated endpoint by following the next cursor until the last page
+    private getAllPages<T>(url: string, filters: IssueFilters = {}): Observable<T[]> {
+        const params: { [param: string]: string } = {};
+        for (const [name, value] of Object.entries(filters)) {
+            if (value !== undefined && value !== '') {
+                params[name] = Array.isArray(value) ? value.join(',') : String(value);
+            }
+        }
+        const getPage = (after?: string | null) => this.http.get<JsonResponse>(url, {
+            params: after ? { ...params, after } : params
+        });
+        return getPage().pipe(
+            expand((response: JsonResponse) => response.next_cursor ? getPage(response.next_cursor) : EMPTY),
+            reduce((items: T[], response: JsonResponse) => items.concat(response.message), [] as T[])
+        );
+    }
+
+    // Brings the copy of the projects and issues in local storage up to date, by getting every page of the
+    // changes since its revision from the API and applying them in order
+    private sync(): Observable<SyncedTables> {
+        return defer(() => {
+            const tables = this.getSyncedTables();
+            const since = tables.revision === null ? {} : { since: String(tables.revision) };
+            const getPage = (after?: string | null) => this.http.get<SyncResponse>(`${this.apiUrl}/sync`, {
+                params: after ? { ...since, after } : since
+            });
+            return getPage().pipe(
+                expand((response: SyncResponse) => response.next_cursor ? getPage(response.next_cursor) : EMPTY),
+                reduce((synced: SyncedTables, response: SyncResponse) => this.applyChanges(synced, response), tables),
+                map((synced: SyncedTables) => {
+                    this.setSyncedTables(synced);
+                    return synced;
+                })
+            );
+        });
+    }
+
+    private applyChanges(tables: SyncedTables, response: SyncResponse): SyncedTables {
+        if (response.reset) {
+            tables.projects.clear();
+            tables.issues.clear();
+        }
+        for (const change of response.message) {
+            const table: Map<string, Project | Issue> = tables[change.table];
+            if (change.operation === 'upsert' && change.row) {
+                table.set(String(change.row.id), change.row);
+            } else if (change.operation === 'delete') {
+                table.delete(String(change.id));
+            } else if (change.operation === 'truncate') {
+                table.clear();
+            }
+        }
+        tables.revision = response.revision;
+        return tables;
+    }
+
+    private getSyncedTables(): SyncedTables {
+        const revision = localStorage.getItem('sync_revision');
+        const load = <T extends Project | Issue>(key: string) => new Map<string, T>(
+            (JSON.parse(localStorage.getItem(key) ?? '[]') as T[]).map(item => [String(item.id), item])
+        );
+        return {
+            projects: load<Project>('sync_projects'),
+            issues: load<Issue>('sync_issues'),
+            revision: revision === null ? null : Number(revision)
+        };
+    }
+
+    private setSyncedTables(tables: SyncedTables): void {
+        try {
+            localStorage.setItem('sync_projects', JSON.stringify([...tables.projects.values()]));
+            localStorage.setItem('sync_issues', JSON.stringify([...tables.issues.values()]));
+            localStorage.setItem('sync_revision', String(tables.revision));
+        } catch {
+            // The copy does not fit in local storage, sync everything again next time
+            ['sync_projects', 'sync_issues', 'sync_revision'].forEach(key => localStorage.removeItem(key));
+        }
+    }
+
+    private hasFilters(filters: IssueFilters): boolean {
+        return Object.values(filters).some(value => value !== undefined && value !== '' && !(Array.isArray(value) && !value.length));
+    }
+
+    private sortById<T extends Project | Issue>(items: T[]): T[] {
+        return items.sort((a, b) => Number(a.id) - Number(b.id));
+    }
+
+    // Local storage counterpart of the status, priority, type and label filters of the API
+    private matchesFilters(issue: Issue, filters: IssueFilters): boolean {
+        return (!filters.status?.length || filters.status.includes(issue.status))
+            && (!filters.priority?.length || (!!issue.priority && filters.priority.includes(issue.priority)))
+            && (!filters.type?.length || filters.type.includes(issue.type))
+            && (!filters.label || (issue.labels ?? []).includes(filters.label));
+    }
+
     private getLocalStorageProjects(): Project[] {
         return localStorage.getItem('projects') ? JSON.parse(localStorage.getItem('projects') as string) : [];
     }
@@ -1,4 +1,5 @@
 -- init.sql
+-- Baseline schema, later changes are versioned migrations in api/migrations
 CREATE TABLE IF NOT EXISTS projects (
   id SERIAL PRIMARY KEY,
   name VARCHAR(255) NOT NULL,